@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import CalendarSession, CalendarMessage, CalendarEvent, CalendarIntegration, EventTemplate
+from .models import (
+    Booking, BookingLink, BookingSlotCache, CalendarAttendeeTime, CalendarDailyLoad, CalendarHourlyLoad,
+    CalendarSession, CalendarMessage, CalendarEvent, CalendarIntegration, CalendarSyncState, EventTemplate,
+)
 
 
 @admin.register(CalendarSession)
@@ -29,7 +32,7 @@ class CalendarEventAdmin(admin.ModelAdmin):
     list_display = ('title', 'user', 'start_datetime', 'end_datetime', 'status', 'created_at')
     list_filter = ('status', 'all_day', 'recurrence_rule', 'created_at')
     search_fields = ('title', 'description', 'location', 'user__username')
-    readonly_fields = ('google_event_id', 'created_at', 'updated_at')
+    readonly_fields = ('google_event_id', 'etag', 'google_updated_at', 'created_at', 'updated_at')
     ordering = ('-start_datetime',)
     
     fieldsets = (
@@ -40,7 +43,7 @@ class CalendarEventAdmin(admin.ModelAdmin):
             'fields': ('start_datetime', 'end_datetime', 'timezone', 'all_day', 'recurrence_rule')
         }),
         ('Status & Integration', {
-            'fields': ('status', 'google_event_id')
+            'fields': ('status', 'transparency', 'calendar_id', 'google_event_id', 'etag', 'google_updated_at')
         }),
         ('Attendees & Reminders', {
             'fields': ('attendees', 'reminders'),
@@ -86,6 +89,62 @@ class CalendarIntegrationAdmin(admin.ModelAdmin):
     token_status.short_description = 'Token Status'
 
 
+@admin.register(CalendarSyncState)
+class CalendarSyncStateAdmin(admin.ModelAdmin):
+    list_display = ('user', 'calendar_id', 'is_primary', 'time_zone', 'last_synced_at', 'last_full_sync_at')
+    list_filter = ('is_primary',)
+    search_fields = ('user__username', 'calendar_id', 'summary')
+    readonly_fields = ('sync_token', 'last_synced_at', 'last_full_sync_at', 'created_at', 'updated_at')
+    ordering = ('user', 'calendar_id')
+
+
+@admin.register(BookingLink)
+class BookingLinkAdmin(admin.ModelAdmin):
+    list_display = ('title', 'slug', 'user', 'duration_minutes', 'days_ahead', 'is_active', 'created_at')
+    list_filter = ('is_active', 'duration_minutes')
+    search_fields = ('title', 'slug', 'user__username')
+    readonly_fields = ('created_at', 'updated_at')
+    ordering = ('-created_at',)
+
+
+@admin.register(BookingSlotCache)
+class BookingSlotCacheAdmin(admin.ModelAdmin):
+    list_display = ('link', 'time_zone', 'is_stale', 'computed_at')
+    list_filter = ('is_stale',)
+    search_fields = ('link__slug', 'link__user__username')
+    readonly_fields = ('slots', 'computed_at')
+
+
+@admin.register(Booking)
+class BookingAdmin(admin.ModelAdmin):
+    list_display = ('name', 'email', 'link', 'start_datetime', 'status', 'created_at')
+    list_filter = ('status', 'start_datetime')
+    search_fields = ('name', 'email', 'link__slug', 'user__username')
+    readonly_fields = ('google_event_id', 'error', 'created_at', 'updated_at')
+    ordering = ('-start_datetime',)
+
+
+@admin.register(CalendarDailyLoad)
+class CalendarDailyLoadAdmin(admin.ModelAdmin):
+    list_display = ('user', 'date', 'meeting_count', 'busy_minutes')
+    search_fields = ('user__username',)
+    ordering = ('user', '-date')
+
+
+@admin.register(CalendarHourlyLoad)
+class CalendarHourlyLoadAdmin(admin.ModelAdmin):
+    list_display = ('user', 'date', 'hour', 'busy_minutes')
+    search_fields = ('user__username',)
+    ordering = ('user', '-date', 'hour')
+
+
+@admin.register(CalendarAttendeeTime)
+class CalendarAttendeeTimeAdmin(admin.ModelAdmin):
+    list_display = ('user', 'email', 'name', 'month', 'meeting_count', 'minutes')
+    search_fields = ('user__username', 'email', 'name')
+    ordering = ('user', '-month', '-minutes')
+
+
 @admin.register(EventTemplate)
 class EventTemplateAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'default_duration_minutes', 'usage_count', 'created_at')
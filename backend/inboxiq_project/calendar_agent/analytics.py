@@ -0,0 +1,273 @@
+# backend/inboxiq_project/calendar_agent/analytics.py
+"""
+Calendar analytics maintained incrementally.
+
+CalendarDailyLoad, CalendarHourlyLoad and CalendarAttendeeTime hold per-user aggregates in
+the user's primary time zone. Calendar sync feeds every row it creates, changes or deletes
+through an AnalyticsDelta (old state subtracted, new state added) and writes the net change
+in one pass per table, so dashboards read a handful of precomputed rows instead of
+re-scanning events.
+
+Counted events are timed, busy (opaque) and not draft/cancelled. A recurring series counts
+each occurrence from its first start through its end, or its first year if it has none;
+a modified or cancelled instance replaces the occurrence it overrides.
+Events imported from .ics files are fed through the same deltas when they are inserted.
+rebuild_analytics() recomputes a user's tables from the mirror should they ever drift.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+
+from .models import CalendarAttendeeTime, CalendarDailyLoad, CalendarEvent, CalendarHourlyLoad
+from .recurrence import expand, local_duration
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover - Python < 3.9
+    from backports.zoneinfo import ZoneInfo
+
+# How far an open-ended series is counted
+OPEN_SERIES_HORIZON = timedelta(days=365)
+
+# Only these fields are needed to compute an event's contribution
+ANALYTICS_FIELDS = ['start_datetime', 'end_datetime', 'timezone', 'all_day', 'status', 'transparency',
+                    'attendees', 'is_recurring', 'recurrence', 'recurrence_ends_at', 'google_event_id',
+                    'recurring_event_id', 'original_start_datetime', 'calendar_id', 'ical_uid']
+
+
+def _is_counted(event: CalendarEvent) -> bool:
+    return not event.all_day and event.transparency == 'opaque' and event.status not in ('draft', 'cancelled')
+
+
+def _hour_pieces(start: datetime, end: datetime, tz: ZoneInfo) -> Iterator[Tuple[date, int, int]]:
+    """Split [start, end) at local hour boundaries: (date, hour, minutes)"""
+    cursor = start.astimezone(tz)
+    end = end.astimezone(tz)
+    while cursor < end:
+        boundary = (cursor.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).astimezone(tz)
+        piece_end = min(boundary, end)
+        minutes = round((piece_end - cursor).total_seconds() / 60)
+        if minutes:
+            yield cursor.date(), cursor.hour, minutes
+        cursor = piece_end
+
+
+class AnalyticsDelta:
+    """Net change to one user's analytics tables from a batch of event changes"""
+
+    def __init__(self, user, time_zone: str = 'UTC', masters: Optional[Dict] = None):
+        self.user = user
+        self.tz = ZoneInfo(time_zone or 'UTC')
+        # (calendar_id, series ID) -> series master, for instances that override an occurrence
+        self.masters = masters if masters is not None else {}
+        self._own_emails = {(user.email or '').lower()}
+        self.daily = defaultdict(lambda: [0, 0])  # date -> [meetings, minutes]
+        self.hourly = defaultdict(int)  # (date, hour) -> minutes
+        self.attendees = defaultdict(lambda: [0, 0, ''])  # (email, month) -> [meetings, minutes, name]
+
+    def add(self, event: CalendarEvent, sign: int = 1) -> None:
+        for start, end, weight, attendees, minutes in self._occurrences(event):
+            self._record(start, end, weight * sign, attendees, minutes)
+
+    def remove(self, event: CalendarEvent) -> None:
+        self.add(event, -1)
+
+    def _occurrences(self, event: CalendarEvent):
+        """(start, end, +1/-1, attendees, minutes or None) for every occurrence this row adds or suppresses"""
+        if event.is_recurring:
+            if not _is_counted(event):
+                return
+            duration = local_duration(event.start_datetime, event.end_datetime, event.timezone)
+            until = event.recurrence_ends_at or event.start_datetime + OPEN_SERIES_HORIZON
+            for start, end in expand(event.recurrence, event.start_datetime, duration,
+                                     event.start_datetime, until, event.timezone):
+                yield start, end, 1, event.attendees, None
+            return
+
+        if event.recurring_event_id:
+            # An exception row takes the place of the master's occurrence at its original start
+            master = self.masters.get((event.calendar_id, event.recurring_event_id))
+            if master is not None and _is_counted(master) and event.original_start_datetime:
+                duration = local_duration(master.start_datetime, master.end_datetime, master.timezone)
+                yield (event.original_start_datetime, event.original_start_datetime + duration, -1,
+                       master.attendees, None)
+
+        if _is_counted(event):
+            yield event.start_datetime, event.end_datetime, 1, event.attendees, event.duration_minutes()
+
+    def _record(self, start: datetime, end: datetime, weight: int, attendees: List[Dict],
+                minutes: Optional[int] = None) -> None:
+        local_start = start.astimezone(self.tz)
+        if minutes is None:
+            minutes = round((end - start).total_seconds() / 60)
+        self.daily[local_start.date()][0] += weight
+        for day, hour, piece in _hour_pieces(start, end, self.tz):
+            self.daily[day][1] += weight * piece
+            self.hourly[(day, hour)] += weight * piece
+
+        month = local_start.date().replace(day=1)
+        for attendee in attendees or []:
+            email = (attendee.get('email') or '').lower()
+            if not email or email in self._own_emails or attendee.get('responseStatus') == 'declined':
+                continue
+            entry = self.attendees[(email, month)]
+            entry[0] += weight
+            entry[1] += weight * minutes
+            entry[2] = entry[2] or (attendee.get('name') or '')[:255]
+
+    @transaction.atomic
+    def flush(self) -> None:
+        """Apply the net change: one read and bulk writes per table; rows that reach zero are dropped"""
+        self._flush_table(
+            CalendarDailyLoad, {day: value for day, value in self.daily.items() if any(value)},
+            lambda days: CalendarDailyLoad.objects.filter(user=self.user, date__in=days),
+            lambda row: row.date,
+            lambda key: CalendarDailyLoad(user=self.user, date=key),
+            self._apply_daily,
+            lambda row: row.meeting_count <= 0 and row.busy_minutes <= 0,
+            ['meeting_count', 'busy_minutes'],
+        )
+        self._flush_table(
+            CalendarHourlyLoad, {key: value for key, value in self.hourly.items() if value},
+            lambda keys: CalendarHourlyLoad.objects.filter(
+                user=self.user, date__in={day for day, _ in keys}, hour__in={hour for _, hour in keys}),
+            lambda row: (row.date, row.hour),
+            lambda key: CalendarHourlyLoad(user=self.user, date=key[0], hour=key[1]),
+            self._apply_hourly,
+            lambda row: row.busy_minutes <= 0,
+            ['busy_minutes'],
+        )
+        self._flush_table(
+            CalendarAttendeeTime, {key: value for key, value in self.attendees.items() if value[0] or value[1]},
+            lambda keys: CalendarAttendeeTime.objects.filter(
+                user=self.user, email__in={email for email, _ in keys}, month__in={month for _, month in keys}),
+            lambda row: (row.email, row.month),
+            lambda key: CalendarAttendeeTime(user=self.user, email=key[0], month=key[1]),
+            self._apply_attendee,
+            lambda row: row.meeting_count <= 0 and row.minutes <= 0,
+            ['name', 'meeting_count', 'minutes'],
+        )
+        self.daily.clear()
+        self.hourly.clear()
+        self.attendees.clear()
+
+    @staticmethod
+    def _apply_daily(row: CalendarDailyLoad, value) -> None:
+        row.meeting_count += value[0]
+        row.busy_minutes += value[1]
+
+    @staticmethod
+    def _apply_hourly(row: CalendarHourlyLoad, value) -> None:
+        row.busy_minutes += value
+
+    @staticmethod
+    def _apply_attendee(row: CalendarAttendeeTime, value) -> None:
+        row.meeting_count += value[0]
+        row.minutes += value[1]
+        row.name = row.name or value[2]
+
+    @staticmethod
+    def _flush_table(model, changes: Dict, existing_rows, key_of, new_row, apply, is_empty, fields) -> None:
+        """
+        Add `changes` to the table's rows
+
+        The rows are read with select_for_update(), so a concurrent flush for the same user
+        (another calendar's sync, an .ics import) waits instead of overwriting the sum. If
+        that flush inserted one of our new rows first, the unique key fails the insert and
+        the whole read-modify-write is redone against its row.
+        """
+        if not changes:
+            return
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    existing = {key_of(row): row for row in existing_rows(list(changes)).select_for_update()}
+                    to_create, to_update, to_delete = [], [], []
+                    for key, value in changes.items():
+                        row = existing.get(key)
+                        if row is None:
+                            row = new_row(key)
+                            apply(row, value)
+                            if not is_empty(row):
+                                to_create.append(row)
+                            continue
+                        apply(row, value)
+                        (to_delete if is_empty(row) else to_update).append(row)
+                    model.objects.bulk_create(to_create, batch_size=500)
+                    model.objects.bulk_update(to_update, fields, batch_size=500)
+                    if to_delete:
+                        model.objects.filter(pk__in=[row.pk for row in to_delete]).delete()
+                return
+            except IntegrityError:
+                if attempt:
+                    raise
+
+
+def load_masters(user, events: Iterable[CalendarEvent]) -> Dict:
+    """Series masters referenced by exception rows among `events`, keyed by (calendar_id, google_event_id)"""
+    keys = {(e.calendar_id, e.recurring_event_id) for e in events if e.recurring_event_id}
+    if not keys:
+        return {}
+    masters = (CalendarEvent.objects
+               .filter(user=user, is_recurring=True,
+                       google_event_id__in={event_id for _, event_id in keys})
+               .only(*ANALYTICS_FIELDS))
+    return {(m.calendar_id, m.google_event_id): m for m in masters if (m.calendar_id, m.google_event_id) in keys}
+
+
+@transaction.atomic
+def rebuild_analytics(user, time_zone: str = 'UTC') -> None:
+    """Recompute a user's analytics tables from the mirror"""
+    CalendarDailyLoad.objects.filter(user=user).delete()
+    CalendarHourlyLoad.objects.filter(user=user).delete()
+    CalendarAttendeeTime.objects.filter(user=user).delete()
+
+    events = list(CalendarEvent.objects.filter(user=user).only(*ANALYTICS_FIELDS))
+    delta = AnalyticsDelta(user, time_zone, masters={
+        (e.calendar_id, e.google_event_id or e.ical_uid): e for e in events if e.is_recurring
+    })
+    for event in events:
+        delta.add(event)
+    delta.flush()
+
+
+def calendar_analytics(user, start: date, end: date, top_attendees: int = 10) -> Dict:
+    """
+    Dashboard figures for local dates [start, end] from the aggregate tables
+
+    Returns:
+        {'daily': [{'date', 'meetings', 'busy_minutes'}],
+         'busiest_hours': [{'hour', 'busy_minutes'}] (sorted, busiest first),
+         'attendees': [{'email', 'name', 'meetings', 'minutes'}] (most time first),
+         'totals': {'meetings', 'busy_minutes'}}
+    """
+    daily = list(CalendarDailyLoad.objects
+                 .filter(user=user, date__gte=start, date__lte=end)
+                 .values_list('date', 'meeting_count', 'busy_minutes'))
+    hours = (CalendarHourlyLoad.objects
+             .filter(user=user, date__gte=start, date__lte=end)
+             .values('hour')
+             .annotate(total=Sum('busy_minutes'))
+             .order_by('-total', 'hour'))
+    attendees = (CalendarAttendeeTime.objects
+                 .filter(user=user, month__gte=start.replace(day=1), month__lte=end)
+                 .values('email')
+                 .annotate(meetings=Sum('meeting_count'), total=Sum('minutes'))
+                 .order_by('-total', 'email')[:top_attendees])
+    names = dict(CalendarAttendeeTime.objects
+                 .filter(user=user, email__in=[a['email'] for a in attendees])
+                 .exclude(name='')
+                 .values_list('email', 'name'))
+
+    return {
+        'daily': [{'date': day.isoformat(), 'meetings': count, 'busy_minutes': minutes}
+                  for day, count, minutes in daily],
+        'busiest_hours': [{'hour': h['hour'], 'busy_minutes': h['total']} for h in hours],
+        'attendees': [{'email': a['email'], 'name': names.get(a['email'], ''),
+                       'meetings': a['meetings'], 'minutes': a['total']} for a in attendees],
+        'totals': {'meetings': sum(count for _, count, _ in daily),
+                   'busy_minutes': sum(minutes for _, _, minutes in daily)},
+    }
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class CalendarAgentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'calendar_agent'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+
+        from .event_templates import template_changed
+        from .models import EventTemplate
+
+        # Cached template indexes are rebuilt after any template edit
+        post_save.connect(template_changed, sender=EventTemplate, dispatch_uid='event_template_saved')
+        post_delete.connect(template_changed, sender=EventTemplate, dispatch_uid='event_template_deleted')
@@ -0,0 +1,182 @@
+# backend/inboxiq_project/calendar_agent/attendees.py
+"""
+Attendee resolution for calendar intents.
+
+Names pulled from a request ("a meeting with Priya and Tom") are matched against the
+user's local ContactCache with a single query covering every name, then scored per name
+in Python. Names with no local match are looked up with the People API's targeted contact
+search, concurrently; the full address book is never fetched.
+
+A name resolves when one candidate clearly wins; otherwise its ranked candidates are
+returned so the user can pick.
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import Q
+
+from gmail_agent.contacts_service import GoogleContactsService
+from gmail_agent.models import ContactCache
+
+EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+
+_STOP_WORDS = (
+    r'on|at|from|for|to|about|regarding|re|in|by|between|every|next|this|tomorrow|today|tonight|'
+    r'monday|tuesday|wednesday|thursday|friday|saturday|sunday|mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun|'
+    r'january|february|march|april|may|june|july|august|september|october|november|december|'
+    r'jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec|morning|afternoon|evening|noon|\d'
+)
+_WITH_RE = re.compile(
+    r'\b(?:with|invite|inviting)\s+(?P<names>.+?)(?=\s+(?:' + _STOP_WORDS + r')\b'
+    r'|(?<!\bdr)(?<!\bmr)(?<!\bms)(?<!\bmrs)(?<!\bprof)\s*[.?!;:]|\s*$)',
+    re.IGNORECASE,
+)
+_SPLIT_RE = re.compile(r'\s*(?:,|&|\band\b|\bplus\b)\s*', re.IGNORECASE)
+_HONORIFIC_RE = re.compile(r'^(?:dr|mr|mrs|ms|prof)\.?\s+', re.IGNORECASE)
+_NAME_RE = re.compile(r"^[A-Za-z][A-Za-z'\-]*(?:\s+[A-Za-z][A-Za-z'\-]*){0,2}$")
+_NOT_NAMES = {'me', 'us', 'him', 'her', 'them', 'everyone', 'the team', 'my team', 'team', 'the group',
+              'a', 'an', 'the', 'someone', 'my manager', 'my boss'}
+
+# Scores at or above this resolve a name outright, if no other candidate comes close
+RESOLVE_THRESHOLD = 0.85
+AMBIGUITY_MARGIN = 0.1
+MIN_CANDIDATE_SCORE = 0.6
+MAX_CANDIDATES = 5
+# Parallel People API searches for names not in the local store
+REMOTE_LOOKUP_WORKERS = 4
+
+
+def extract_attendee_names(text: str) -> List[str]:
+    """Email addresses and names mentioned as attendees ("with Priya and Tom", "invite ana@x.com")"""
+    found = []
+    for email in EMAIL_RE.findall(text or ''):
+        found.append(email)
+    for match in _WITH_RE.finditer(EMAIL_RE.sub(' ', text or '')):
+        for part in _SPLIT_RE.split(match.group('names')):
+            part = _HONORIFIC_RE.sub('', part.strip(" '\""))
+            if part and part.lower() not in _NOT_NAMES and _NAME_RE.match(part):
+                found.append(part)
+    return list(dict.fromkeys(found))
+
+
+def _tokens(value: str) -> List[str]:
+    return [t for t in re.split(r"[\s.'_\-]+", (value or '').lower()) if t]
+
+
+def score_contact(query: str, name: str, email: str) -> float:
+    """How well a contact matches a typed name or email (1.0 = exact email)"""
+    query_l, name_l, email_l = query.lower().strip(), (name or '').lower().strip(), (email or '').lower()
+    if not query_l:
+        return 0.0
+    if '@' in query_l:
+        return 1.0 if query_l == email_l else 0.0
+    if query_l == name_l:
+        return 0.97
+
+    query_tokens, name_tokens = _tokens(query_l), _tokens(name_l)
+    local_part = email_l.split('@', 1)[0]
+    if query_tokens and all(any(n == q for n in name_tokens) for q in query_tokens):
+        return 0.9
+    if query_tokens and all(any(n.startswith(q) for n in name_tokens) for q in query_tokens):
+        return 0.82
+    if local_part.startswith(query_l.replace(' ', '')) or local_part.startswith(query_tokens[0] + '.'):
+        return 0.78
+    if query_l in name_l:
+        return 0.7
+    return round(0.8 * max(SequenceMatcher(None, query_l, name_l).ratio(),
+                           SequenceMatcher(None, query_l, local_part).ratio()), 4)
+
+
+def _candidate_filter(names: Iterable[str]) -> Q:
+    """One OR-ed filter that pre-selects rows for every name (scoring happens in Python)"""
+    condition = Q()
+    for name in names:
+        if '@' in name:
+            condition |= Q(email__iexact=name)
+            continue
+        for token in _tokens(name):
+            condition |= Q(name__icontains=token) | Q(email__istartswith=token)
+            if len(token) > 3:
+                # Catches misspellings past the third letter ("Priyah", "Thomson")
+                condition |= Q(name__istartswith=token[:3])
+    return condition
+
+
+def _rank(name: str, contacts: Iterable[Dict]) -> List[Dict]:
+    ranked = {}
+    for contact in contacts:
+        score = score_contact(name, contact['name'], contact['email'])
+        key = contact['email'].lower()
+        if score >= MIN_CANDIDATE_SCORE and key and score > ranked.get(key, {}).get('score', 0):
+            ranked[key] = {'name': contact['name'], 'email': contact['email'], 'score': score}
+    return sorted(ranked.values(), key=lambda c: (-c['score'], c['name'].lower()))[:MAX_CANDIDATES]
+
+
+def _is_resolved(candidates: List[Dict]) -> bool:
+    if not candidates or candidates[0]['score'] < RESOLVE_THRESHOLD:
+        return False
+    return len(candidates) == 1 or candidates[0]['score'] - candidates[1]['score'] >= AMBIGUITY_MARGIN
+
+
+def _remote_candidates(access_token: str, names: List[str]) -> Dict[str, List[Dict]]:
+    """People API searchContacts for each name, in parallel (each worker has its own client)"""
+    def search(name):
+        return name, GoogleContactsService(access_token).search_contacts_api(name)
+
+    with ThreadPoolExecutor(max_workers=min(REMOTE_LOOKUP_WORKERS, len(names))) as pool:
+        return dict(pool.map(search, names))
+
+
+def resolve_attendees(user, names: Iterable[str], access_token: Optional[str] = None) -> Dict:
+    """
+    Resolve attendee names (or email addresses) to contacts
+
+    Args:
+        user: Owner of the contact store
+        names: Names or emails as typed
+        access_token: Google token with contacts scope, for names missing locally (optional)
+
+    Returns:
+        {'resolved': [{'query', 'name', 'email', 'score'}],
+         'ambiguous': [{'query', 'candidates': [{'name', 'email', 'score'}, ...]}],
+         'unresolved': [query, ...]}
+    """
+    names = [n.strip() for n in dict.fromkeys(names or []) if n and n.strip()]
+    result = {'resolved': [], 'ambiguous': [], 'unresolved': []}
+    if not names:
+        return result
+
+    rows = list(ContactCache.objects
+                .filter(user=user)
+                .filter(_candidate_filter(names))
+                .values('name', 'email')[:1000])
+    candidates = {name: _rank(name, rows) for name in names}
+
+    missing = [name for name in names if not candidates[name] and '@' not in name]
+    if missing and access_token:
+        try:
+            remote = _remote_candidates(access_token, missing)
+        except Exception as e:
+            print(f"[ATTENDEES] Remote contact search failed: {e}")
+            remote = {}
+        found = [contact for contacts in remote.values() for contact in contacts]
+        if found:
+            GoogleContactsService(access_token).cache_contacts(user, found)
+        for name, contacts in remote.items():
+            candidates[name] = _rank(name, [{'name': c['display_name'], 'email': c['primary_email']}
+                                            for c in contacts])
+
+    for name in names:
+        ranked = candidates[name]
+        if '@' in name and not ranked:
+            # A typed address needs no contact entry
+            result['resolved'].append({'query': name, 'name': '', 'email': name, 'score': 1.0})
+        elif _is_resolved(ranked):
+            result['resolved'].append({'query': name, **ranked[0]})
+        elif ranked:
+            result['ambiguous'].append({'query': name, 'candidates': ranked})
+        else:
+            result['unresolved'].append(name)
+    return result
@@ -0,0 +1,406 @@
+# backend/inboxiq_project/calendar_agent/availability.py
+"""
+Free-time computation over busy intervals.
+
+Everything here is pure (no API or DB access): callers pass busy intervals as
+(start, end) pairs of timezone-aware datetimes, typically from a freebusy query.
+Busy intervals are merged with a sorted sweep, working hours are generated per day
+in the user's time zone, and free windows are the working windows minus busy time.
+
+For several attendees, busy time is rasterised into fixed-resolution NumPy bitsets
+(one row per attendee) and intersected column-wise, so cost is linear in
+attendees x horizon with no pairwise interval comparisons.
+
+Recurring slots ("free every Tuesday for six weeks") use the same bitsets laid out one
+row per local day: the occurrence days' rows are OR-ed together, so a time of day is
+offered only if it is free on every occurrence.
+"""
+import math
+import re
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dateutil.rrule import rrulestr
+from django.conf import settings
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover - Python < 3.9
+    from backports.zoneinfo import ZoneInfo
+
+Interval = Tuple[datetime, datetime]
+
+DEFAULT_WORKING_HOURS = {'start': '09:00', 'end': '17:00', 'days': [0, 1, 2, 3, 4]}
+
+
+def working_hours_config(overrides: Optional[Dict] = None) -> Dict:
+    """Working hours from settings.CALENDAR_WORKING_HOURS, with optional per-call overrides."""
+    config = {**DEFAULT_WORKING_HOURS, **getattr(settings, 'CALENDAR_WORKING_HOURS', {})}
+    if overrides:
+        config.update({k: v for k, v in overrides.items() if v is not None})
+    return config
+
+
+def _parse_hhmm(value) -> time:
+    if isinstance(value, time):
+        return value
+    hours, _, minutes = str(value).partition(':')
+    return time(int(hours), int(minutes or 0))
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """Merge overlapping/touching intervals with one sort and a linear sweep."""
+    ordered = sorted((s, e) for s, e in intervals if e > s)
+    merged: List[Interval] = []
+    for start, end in ordered:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def working_windows(start: datetime,
+                    end: datetime,
+                    time_zone: str = 'UTC',
+                    working_hours: Optional[Dict] = None) -> List[Interval]:
+    """
+    Working-hour windows between `start` and `end`, built per local day in `time_zone`
+    (so DST changes are respected) and clipped to the range.
+    """
+    tz = ZoneInfo(time_zone or 'UTC')
+    config = working_hours_config(working_hours)
+    day_start, day_end = _parse_hhmm(config['start']), _parse_hhmm(config['end'])
+    days = set(config['days'])
+
+    windows: List[Interval] = []
+    day = start.astimezone(tz).date()
+    last_day = end.astimezone(tz).date()
+    while day <= last_day:
+        if day.weekday() in days:
+            w_start = datetime.combine(day, day_start, tzinfo=tz)
+            w_end = datetime.combine(day, day_end, tzinfo=tz)
+            w_start, w_end = max(w_start, start), min(w_end, end)
+            if w_end > w_start:
+                windows.append((w_start, w_end))
+        day += timedelta(days=1)
+    return windows
+
+
+def subtract_busy(windows: Sequence[Interval], busy: Sequence[Interval]) -> List[Interval]:
+    """
+    Free time = windows minus busy. Both inputs must be sorted and non-overlapping
+    (merge_intervals output); runs as a two-pointer sweep in O(len(windows) + len(busy)).
+    """
+    free: List[Interval] = []
+    i = 0
+    for w_start, w_end in windows:
+        cursor = w_start
+        # Skip busy intervals that end before this window
+        while i < len(busy) and busy[i][1] <= w_start:
+            i += 1
+        j = i
+        while j < len(busy) and busy[j][0] < w_end:
+            b_start, b_end = busy[j]
+            if b_start > cursor:
+                free.append((cursor, b_start))
+            cursor = max(cursor, b_end)
+            j += 1
+        if cursor < w_end:
+            free.append((cursor, w_end))
+    return free
+
+
+def _ceil_to_step(dt: datetime, step: timedelta) -> datetime:
+    seconds = step.total_seconds()
+    offset = (dt.minute * 60 + dt.second + dt.microsecond / 1e6) % seconds
+    if offset == 0:
+        return dt
+    return dt + timedelta(seconds=seconds - offset)
+
+
+def rank_slots(free: Sequence[Interval],
+               duration_minutes: int,
+               horizon_start: datetime,
+               time_zone: str = 'UTC',
+               preferred_hours: Optional[Tuple[int, int]] = None,
+               step_minutes: int = 15,
+               limit: Optional[int] = None) -> List[Dict]:
+    """
+    Turn free windows into concrete, ranked slots of `duration_minutes`.
+
+    Candidates start at every local `step_minutes` boundary inside each free window, so a long
+    window can offer a slot in the preferred hours even when it opens outside them. Scores favour
+    sooner slots, slots that leave a buffer afterwards, and (optionally) a preferred local hour range.
+    """
+    slots = []
+    for start, end, f_end in _candidate_slots(free, duration_minutes, step_minutes, time_zone):
+        days_out = (start - horizon_start).total_seconds() / 86400.0
+        buffer_hours = (f_end - end).total_seconds() / 3600.0
+        score = 1.0 - min(days_out, 30.0) * 0.02 + min(buffer_hours, 2.0) * 0.05
+        if preferred_hours:
+            local_hour = start.hour
+            if preferred_hours[0] <= local_hour < preferred_hours[1]:
+                score += 0.25
+
+        slots.append({
+            'start_datetime': start.isoformat(),
+            'end_datetime': end.isoformat(),
+            'duration_minutes': duration_minutes,
+            'free_until': f_end.isoformat(),
+            'score': round(score, 4),
+        })
+
+    slots.sort(key=lambda s: (-s['score'], s['start_datetime']))
+    return slots[:limit] if limit else slots
+
+
+def split_slots(free: Sequence[Interval],
+                duration_minutes: int,
+                step_minutes: int = 30,
+                time_zone: str = 'UTC') -> List[Interval]:
+    """
+    Every slot of `duration_minutes` that fits in the free windows, starting on local
+    `step_minutes` boundaries, in time order (the same candidates rank_slots() scores).
+    """
+    return [(start, end) for start, end, _ in _candidate_slots(free, duration_minutes, step_minutes, time_zone)]
+
+
+def _candidate_slots(free: Sequence[Interval], duration_minutes: int, step_minutes: int,
+                     time_zone: str = 'UTC') -> Iterable[Tuple[datetime, datetime, datetime]]:
+    """(start, end, end of its free window) for each slot on a local step boundary, in the local zone"""
+    duration = timedelta(minutes=duration_minutes)
+    step = timedelta(minutes=step_minutes)
+    tz = ZoneInfo(time_zone or 'UTC')
+    for f_start, f_end in free:
+        f_end = f_end.astimezone(tz)
+        start = _ceil_to_step(f_start.astimezone(tz), step)
+        while start + duration <= f_end:
+            yield start, start + duration, f_end
+            start += step
+
+
+def find_free_slots(busy: Iterable[Interval],
+                    start: datetime,
+                    end: datetime,
+                    duration_minutes: int,
+                    time_zone: str = 'UTC',
+                    working_hours: Optional[Dict] = None,
+                    preferred_hours: Optional[Tuple[int, int]] = None,
+                    limit: Optional[int] = None) -> List[Dict]:
+    """Full pipeline: merge busy intervals, clip to working hours, subtract, rank."""
+    merged = merge_intervals(busy)
+    windows = working_windows(start, end, time_zone, working_hours)
+    free = subtract_busy(windows, merged)
+    return rank_slots(free, duration_minutes, start, time_zone, preferred_hours, limit=limit)
+
+
+# -------------------
+# Bitset availability (multi-attendee)
+# -------------------
+def interval_bitset(intervals: Iterable[Interval],
+                    start: datetime,
+                    end: datetime,
+                    resolution_minutes: int = 15,
+                    cover: str = 'any') -> np.ndarray:
+    """
+    Rasterise intervals onto a boolean grid of `resolution_minutes` cells from `start` to `end`.
+
+    cover='any' marks every cell an interval touches (use for busy time, so partial overlaps block);
+    cover='full' marks only cells fully inside an interval (use for working hours).
+    Built with a difference array and one cumulative sum, so it is O(cells + intervals).
+    """
+    step = resolution_minutes * 60.0
+    cells = max(0, math.ceil((end - start).total_seconds() / step))
+    if cells == 0:
+        return np.zeros(0, dtype=bool)
+
+    pairs = np.array([((s - start).total_seconds(), (e - start).total_seconds())
+                      for s, e in intervals if e > s], dtype=float).reshape(-1, 2)
+    if not len(pairs):
+        return np.zeros(cells, dtype=bool)
+
+    if cover == 'any':
+        first = np.floor(pairs[:, 0] / step)
+        last = np.ceil(pairs[:, 1] / step)
+    else:
+        first = np.ceil(pairs[:, 0] / step)
+        last = np.floor(pairs[:, 1] / step)
+    first = np.clip(first, 0, cells).astype(np.int64)
+    last = np.clip(last, 0, cells).astype(np.int64)
+    keep = last > first
+
+    diff = np.zeros(cells + 1, dtype=np.int32)
+    np.add.at(diff, first[keep], 1)
+    np.add.at(diff, last[keep], -1)
+    return np.cumsum(diff[:-1]) > 0
+
+
+def bitset_runs(free: np.ndarray) -> List[Tuple[int, int]]:
+    """[start, end) cell index pairs for each run of True values."""
+    padded = np.concatenate(([False], free, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+
+
+def grid_origin(start: datetime, resolution_minutes: int) -> datetime:
+    """Floor `start` to a cell boundary so slots line up with the clock (e.g. :00/:15/:30/:45)."""
+    step = resolution_minutes * 60
+    offset = (start.minute * 60 + start.second) % step
+    return start.replace(microsecond=0) - timedelta(seconds=offset)
+
+
+def common_free_mask(busy_by_attendee: Dict[str, Sequence[Interval]],
+                     start: datetime,
+                     end: datetime,
+                     time_zone: str = 'UTC',
+                     working_hours: Optional[Dict] = None,
+                     resolution_minutes: int = 15) -> np.ndarray:
+    """
+    Boolean grid from grid_origin(start): True where every attendee is free and it is within
+    working hours. Cells before `start` are never free.
+    """
+    origin = grid_origin(start, resolution_minutes)
+    working = interval_bitset(working_windows(start, end, time_zone, working_hours),
+                              origin, end, resolution_minutes, cover='full')
+    if not busy_by_attendee:
+        return working
+    busy = np.vstack([interval_bitset(intervals, origin, end, resolution_minutes)
+                      for intervals in busy_by_attendee.values()])
+    return working & ~busy.any(axis=0)
+
+
+def find_common_free_slots(busy_by_attendee: Dict[str, Sequence[Interval]],
+                           start: datetime,
+                           end: datetime,
+                           duration_minutes: int,
+                           time_zone: str = 'UTC',
+                           working_hours: Optional[Dict] = None,
+                           preferred_hours: Optional[Tuple[int, int]] = None,
+                           resolution_minutes: int = 15,
+                           limit: Optional[int] = None) -> List[Dict]:
+    """
+    Best slots of `duration_minutes` in which every attendee is free, ranked like rank_slots().
+    Slot boundaries are aligned to `resolution_minutes`.
+    """
+    free = common_free_mask(busy_by_attendee, start, end, time_zone, working_hours, resolution_minutes)
+    origin = grid_origin(start, resolution_minutes)
+    step = timedelta(minutes=resolution_minutes)
+    windows = [(origin + first * step, origin + last * step) for first, last in bitset_runs(free)]
+    return rank_slots(windows, duration_minutes, start, time_zone, preferred_hours,
+                      step_minutes=resolution_minutes, limit=limit)
+
+
+# -------------------
+# Recurring availability
+# -------------------
+MAX_RECURRING_OCCURRENCES = 52
+
+
+def occurrence_days(rule: str,
+                    start: datetime,
+                    end: Optional[datetime] = None,
+                    time_zone: str = 'UTC',
+                    max_occurrences: int = MAX_RECURRING_OCCURRENCES) -> List[date]:
+    """
+    Local dates matched by an RRULE (e.g. 'FREQ=WEEKLY;BYDAY=TU;COUNT=6'), counted from the
+    local date of `start` and stopping at `end` or after `max_occurrences`.
+
+    Raises:
+        ValueError: The rule cannot be parsed
+    """
+    tz = ZoneInfo(time_zone or 'UTC')
+    first_day = datetime.combine(start.astimezone(tz).date(), time.min, tzinfo=tz)
+    value = rule.split(':', 1)[1] if rule.upper().startswith('RRULE:') else rule
+    # dateutil wants UNTIL in UTC when DTSTART is aware
+    value = _UNTIL_RE.sub(lambda match: _utc_until(match, tz), value.strip())
+
+    days = []
+    for occurrence in islice(rrulestr(value, dtstart=first_day), max_occurrences):
+        if end is not None and occurrence >= end:
+            break
+        days.append(occurrence.date())
+    return days
+
+
+_UNTIL_RE = re.compile(r'UNTIL=(\d{8})(?:T(\d{6}))?(Z)?', re.IGNORECASE)
+
+
+def _utc_until(match, tz) -> str:
+    """A floating (local) UNTIL as UTC; a date-only UNTIL includes that whole local day"""
+    if match.group(3):
+        return match.group(0).upper()
+    if match.group(2):
+        until = datetime.strptime(match.group(1) + match.group(2), '%Y%m%d%H%M%S')
+    else:
+        until = datetime.combine(datetime.strptime(match.group(1), '%Y%m%d').date(), time.max.replace(microsecond=0))
+    return 'UNTIL=' + until.replace(tzinfo=tz).astimezone(ZoneInfo('UTC')).strftime('%Y%m%dT%H%M%SZ')
+
+
+def recurring_free_mask(busy_by_attendee: Dict[str, Sequence[Interval]],
+                        days: Sequence[date],
+                        start: datetime,
+                        time_zone: str = 'UTC',
+                        working_hours: Optional[Dict] = None,
+                        resolution_minutes: int = 15) -> np.ndarray:
+    """
+    Boolean grid over one local day: True where every attendee is free on every day in `days`
+    and it is within working hours. The pattern's days are taken as given, so the working-day
+    filter does not apply. Time before `start` counts as busy.
+
+    All busy time is rasterised once onto a local wall-clock grid spanning the first to the
+    last occurrence (one row per day), so cost is linear in the horizon.
+    """
+    tz = ZoneInfo(time_zone or 'UTC')
+    cells_per_day = (24 * 60) // resolution_minutes
+    origin = datetime.combine(days[0], time.min)
+    horizon_days = (days[-1] - days[0]).days + 1
+
+    to_local = lambda value: value.astimezone(tz).replace(tzinfo=None)  # noqa: E731
+    busy = [(to_local(b_start), to_local(b_end))
+            for intervals in busy_by_attendee.values() for b_start, b_end in intervals]
+    busy.append((origin, to_local(start)))
+    grid = interval_bitset(busy, origin, origin + timedelta(days=horizon_days), resolution_minutes)
+    blocked = grid.reshape(horizon_days, cells_per_day)[[(day - days[0]).days for day in days]].any(axis=0)
+
+    config = working_hours_config(working_hours)
+    working = interval_bitset(
+        [(datetime.combine(days[0], _parse_hhmm(config['start'])), datetime.combine(days[0], _parse_hhmm(config['end'])))],
+        origin, origin + timedelta(days=1), resolution_minutes, cover='full',
+    )
+    return working & ~blocked
+
+
+def find_recurring_free_slots(busy_by_attendee: Dict[str, Sequence[Interval]],
+                              rule: str,
+                              start: datetime,
+                              duration_minutes: int,
+                              end: Optional[datetime] = None,
+                              time_zone: str = 'UTC',
+                              working_hours: Optional[Dict] = None,
+                              preferred_hours: Optional[Tuple[int, int]] = None,
+                              resolution_minutes: int = 15,
+                              limit: Optional[int] = None) -> List[Dict]:
+    """
+    Times of day free on every occurrence of `rule`, ranked like rank_slots() on the first
+    occurrence. Each slot also lists 'occurrences': the start of the slot on every matched day.
+    """
+    days = occurrence_days(rule, start, end, time_zone)
+    if not days:
+        return []
+    tz = ZoneInfo(time_zone or 'UTC')
+    free = recurring_free_mask(busy_by_attendee, days, start, time_zone, working_hours, resolution_minutes)
+
+    origin = datetime.combine(days[0], time.min, tzinfo=tz)
+    step = timedelta(minutes=resolution_minutes)
+    windows = [(origin + first * step, origin + last * step) for first, last in bitset_runs(free)]
+    slots = rank_slots(windows, duration_minutes, start, time_zone, preferred_hours,
+                       step_minutes=resolution_minutes, limit=limit)
+
+    for slot in slots:
+        clock = datetime.fromisoformat(slot['start_datetime']).time()
+        slot['occurrences'] = [datetime.combine(day, clock, tzinfo=tz).isoformat() for day in days]
+    return slots
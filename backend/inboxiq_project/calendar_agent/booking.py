@@ -0,0 +1,248 @@
+# backend/inboxiq_project/calendar_agent/booking.py
+"""
+Public booking links.
+
+Bookable slots for each link are precomputed into BookingSlotCache from the local calendar
+mirror (busy events plus earlier bookings), so serving the public page is a database read
+and never calls Google. A calendar sync that changes anything, or a new booking, marks the
+owner's caches stale; the next read (or the sync command) recomputes them.
+
+Reserving a slot locks the owner's CalendarIntegration row, so concurrent bookings against
+any of the owner's links are serialised and the same time cannot be booked twice. The
+Google event is created after the reservation commits.
+
+The page is anonymous and every booking creates a real Google event, so reservations are
+rate limited from the bookings table itself (it is shared by every worker): per client IP
+and per link within CALENDAR_BOOKING_RATE_WINDOW_SECONDS, and per email address by its
+upcoming bookings with the owner. A request over a limit is a 429 with Retry-After.
+"""
+import math
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import merge_intervals, split_slots, subtract_busy, working_windows
+from .conflicts import record_created_event
+from .google_calendar_service import GoogleCalendarService, GoogleCalendarServiceError
+from .models import Booking, BookingLink, BookingSlotCache, CalendarIntegration
+
+# Bookings in these states hold their time
+ACTIVE_BOOKING_STATUSES = ('pending', 'confirmed')
+
+
+class BookingError(Exception):
+    """A booking request that cannot be served; `code` is returned to the client"""
+
+    def __init__(self, message: str, code: str = 'BOOKING_ERROR', status: int = 400,
+                 retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.retry_after = retry_after  # seconds, sent as Retry-After
+
+
+def new_booking_slug() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def invalidate_booking_slots(user_id) -> None:
+    """Mark every booking link cache of this user stale"""
+    BookingSlotCache.objects.filter(link__user_id=user_id).update(is_stale=True)
+
+
+def compute_booking_slots(link: BookingLink, now: Optional[datetime] = None):
+    """
+    Bookable (start, end) slots for a link from the local mirror, and the time zone they are in
+
+    Returns:
+        ([(start, end), ...], time_zone)
+    """
+    from .sync import local_busy_intervals, primary_time_zone
+
+    now = now or timezone.now()
+    time_zone = primary_time_zone(link.user)
+    start = now + timedelta(minutes=link.min_notice_minutes)
+    end = now + timedelta(days=link.days_ahead)
+
+    busy = local_busy_intervals(link.user, start, end)
+    busy += Booking.objects.filter(
+        user=link.user, status__in=ACTIVE_BOOKING_STATUSES,
+        start_datetime__lt=end, end_datetime__gt=start,
+    ).values_list('start_datetime', 'end_datetime')
+
+    free = subtract_busy(working_windows(start, end, time_zone), merge_intervals(busy))
+    return split_slots(free, link.duration_minutes, link.slot_step_minutes, time_zone), time_zone
+
+
+def refresh_booking_slots(link: BookingLink, now: Optional[datetime] = None) -> BookingSlotCache:
+    """Recompute and store a link's slots"""
+    slots, time_zone = compute_booking_slots(link, now)
+    cache_row, _ = BookingSlotCache.objects.update_or_create(
+        link=link,
+        defaults={
+            'slots': [slot_start.isoformat() for slot_start, _ in slots],
+            'time_zone': time_zone,
+            'computed_at': now or timezone.now(),
+            'is_stale': False,
+        },
+    )
+    return cache_row
+
+
+def booking_slots(link: BookingLink, now: Optional[datetime] = None) -> Dict:
+    """
+    The link's bookable slots from its cache, recomputed first if stale or older than
+    CALENDAR_BOOKING_CACHE_SECONDS. Slots that have fallen inside the notice period are dropped.
+
+    Returns:
+        {'slots': [{'start_datetime', 'end_datetime'}, ...], 'time_zone': str}
+    """
+    now = now or timezone.now()
+    max_age = timedelta(seconds=getattr(settings, 'CALENDAR_BOOKING_CACHE_SECONDS', 900))
+    cache_row = BookingSlotCache.objects.filter(link=link).first()
+    if cache_row is None or cache_row.is_stale or not cache_row.computed_at or now - cache_row.computed_at > max_age:
+        cache_row = refresh_booking_slots(link, now)
+
+    earliest = now + timedelta(minutes=link.min_notice_minutes)
+    duration = timedelta(minutes=link.duration_minutes)
+    slots = []
+    for value in cache_row.slots:
+        slot_start = datetime.fromisoformat(value)
+        if slot_start >= earliest:
+            slots.append({
+                'start_datetime': value,
+                'end_datetime': (slot_start + duration).isoformat(),
+            })
+    return {'slots': slots, 'time_zone': cache_row.time_zone}
+
+
+def check_booking_rate(link: BookingLink, email: str, client_ip: Optional[str],
+                       now: Optional[datetime] = None) -> None:
+    """
+    Refuse a booking over the public page's limits
+
+    Every booking made in the window counts, failed ones included: each one tried to create
+    a Google event.
+
+    Raises:
+        BookingError: 429, with retry_after set to when the window frees up a booking
+    """
+    now = now or timezone.now()
+    window = timedelta(seconds=getattr(settings, 'CALENDAR_BOOKING_RATE_WINDOW_SECONDS', 3600))
+    recent = Booking.objects.filter(created_at__gt=now - window)
+    limits = [(recent.filter(link=link), getattr(settings, 'CALENDAR_BOOKING_MAX_PER_LINK', 20))]
+    if client_ip:
+        limits.append((recent.filter(client_ip=client_ip), getattr(settings, 'CALENDAR_BOOKING_MAX_PER_IP', 5)))
+    for rows, limit in limits:
+        created = list(rows.order_by('-created_at').values_list('created_at', flat=True)[:limit])
+        if len(created) >= limit:
+            # Another booking is allowed once the oldest of these leaves the window
+            wait = (created[-1] + window - now).total_seconds()
+            raise BookingError('Too many bookings, please try again later', 'RATE_LIMITED', 429,
+                               retry_after=max(1, math.ceil(wait)))
+
+    upcoming = Booking.objects.filter(
+        user=link.user, email__iexact=email, status__in=ACTIVE_BOOKING_STATUSES, end_datetime__gt=now,
+    ).count()
+    if upcoming >= getattr(settings, 'CALENDAR_BOOKING_MAX_ACTIVE_PER_EMAIL', 2):
+        raise BookingError('This email address already has the maximum number of upcoming bookings',
+                           'RATE_LIMITED', 429)
+
+
+def reserve_slot(slug: str, start: datetime, name: str, email: str, notes: str = '',
+                 client_ip: Optional[str] = None) -> Booking:
+    """
+    Claim a slot on a booking link as a pending Booking
+
+    Raises:
+        BookingError: Unknown link (404), calendar not connected (409), too many bookings
+            (429, see check_booking_rate), or the slot is not bookable or was just taken (409)
+    """
+    with transaction.atomic():
+        link = BookingLink.objects.select_related('user').filter(slug=slug, is_active=True).first()
+        if link is None:
+            raise BookingError('Booking link not found', 'NOT_FOUND', 404)
+
+        # One lock per owner: bookings through any of their links queue up here
+        integration = CalendarIntegration.objects.select_for_update().filter(user=link.user).first()
+        if integration is None or not integration.is_token_valid():
+            raise BookingError('This calendar is not accepting bookings right now', 'CALENDAR_UNAVAILABLE', 409)
+        # Under the owner lock, so concurrent requests against their links cannot all pass
+        check_booking_rate(link, email, client_ip)
+
+        offered = {datetime.fromisoformat(slot['start_datetime']) for slot in booking_slots(link)['slots']}
+        end = start + timedelta(minutes=link.duration_minutes)
+        taken = Booking.objects.filter(
+            user=link.user, status__in=ACTIVE_BOOKING_STATUSES,
+            start_datetime__lt=end, end_datetime__gt=start,
+        ).exists()
+        if start not in offered or taken:
+            raise BookingError('That time is no longer available', 'SLOT_UNAVAILABLE', 409)
+
+        booking = Booking.objects.create(
+            link=link, user=link.user, start_datetime=start, end_datetime=end,
+            name=name, email=email, notes=notes, client_ip=client_ip, status='pending',
+        )
+        invalidate_booking_slots(link.user_id)
+    return booking
+
+
+def confirm_booking(booking: Booking) -> Booking:
+    """Create the Google event for a reserved booking; on failure the booking is marked failed"""
+    link = booking.link
+    integration = CalendarIntegration.objects.get(user=booking.user)
+    try:
+        service = GoogleCalendarService(integration.access_token, user_id=booking.user_id)
+        event = service.create_event(
+            title=f"{link.title}: {booking.name}",
+            start_datetime=booking.start_datetime,
+            end_datetime=booking.end_datetime,
+            description=booking.notes,
+            attendees=[booking.email],
+            calendar_id=link.calendar_id,
+        )
+    except GoogleCalendarServiceError as e:
+        print(f"[BOOKING] Failed to create event for booking {booking.pk}: {e}")
+        booking.status = 'failed'
+        booking.error = str(e)
+        booking.save(update_fields=['status', 'error', 'updated_at'])
+        invalidate_booking_slots(booking.user_id)
+        return booking
+
+    booking.status = 'confirmed'
+    booking.google_event_id = event.get('id', '')
+    booking.save(update_fields=['status', 'google_event_id', 'updated_at'])
+    record_created_event(booking.user, booking.start_datetime, booking.end_datetime,
+                         booking.google_event_id, event.get('title', ''))
+    return booking
+
+
+def serialize_booking(booking: Booking) -> Dict:
+    return {
+        'id': booking.pk,
+        'start_datetime': booking.start_datetime.isoformat(),
+        'end_datetime': booking.end_datetime.isoformat(),
+        'name': booking.name,
+        'email': booking.email,
+        'status': booking.status,
+    }
+
+
+def serialize_booking_link(link: BookingLink) -> Dict:
+    return {
+        'slug': link.slug,
+        'title': link.title,
+        'description': link.description,
+        'duration_minutes': link.duration_minutes,
+        'days_ahead': link.days_ahead,
+        'min_notice_minutes': link.min_notice_minutes,
+        'is_active': link.is_active,
+    }
+
+
+def active_links(user) -> List[BookingLink]:
+    return list(BookingLink.objects.filter(user=user, is_active=True))
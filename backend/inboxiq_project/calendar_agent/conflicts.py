@@ -0,0 +1,258 @@
+# backend/inboxiq_project/calendar_agent/conflicts.py
+"""
+Per-user conflict index over mirrored busy time.
+
+Busy events (single events and expanded recurring occurrences) from the local mirror are
+kept in arrays sorted by start, next to the same time merged into disjoint busy blocks.
+Overlap checks and the nearest free slot for a proposed event are then bisect lookups
+instead of a get_events call per create.
+
+Each worker keeps the indexes it has built in process memory (an LRU of at most
+CALENDAR_CONFLICT_INDEX_MAX_USERS users), so a check neither unpickles the index nor
+queries the database. Each index records the version of the user's mirror it was built
+from: the latest updated_at of their CalendarSyncState rows, which every sync moves.
+invalidate_conflict_index() moves it too. A worker re-reads the version at most every
+CALENDAR_CONFLICT_VERSION_CHECK_SECONDS and rebuilds lazily when it has moved, so a change
+made through any worker reaches every worker within that interval. Events the app creates
+are added to this worker's copy in place.
+"""
+import copy
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import CalendarSyncState
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover - Python < 3.9
+    from backports.zoneinfo import ZoneInfo
+
+_UTC = ZoneInfo('UTC')
+
+# user_id -> ConflictIndex, least recently used first
+_indexes: 'OrderedDict[int, ConflictIndex]' = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def mirror_version(user_id):
+    """When the user's mirror last changed, or None if their calendars were never synced"""
+    return CalendarSyncState.objects.filter(user_id=user_id).aggregate(version=Max('updated_at'))['version']
+
+
+def invalidate_conflict_index(user_id) -> None:
+    # Other processes hold their own copy: moving the version makes them rebuild as well
+    CalendarSyncState.objects.filter(user_id=user_id).update(updated_at=timezone.now())
+    with _indexes_lock:
+        _indexes.pop(user_id, None)
+
+
+def _cached_index(user_id) -> Optional['ConflictIndex']:
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+        if index is not None:
+            _indexes.move_to_end(user_id)
+        return index
+
+
+def _store_index(user_id, index: 'ConflictIndex') -> None:
+    with _indexes_lock:
+        _indexes[user_id] = index
+        _indexes.move_to_end(user_id)
+        while len(_indexes) > getattr(settings, 'CALENDAR_CONFLICT_INDEX_MAX_USERS', 1000):
+            _indexes.popitem(last=False)
+
+
+def _ts(value: datetime) -> float:
+    return value.timestamp()
+
+
+def _dt(value: float) -> datetime:
+    return datetime.fromtimestamp(value, tz=_UTC)
+
+
+class ConflictIndex:
+    """
+    Busy time for one user over [window_start, window_end)
+
+    Events are stored as parallel lists sorted by start (epoch seconds) so the candidates
+    for an overlap are one bisect away; `_max_duration` bounds how far back a still-running
+    event can have started. Merged busy blocks answer "is this free" and "where is the
+    nearest gap" without looking at individual events.
+    """
+
+    def __init__(self, events: Iterable[Tuple[datetime, datetime, str, str]],
+                 window_start: datetime, window_end: datetime):
+        self.window_start = _ts(window_start)
+        self.window_end = _ts(window_end)
+        self._starts: List[float] = []
+        self._entries: List[Tuple[float, float, str, str]] = []
+        self._max_duration = 0.0
+        self._block_starts: List[float] = []
+        self._block_ends: List[float] = []
+        # mirror_version() of the data the index was built from, when it was built and
+        # when that version was last confirmed current (time.monotonic())
+        self.version = None
+        self.built_at = self.checked_at = time.monotonic()
+
+        entries = sorted((_ts(start), _ts(end), event_id or '', title or '')
+                         for start, end, event_id, title in events if end > start)
+        for entry in entries:
+            self._entries.append(entry)
+            self._starts.append(entry[0])
+            self._max_duration = max(self._max_duration, entry[1] - entry[0])
+            if self._block_ends and entry[0] <= self._block_ends[-1]:
+                self._block_ends[-1] = max(self._block_ends[-1], entry[1])
+            else:
+                self._block_starts.append(entry[0])
+                self._block_ends.append(entry[1])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def covers(self, start: datetime, end: datetime) -> bool:
+        return self.window_start <= _ts(start) and _ts(end) <= self.window_end
+
+    def copy(self) -> 'ConflictIndex':
+        """An independent copy, for changing an index other threads may be reading"""
+        other = copy.copy(self)
+        other._starts = list(self._starts)
+        other._entries = list(self._entries)
+        other._block_starts = list(self._block_starts)
+        other._block_ends = list(self._block_ends)
+        return other
+
+    def add(self, start: datetime, end: datetime, event_id: str = '', title: str = '') -> None:
+        """Insert one event (e.g. just created locally) and merge it into the busy blocks"""
+        s, e = _ts(start), _ts(end)
+        if e <= s:
+            return
+        position = bisect_right(self._starts, s)
+        self._starts.insert(position, s)
+        self._entries.insert(position, (s, e, event_id or '', title or ''))
+        self._max_duration = max(self._max_duration, e - s)
+
+        # Blocks overlapping or touching [s, e) collapse into one
+        first = bisect_left(self._block_ends, s)
+        last = bisect_right(self._block_starts, e)
+        if first < last:
+            s = min(s, self._block_starts[first])
+            e = max(e, self._block_ends[last - 1])
+        self._block_starts[first:last] = [s]
+        self._block_ends[first:last] = [e]
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        # First block that ends after `start`; free if it also starts at or after `end`
+        position = bisect_right(self._block_ends, _ts(start))
+        return position == len(self._block_starts) or self._block_starts[position] >= _ts(end)
+
+    def conflicts(self, start: datetime, end: datetime) -> List[Dict]:
+        """Events overlapping [start, end), ordered by start"""
+        s, e = _ts(start), _ts(end)
+        low = bisect_left(self._starts, s - self._max_duration)
+        high = bisect_left(self._starts, e)
+        return [
+            {'id': event_id, 'title': title, 'start_datetime': _dt(event_start), 'end_datetime': _dt(event_end)}
+            for event_start, event_end, event_id, title in self._entries[low:high]
+            if event_end > s
+        ]
+
+    def nearest_free(self, start: datetime, duration: timedelta,
+                     not_before: Optional[datetime] = None) -> Optional[Tuple[datetime, datetime]]:
+        """
+        The free slot of `duration` closest to `start`, looking both later and earlier
+        (but not before `not_before`). Returns (start, end), or None if nothing fits in the window.
+        """
+        s, length = _ts(start), duration.total_seconds()
+        floor = max(self.window_start, _ts(not_before) if not_before else self.window_start)
+        candidates = []
+
+        # Later: push past each block that the slot would overlap
+        position = bisect_right(self._block_ends, s)
+        later = s
+        while position < len(self._block_starts) and self._block_starts[position] < later + length:
+            later = max(later, self._block_ends[position])
+            position += 1
+        if later + length <= self.window_end:
+            candidates.append(later)
+
+        # Earlier: end the slot before each block it would overlap
+        position = bisect_left(self._block_starts, s + length) - 1
+        earlier = s
+        while position >= 0 and self._block_ends[position] > earlier:
+            earlier = min(earlier, self._block_starts[position] - length)
+            position -= 1
+        if earlier >= floor:
+            candidates.append(earlier)
+
+        if not candidates:
+            return None
+        best = min(candidates, key=lambda candidate: (abs(candidate - s), candidate))
+        return _dt(best), _dt(best + length)
+
+
+def build_conflict_index(user, start: datetime, end: datetime) -> ConflictIndex:
+    """Index the user's mirrored busy events (recurring series expanded) in [start, end)"""
+    from .sync import local_events
+
+    events = local_events(user, start, end, busy_only=True)
+    return ConflictIndex(
+        ((event.start_datetime, event.end_datetime, event.google_event_id, event.title) for event in events),
+        start, end,
+    )
+
+
+def conflict_index(user, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[ConflictIndex]:
+    """
+    The user's conflict index from this worker's memory, built on first use over the sync
+    window (the past day through CALENDAR_SYNC_FUTURE_DAYS ahead).
+
+    A range outside that window gets a one-off index that is not kept. Returns None if
+    the user's calendars have never been synced, since an empty index would report no conflicts.
+    An index older than CALENDAR_CONFLICT_INDEX_SECONDS, or built from an older version of
+    the mirror, is rebuilt.
+    """
+    index = _cached_index(user.pk)
+    now = time.monotonic()
+    if index is not None and now - index.built_at >= getattr(settings, 'CALENDAR_CONFLICT_INDEX_SECONDS', 3600):
+        index = None
+    if index is None or now - index.checked_at >= getattr(settings, 'CALENDAR_CONFLICT_VERSION_CHECK_SECONDS', 5):
+        version = mirror_version(user.pk)
+        if version is None:
+            return None
+        if index is not None and index.version == version:
+            index.checked_at = now
+        else:
+            today = timezone.now()
+            index = build_conflict_index(
+                user, today - timedelta(days=1),
+                today + timedelta(days=getattr(settings, 'CALENDAR_SYNC_FUTURE_DAYS', 365)),
+            )
+            index.version = version
+            _store_index(user.pk, index)
+
+    if start is not None and end is not None and not index.covers(start, end):
+        return build_conflict_index(user, start, end)
+    return index
+
+
+def record_created_event(user, start: datetime, end: datetime, event_id: str = '', title: str = '') -> None:
+    """
+    Add an event the app just created to this worker's index, if it has one
+
+    The index is copied and swapped rather than changed under readers. Other workers see
+    the event once the next sync moves the mirror version.
+    """
+    with _indexes_lock:
+        index = _indexes.get(user.pk)
+        if index is not None:
+            updated = index.copy()
+            updated.add(start, end, event_id, title)
+            _indexes[user.pk] = updated
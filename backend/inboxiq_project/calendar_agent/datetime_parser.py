@@ -0,0 +1,579 @@
+# backend/inboxiq_project/calendar_agent/datetime_parser.py
+"""
+Rule-based parser for dates, times and durations in scheduling messages.
+
+Turns "lunch with Sam tomorrow at 1pm for 45 minutes" into timezone-aware start/end datetimes
+in the user's time zone, without a model call. Each recognised phrase is masked out of the
+text once matched, so later patterns cannot reuse it, and whatever is left (minus scheduling
+verbs) becomes the event title.
+
+The result carries a confidence score. Callers only fall back to the model when it is below
+settings.CALENDAR_PARSER_MIN_CONFIDENCE.
+"""
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.utils import timezone
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover - Python < 3.9
+    from backports.zoneinfo import ZoneInfo
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+WEEKDAYS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+RRULE_DAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+# RRULE FREQ for each recurrence word
+FREQUENCIES = {
+    'day': 'DAILY', 'daily': 'DAILY', 'weekday': 'WEEKLY', 'week': 'WEEKLY', 'weekly': 'WEEKLY',
+    'fortnightly': 'WEEKLY', 'month': 'MONTHLY', 'monthly': 'MONTHLY',
+    'year': 'YEARLY', 'yearly': 'YEARLY', 'annually': 'YEARLY',
+}
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12,
+}
+# Default clock time for vague parts of the day
+DAYPARTS = {'morning': time(9), 'afternoon': time(14), 'evening': time(18), 'tonight': time(19)}
+TIMEZONE_ABBREVIATIONS = {
+    'utc': 'UTC', 'gmt': 'UTC',
+    'et': 'America/New_York', 'est': 'America/New_York', 'edt': 'America/New_York',
+    'ct': 'America/Chicago', 'cst': 'America/Chicago', 'cdt': 'America/Chicago',
+    'mt': 'America/Denver', 'mst': 'America/Denver', 'mdt': 'America/Denver',
+    'pt': 'America/Los_Angeles', 'pst': 'America/Los_Angeles', 'pdt': 'America/Los_Angeles',
+    'bst': 'Europe/London', 'cet': 'Europe/Paris', 'cest': 'Europe/Paris', 'ist': 'Asia/Kolkata',
+}
+
+_MONTH = r'(?P<month>jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?'
+_DAY = r'(?P<day>[0-3]?\d)(?:st|nd|rd|th)?'
+_YEAR = r'(?:,?\s+(?P<year>\d{4}))?'
+_WEEKDAY = r'(?P<weekday>mon|tue|tues|wed|thu|thur|thurs|fri|sat|sun)(?:day|nesday|sday|urday|s)?'
+_CLOCK = r'(?P<{p}h>[01]?\d|2[0-3])(?::(?P<{p}m>[0-5]\d))?\s*(?P<{p}ap>[ap]\.?m\.?\b)?|(?P<{p}word>noon|midday|midnight)'
+_NUMBER = r'(?P<num>\d+(?:\.\d+)?|an?|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve)'
+_TZ = r'(?:\s+(?P<tz>' + '|'.join(TIMEZONE_ABBREVIATIONS) + r')\b)?'
+
+ISO_DATE = re.compile(r'\b(?:on\s+)?(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})\b')
+DURATION = re.compile(
+    r'\b(?:for\s+)?(?:'
+    r'(?P<half>half\s+an?\s+hour)'
+    r'|(?P<hour_half>an?|one)\s+hour\s+and\s+a\s+half'
+    r'|' + _NUMBER + r'\s*-?\s*(?P<unit>hours?|hrs?|h|minutes?|mins?|m)\b'
+    r'(?:\s*(?:and\s+)?(?P<num2>\d+)\s*(?P<unit2>minutes?|mins?|m)\b)?'
+    r')(?!\s*(?:ago|from now|later))'
+)
+TIME_RANGE = re.compile(
+    r'\b(?P<prefix>from\s+|between\s+)?(?:' + _CLOCK.format(p='a') + r')\s*'
+    r'(?P<sep>-|–|—|to|until|till|and)\s*(?:' + _CLOCK.format(p='b') + r')' + _TZ
+)
+DAY_MONTH = re.compile(r'\b(?:on\s+)?(?:the\s+)?' + _DAY + r'\s+(?:of\s+)?' + _MONTH + _YEAR + r'\b')
+MONTH_DAY = re.compile(r'\b(?:on\s+)?' + _MONTH + r'\s+' + _DAY + r'\b' + _YEAR)
+NUMERIC_DATE = re.compile(r'\b(?:on\s+)?(?P<a>\d{1,2})/(?P<b>\d{1,2})(?:/(?P<year>\d{2}|\d{4}))?\b')
+TIME = re.compile(r'\b(?:at\s+|@\s*|by\s+|around\s+)?(?:'
+                  r'(?P<h>[01]?\d|2[0-3])(?::(?P<m>[0-5]\d))?\s*(?P<ap>[ap]\.?m\.?)(?![a-z])'
+                  r'|(?P<h24>[01]?\d|2[0-3]):(?P<m24>[0-5]\d)\b'
+                  r'|(?P<word>noon|midday|midnight))' + _TZ)
+BARE_HOUR = re.compile(r'\b(?:at|@)\s+(?P<h>1[0-2]|[1-9])\b(?!\s*(?:[:/.-]|%|hours?|hrs?|mins?|minutes?|days?|weeks?|people|of)\b)')
+RELATIVE_DAY = re.compile(r'\b(?P<word>the\s+day\s+after\s+tomorrow|day\s+after\s+tomorrow|tomorrow|tmrw|tmr|today|tonight)\b')
+IN_PERIOD = re.compile(r'\bin\s+' + _NUMBER + r'\s+(?P<unit>days?|weeks?)\b')
+# "in 2 hours", "in half an hour", "90 minutes from now": a start relative to now
+RELATIVE_OFFSET = re.compile(
+    r'\b(?P<lead>in\s+)?(?:'
+    r'(?P<half>half\s+an\s+hour)'
+    r'|' + _NUMBER + r'\s*(?P<unit>hours?|hrs?|h|minutes?|mins?|m)\b(?P<and_half>\s+and\s+a\s+half)?'
+    r'(?:\s*(?:and\s+)?(?P<num2>\d+)\s*(?P<unit2>minutes?|mins?|m)\b)?'
+    r')(?(lead)|\s+from\s+now\b)'
+)
+WEEKDAY = re.compile(r'\b(?:on\s+)?(?P<which>next|this|coming)?\s*' + _WEEKDAY
+                     + r'\b(?P<next_week>\s+(?:of\s+)?next\s+week)?')
+# "every day", "every other Tuesday", "weekly"
+RECURRENCE = re.compile(r'\b(?:(?:every|each)\s+(?P<other>other\s+)?(?:(?P<unit>day|weekday|week|month|year)|'
+                        + _WEEKDAY + r')|(?P<adverb>daily|weekly|fortnightly|monthly|yearly|annually))\b')
+PERIOD = re.compile(r'\b(?P<which>next|this)\s+(?P<unit>week|weekend|month)\b|\bthis\s+weekend\b')
+ORDINAL_DAY = re.compile(r'\b(?:on\s+)?the\s+(?P<day>[0-3]?\d)(?:st|nd|rd|th)\b')
+DAYPART = re.compile(r'\b(?:in\s+the\s+|this\s+)?(?P<part>morning|afternoon|evening)\b')
+ALL_DAY = re.compile(r'\ball[\s-]day\b')
+
+# Scheduling verbs and filler around the title
+_LEADING_FILLER = re.compile(
+    r'^\s*(?:(?:please|pls|can\s+you|could\s+you|i\s+need\s+to|i\s+want\s+to|i\'d\s+like\s+to|let\'s)\s+)*'
+    r'(?:(?:schedule|book|create|add|set\s+up|setup|put|plan|arrange|organi[sz]e|make)\s+)?'
+    r'(?:(?:me|us)\s+)?(?:(?:a|an|the|my|new)\s+)*',
+    re.IGNORECASE,
+)
+_TRAILING_FILLER = re.compile(
+    r'(?:\s+(?:to|on|in|into)\s+(?:my|the)\s+calendar|\s+(?:on|at|for|from|in|by|around|starting|this|next))+\s*$',
+    re.IGNORECASE,
+)
+_LEFTOVER_NUMBER = re.compile(r'(?<![\w:])\d+(?![\w:])')
+
+
+class ParsedDateTime:
+    """What the parser found in a message; datetimes are aware, in the user's (or stated) time zone."""
+
+    def __init__(self, time_zone: str):
+        self.time_zone = time_zone
+        self.date: Optional[date] = None
+        self.start_time: Optional[time] = None
+        self.end_time: Optional[time] = None
+        self.duration_minutes: Optional[int] = None
+        self.all_day = False
+        self.recurrence: Optional[str] = None  # RRULE, e.g. 'RRULE:FREQ=WEEKLY;BYDAY=TU'
+        self.start: Optional[datetime] = None
+        self.end: Optional[datetime] = None
+        self.title = ''
+        self.confidence = 0.0
+        self.matched: List[str] = []
+        self.notes: List[str] = []  # why confidence was reduced
+
+    @property
+    def found(self) -> bool:
+        return self.date is not None or self.start_time is not None
+
+    def as_extracted_info(self) -> Dict:
+        """Fields in the shape of the model's `extracted_info` (JSON-serialisable)."""
+        info = {
+            'title': self.title,
+            'date': self.date.isoformat() if self.date else None,
+            'time': self.start_time.strftime('%H:%M') if self.start_time else None,
+            'duration': self.duration_minutes,
+            'start_datetime': self.start.isoformat() if self.start else None,
+            'end_datetime': self.end.isoformat() if self.end else None,
+            'all_day': self.all_day,
+            'recurrence': [self.recurrence] if self.recurrence else None,
+            'time_zone': self.time_zone,
+            'parser_confidence': round(self.confidence, 2),
+        }
+        return {k: v for k, v in info.items() if v not in (None, '')}
+
+
+class _Text:
+    """Lowercased working copy of the message with a mask of consumed spans."""
+
+    def __init__(self, original: str):
+        self.original = original
+        # Keep positions aligned with the original (a few characters lowercase to two)
+        self.lower = ''.join(c.lower() if len(c.lower()) == 1 else c for c in original)
+        self.consumed = [False] * len(original)
+
+    def search(self, pattern: re.Pattern):
+        """Matches that do not touch consumed text; an overlapping match is retried one character on."""
+        pos = 0
+        while pos <= len(self.lower):
+            match = pattern.search(self.lower, pos)
+            if match is None:
+                return
+            if any(self.consumed[match.start():match.end()]):
+                pos = match.start() + 1
+                continue
+            yield match
+            pos = max(match.end(), match.start() + 1)
+
+    def consume(self, match) -> str:
+        for i in range(match.start(), match.end()):
+            self.consumed[i] = True
+        return match.group(0).strip()
+
+    def remainder(self) -> str:
+        return ''.join(' ' if used else ch for ch, used in zip(self.original, self.consumed))
+
+
+def _number(value: str) -> float:
+    return float(NUMBER_WORDS[value]) if value in NUMBER_WORDS else float(value)
+
+
+def _clock(match, prefix: str = '') -> Tuple[Optional[time], Optional[str]]:
+    """(time, meridiem) from a _CLOCK match; meridiem is 'a'/'p' or None if not stated."""
+    word = match.group(f'{prefix}word')
+    if word:
+        return (time(0) if word == 'midnight' else time(12)), 'x'
+    hour = int(match.group(f'{prefix}h'))
+    minute = int(match.group(f'{prefix}m') or 0)
+    meridiem = match.group(f'{prefix}ap')
+    meridiem = meridiem[0] if meridiem else None
+    return _apply_meridiem(hour, minute, meridiem), meridiem
+
+
+def _apply_meridiem(hour: int, minute: int, meridiem: Optional[str]) -> Optional[time]:
+    if meridiem in ('a', 'p'):
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem == 'p' else 0)
+    return time(hour, minute)
+
+
+def _is_12_hour(hour_text: str) -> bool:
+    """A written hour that could be on a 12-hour clock ("3", not "03" or "15")"""
+    return not hour_text.startswith('0') and 1 <= int(hour_text) <= 12
+
+
+def _guess_meridiem(hour: int) -> int:
+    """A bare '3' in a meeting context almost always means 3pm; 8-11 mean morning."""
+    if 1 <= hour <= 6:
+        return hour + 12
+    if hour == 12:
+        return 12
+    return hour
+
+
+def _next_year_if_past(candidate_month: int, candidate_day: int, year: Optional[str], today: date) -> Optional[date]:
+    try:
+        if year:
+            return date(int(year), candidate_month, candidate_day)
+        result = date(today.year, candidate_month, candidate_day)
+        if result < today:
+            result = date(today.year + 1, candidate_month, candidate_day)
+        return result
+    except ValueError:
+        return None
+
+
+def parse(text: str, time_zone: str = 'UTC', now: Optional[datetime] = None,
+          date_order: str = 'MDY') -> ParsedDateTime:
+    """
+    Parse dates, times, ranges and durations out of `text`.
+
+    Args:
+        text: The user's message
+        time_zone: IANA time zone the user means when no zone is stated
+        now: Reference time (defaults to the current time)
+        date_order: 'MDY' or 'DMY' for ambiguous numeric dates like 3/4
+
+    Returns:
+        ParsedDateTime with start/end filled when a date or time was found
+    """
+    tz = ZoneInfo(time_zone or 'UTC')
+    now = (now or timezone.now()).astimezone(tz)
+    today = now.date()
+    result = ParsedDateTime(time_zone or 'UTC')
+    work = _Text(text or '')
+    penalty = 0.0
+    stated_zone = None
+    meridiem_guessed = False
+    invalid_date = False  # an explicit date that does not exist ("feb 30")
+    roll_if_past = False  # "this monday" said on a Monday after the time has gone
+    recurring_weekday = None
+
+    # --- Explicit calendar dates ---
+    for match in work.search(ISO_DATE):
+        try:
+            result.date = date(int(match.group('year')), int(match.group('month')), int(match.group('day')))
+            result.matched.append(work.consume(match))
+        except ValueError:
+            invalid_date = True
+            continue
+        break
+
+    # --- Durations (before times, so "for 2 hours" is not read as a clock time) ---
+    for match in work.search(DURATION):
+        if work.lower[:match.start()].rstrip().endswith(('in', 'within')):
+            # "in 2 hours" is a start offset, not a length
+            continue
+        if match.group('half'):
+            minutes = 30
+        elif match.group('hour_half'):
+            minutes = 90
+        else:
+            amount = _number(match.group('num'))
+            unit = match.group('unit')
+            minutes = amount * 60 if unit.startswith('h') else amount
+            if match.group('num2'):
+                minutes += int(match.group('num2'))
+        if 0 < minutes <= 24 * 60:
+            result.duration_minutes = int(round(minutes))
+            result.matched.append(work.consume(match))
+            break
+
+    # --- Time ranges: "2-4pm", "from 10 to 11:30", "between 1pm and 2pm" ---
+    for match in work.search(TIME_RANGE):
+        # Group names come from _CLOCK: ah/am/aap/aword for the start, bh/bm/bap/bword for the end
+        start, start_mer = _clock(match, 'a')
+        end, end_mer = _clock(match, 'b')
+        has_minutes = match.group('am') or match.group('bm')
+        if match.group('sep') == 'and' and not match.group('prefix'):
+            continue
+        if not (start_mer or end_mer or has_minutes or match.group('prefix')) or start is None or end is None:
+            continue
+        if start_mer is None and end_mer in ('a', 'p'):
+            # "2-4pm": the start shares the end's meridiem unless that puts it after the end ("11-1pm")
+            hour, minute = int(match.group('ah')), int(match.group('am') or 0)
+            start = _apply_meridiem(hour, minute, end_mer)
+            if start is not None and start >= end:
+                start = _apply_meridiem(hour, minute, 'a' if end_mer == 'p' else 'p')
+        elif start_mer is None and end_mer is None and _is_12_hour(match.group('ah')) and _is_12_hour(match.group('bh')):
+            start = time(_guess_meridiem(start.hour), start.minute)
+            end = time(_guess_meridiem(end.hour), end.minute)
+            meridiem_guessed = True
+        if start is None:
+            continue
+        result.start_time, result.end_time = start, end
+        stated_zone = match.group('tz') or stated_zone
+        result.matched.append(work.consume(match))
+        break
+
+    # --- Dates with month names: "oct 21", "21st of October 2026" ---
+    for pattern in (MONTH_DAY, DAY_MONTH):
+        if result.date:
+            break
+        for match in work.search(pattern):
+            month = MONTHS[match.group('month')[:3]]
+            parsed = _next_year_if_past(month, int(match.group('day')), match.group('year'), today)
+            if parsed:
+                result.date = parsed
+                result.matched.append(work.consume(match))
+                break
+            invalid_date = True
+
+    # --- Numeric dates: "10/21", "21/10/2026" ---
+    if not result.date:
+        for match in work.search(NUMERIC_DATE):
+            a, b = int(match.group('a')), int(match.group('b'))
+            if a > 12 and b <= 12:
+                month, day = b, a
+            elif b > 12 and a <= 12:
+                month, day = a, b
+            else:
+                month, day = (a, b) if date_order == 'MDY' else (b, a)
+                if a != b:
+                    penalty += 0.15
+                    result.notes.append('ambiguous numeric date')
+            year = match.group('year')
+            if year and len(year) == 2:
+                year = str(2000 + int(year))
+            parsed = _next_year_if_past(month, day, year, today)
+            if parsed:
+                result.date = parsed
+                result.matched.append(work.consume(match))
+                break
+            invalid_date = True
+
+    # --- Clock times: "3pm", "15:30", "noon" ---
+    if result.start_time is None:
+        for match in work.search(TIME):
+            if match.group('word'):
+                result.start_time = time(0) if match.group('word') == 'midnight' else time(12)
+            elif match.group('ap'):
+                result.start_time = _apply_meridiem(int(match.group('h')), int(match.group('m') or 0),
+                                                    match.group('ap')[0])
+            else:
+                hour = int(match.group('h24'))
+                if _is_12_hour(match.group('h24')):
+                    # "at 3:30" means the afternoon; "09:30" / "15:30" are unambiguous
+                    hour = _guess_meridiem(hour)
+                    meridiem_guessed = True
+                result.start_time = time(hour, int(match.group('m24')))
+            if result.start_time is None:
+                continue
+            stated_zone = match.group('tz') or stated_zone
+            result.matched.append(work.consume(match))
+            break
+
+    if result.start_time is None:
+        for match in work.search(BARE_HOUR):
+            result.start_time = time(_guess_meridiem(int(match.group('h'))))
+            meridiem_guessed = True
+            result.matched.append(work.consume(match))
+            break
+
+    # --- Recurrence: "every day", "every other Tuesday", "weekly" ---
+    for match in work.search(RECURRENCE):
+        word = match.group('unit') or match.group('adverb')
+        if word is None:
+            recurring_weekday = WEEKDAYS[match.group('weekday')[:3]]
+            rule = f"FREQ=WEEKLY;BYDAY={RRULE_DAYS[recurring_weekday]}"
+        else:
+            rule = f"FREQ={FREQUENCIES[word]}"
+            if word == 'weekday':
+                rule += ';BYDAY=MO,TU,WE,TH,FR'
+        if match.group('other') or word == 'fortnightly':
+            rule += ';INTERVAL=2'
+        result.recurrence = 'RRULE:' + rule
+        result.matched.append(work.consume(match))
+        break
+
+    # --- Offsets from now: "in 2 hours", "in 30 minutes" ---
+    if result.start_time is None and result.date is None:
+        for match in work.search(RELATIVE_OFFSET):
+            if match.group('half'):
+                minutes = 30
+            else:
+                amount = _number(match.group('num')) + (0.5 if match.group('and_half') else 0)
+                minutes = amount * 60 if match.group('unit').startswith('h') else amount
+                if match.group('num2'):
+                    minutes += int(match.group('num2'))
+            if not 0 < minutes <= 7 * 24 * 60:
+                continue
+            # Add in UTC so an offset across a DST change lands on the right wall-clock time
+            start = (now.astimezone(ZoneInfo('UTC')) + timedelta(minutes=minutes)).astimezone(tz)
+            result.date, result.start_time = start.date(), time(start.hour, start.minute, fold=start.fold)
+            result.matched.append(work.consume(match))
+            break
+
+    # --- Relative dates ---
+    if not result.date:
+        for match in work.search(RELATIVE_DAY):
+            word = match.group('word')
+            offset = 2 if 'after' in word else 1 if word.startswith('tm') or word == 'tomorrow' else 0
+            result.date = today + timedelta(days=offset)
+            if word == 'tonight' and result.start_time is None:
+                result.start_time = DAYPARTS['tonight']
+                penalty += 0.1
+                result.notes.append('vague time of day')
+            result.matched.append(work.consume(match))
+            break
+
+    if not result.date:
+        for match in work.search(IN_PERIOD):
+            amount = int(_number(match.group('num')))
+            days = amount * 7 if match.group('unit').startswith('week') else amount
+            result.date = today + timedelta(days=days)
+            result.matched.append(work.consume(match))
+            break
+
+    if not result.date and recurring_weekday is not None:
+        # "every tuesday": the series starts on the next one
+        result.date = today + timedelta(days=(recurring_weekday - today.weekday()) % 7 or 7)
+
+    if not result.date:
+        for match in work.search(WEEKDAY):
+            target = WEEKDAYS[match.group('weekday')[:3]]
+            which = match.group('which')
+            if which == 'next' or match.group('next_week'):
+                # The named day in the following Monday-to-Sunday week
+                monday = today - timedelta(days=today.weekday())
+                result.date = monday + timedelta(days=7 + target)
+            elif which == 'this':
+                result.date = today + timedelta(days=(target - today.weekday()) % 7)
+                roll_if_past = result.date == today
+            else:
+                # Bare or "coming": the next such day, never today
+                result.date = today + timedelta(days=(target - today.weekday()) % 7 or 7)
+            result.matched.append(work.consume(match))
+            break
+
+    if not result.date:
+        for match in work.search(PERIOD):
+            unit = match.group('unit') or 'weekend'
+            monday = today - timedelta(days=today.weekday())
+            if unit == 'weekend':
+                result.date = monday + timedelta(days=5 + (7 if match.group('which') == 'next' else 0))
+            elif unit == 'week':
+                result.date = monday + timedelta(days=7) if match.group('which') == 'next' else today
+            else:
+                first = today.replace(day=1)
+                result.date = (first + timedelta(days=32)).replace(day=1) if match.group('which') == 'next' else today
+            penalty += 0.2
+            result.notes.append('vague date')
+            result.matched.append(work.consume(match))
+            break
+
+    if not result.date:
+        for match in work.search(ORDINAL_DAY):
+            day = int(match.group('day'))
+            parsed = _next_year_if_past(today.month, day, None, today) if day >= today.day else None
+            if parsed is None:
+                nxt = (today.replace(day=1) + timedelta(days=32)).replace(day=1)
+                try:
+                    parsed = nxt.replace(day=day)
+                except ValueError:
+                    continue
+            result.date = parsed
+            result.matched.append(work.consume(match))
+            break
+
+    # --- Vague parts of the day ---
+    if result.start_time is None:
+        for match in work.search(DAYPART):
+            result.start_time = DAYPARTS[match.group('part')]
+            penalty += 0.2
+            result.notes.append('vague time of day')
+            result.matched.append(work.consume(match))
+            break
+
+    for match in work.search(ALL_DAY):
+        result.all_day = True
+        result.matched.append(work.consume(match))
+        break
+
+    # --- Assemble ---
+    if meridiem_guessed and result.start_time is not None:
+        # "tonight at 8" / "dinner at 7": the guessed morning hour is really the evening one
+        if result.start_time.hour < 12 and re.search(r'\b(?:tonight|evening|afternoon|dinner|drinks)\b', work.lower):
+            result.start_time = time(result.start_time.hour + 12, result.start_time.minute)
+            if result.end_time is not None and result.end_time.hour < 12:
+                result.end_time = time(result.end_time.hour + 12, result.end_time.minute)
+
+    event_tz = ZoneInfo(TIMEZONE_ABBREVIATIONS[stated_zone]) if stated_zone else tz
+    if stated_zone:
+        result.time_zone = TIMEZONE_ABBREVIATIONS[stated_zone]
+
+    if result.start_time is not None and result.date is None:
+        # Time only: the next time that clock time comes round
+        candidate = datetime.combine(today, result.start_time, tzinfo=event_tz)
+        result.date = today if candidate > now else today + timedelta(days=1)
+        if result.recurrence and 'BYDAY=MO,TU' in result.recurrence and result.date.weekday() >= 5:
+            result.date += timedelta(days=7 - result.date.weekday())
+        penalty += 0.05
+        result.notes.append('date inferred from time')
+
+    if roll_if_past and result.start_time is not None \
+            and datetime.combine(result.date, result.start_time, tzinfo=event_tz) <= now:
+        # "this monday at 9am" on a Monday afternoon means next week's
+        result.date += timedelta(days=7)
+
+    if result.date is not None and result.all_day:
+        result.start_time = None
+        result.start = datetime.combine(result.date, time(0), tzinfo=event_tz)
+        result.end = result.start + timedelta(days=1)
+    elif result.date is not None and result.start_time is not None:
+        result.start = datetime.combine(result.date, result.start_time, tzinfo=event_tz)
+        if result.end_time is not None:
+            result.end = datetime.combine(result.date, result.end_time, tzinfo=event_tz)
+            if result.end <= result.start:
+                result.end += timedelta(days=1)
+            result.duration_minutes = int((result.end - result.start).total_seconds() // 60)
+        elif result.duration_minutes:
+            result.end = result.start + timedelta(minutes=result.duration_minutes)
+
+    if meridiem_guessed:
+        penalty += 0.15
+        result.notes.append('am/pm guessed')
+
+    if result.start is not None and not result.all_day and result.start <= now:
+        penalty += 0.35
+        result.notes.append('start is in the past')
+
+    if invalid_date or any(True for pattern in (ISO_DATE, MONTH_DAY, DAY_MONTH, NUMERIC_DATE)
+                           for _ in work.search(pattern)):
+        # A date the user wrote but we could not use: never replace it with a guess
+        penalty += 0.5
+        result.notes.append('unparsed date')
+
+    remainder = work.remainder()
+    if _LEFTOVER_NUMBER.search(remainder):
+        penalty += 0.2
+        result.notes.append('unparsed number')
+
+    result.title = _title_from(remainder)
+
+    if result.start is not None:
+        base = 0.95 if (result.end is not None or result.all_day) else 0.9
+    elif result.date is not None:
+        base = 0.55
+    else:
+        base = 0.0
+    result.confidence = max(0.0, min(0.99, base - penalty)) if base else 0.0
+    return result
+
+
+def _title_from(remainder: str) -> str:
+    title = re.sub(r'\s+', ' ', remainder).strip(' ,.;:!?-')
+    title = _LEADING_FILLER.sub('', title)
+    previous = None
+    while previous != title:
+        previous = title
+        title = _TRAILING_FILLER.sub('', title).strip(' ,.;:!?-')
+    return title[:1].upper() + title[1:] if title else ''
@@ -0,0 +1,260 @@
+# backend/inboxiq_project/calendar_agent/event_templates.py
+"""
+Template-driven event creation.
+
+Each user's EventTemplate rows are compiled once into a TemplateIndex (token -> templates,
+with the title and description templates pre-split into literal text and placeholders)
+and cached per user. A message that names a template ("book my usual 1:1 with Sam
+tomorrow at 3") is matched with a few dict lookups and rendered into a draft event
+without a model call. The cache may be per process, so each index records the count and
+latest updated_at of the templates it was built from and is rebuilt when either moves;
+a template saved or deleted through any worker is picked up by all of them.
+
+Placeholders in title_template / description_template: {attendee} (first person named),
+{attendees}, {date}, {time} and {user}. Unknown placeholders render empty.
+
+usage_count counts events actually created from a template (recorded when a chat draft is
+confirmed, not when it is drafted). It is not written per use: uses are counted in memory
+and flushed in one UPDATE per distinct increment once CALENDAR_TEMPLATE_USAGE_FLUSH_COUNT
+have piled up, by a timer CALENDAR_TEMPLATE_USAGE_FLUSH_SECONDS after the first pending use
+(so a quiet worker still writes them), and at interpreter exit.
+"""
+import atexit
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F, Max
+
+from .models import EventTemplate
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+(?::[a-z0-9]+)*')
+# Words left hanging when the placeholder after them rendered empty ("... on {date}")
+_DANGLING_RE = re.compile(r'(?:\s+(?:on|at|with|for|and|by))+$', re.IGNORECASE)
+
+
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall((text or '').lower())
+
+
+def _compile(template: str) -> List[Tuple[str, Optional[str]]]:
+    """'1:1 with {attendee}' -> [('1:1 with ', 'attendee')]"""
+    try:
+        return [(literal, field) for literal, field, _, _ in Formatter().parse(template or '')]
+    except ValueError:
+        # Unbalanced braces: use the text as written
+        return [(template or '', None)]
+
+
+def _render(pieces: List[Tuple[str, Optional[str]]], context: Dict[str, str]) -> str:
+    text = ''.join(literal + (context.get(field, '') if field else '') for literal, field in pieces)
+    text = re.sub(r'\s+', ' ', text).strip(' ,.;:-')
+    if any(field and not context.get(field) for _, field in pieces):
+        text = _DANGLING_RE.sub('', text)
+    return text
+
+
+class CompiledTemplate:
+    """An EventTemplate ready to match and render"""
+
+    def __init__(self, template: EventTemplate):
+        self.id = template.pk
+        self.name = template.name
+        self.name_tokens = tuple(dict.fromkeys(_tokens(template.name)))
+        # The name as it may appear in a message: its words with any punctuation between them
+        self.name_pattern = re.compile(
+            r'\b' + r'\W+'.join(re.escape(token) for token in _tokens(template.name)) + r'\b', re.IGNORECASE
+        ) if self.name_tokens else None
+        self.title = _compile(template.title_template)
+        self.description = _compile(template.description_template)
+        self.duration_minutes = template.default_duration_minutes
+        self.location = template.default_location
+        self.reminders = list(template.default_reminders or [])
+        self.usage_count = template.usage_count
+
+    def render(self, context: Dict[str, str]) -> Dict:
+        """Title, description, location, reminders and duration for a draft event"""
+        return {
+            'title': _render(self.title, context) or self.name,
+            'description': _render(self.description, context),
+            'location': self.location,
+            'reminders': self.reminders,
+            'duration': self.duration_minutes,
+        }
+
+
+class TemplateIndex:
+    """One user's templates, looked up by the words of their names"""
+
+    def __init__(self, templates, version=None):
+        self.templates = [CompiledTemplate(t) for t in templates]
+        # template_version() of the rows the index was built from
+        self.version = version
+        self._by_token: Dict[str, List[CompiledTemplate]] = defaultdict(list)
+        for template in self.templates:
+            for token in template.name_tokens:
+                self._by_token[token].append(template)
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def match(self, message: str) -> Optional[CompiledTemplate]:
+        """
+        The template whose name appears in the message: every word of the name must be
+        present. The longest name wins, then the one written as a phrase, then the most used.
+        """
+        words = set(_tokens(message))
+        candidates = {id(t): t for token in words for t in self._by_token.get(token, ())}
+        matches = [t for t in candidates.values() if all(token in words for token in t.name_tokens)]
+        if not matches:
+            return None
+        return max(matches, key=lambda t: (len(t.name_tokens), bool(t.name_pattern.search(message)),
+                                           t.usage_count))
+
+
+def template_index_cache_key(user_id) -> str:
+    return f'event_template_index:{user_id}'
+
+
+def invalidate_template_index(user_id) -> None:
+    cache.delete(template_index_cache_key(user_id))
+
+
+def template_version(user_id) -> Tuple[int, Optional[datetime]]:
+    """(count, latest updated_at) of the user's templates: a save or delete changes one of them"""
+    version = EventTemplate.objects.filter(user_id=user_id).aggregate(count=Count('id'), changed=Max('updated_at'))
+    return version['count'], version['changed']
+
+
+def template_index(user) -> TemplateIndex:
+    """The user's cached template index, (re)built from the database when the templates changed"""
+    key = template_index_cache_key(user.pk)
+    version = template_version(user.pk)
+    index = cache.get(key)
+    if index is None or index.version != version:
+        index = TemplateIndex(EventTemplate.objects.filter(user=user), version)
+        cache.set(key, index, getattr(settings, 'CALENDAR_TEMPLATE_INDEX_SECONDS', 3600))
+    return index
+
+
+def template_changed(sender, instance: EventTemplate, **kwargs) -> None:
+    """
+    post_save / post_delete receiver for EventTemplate (connected in CalendarAgentConfig.ready).
+    Only this process's copy is dropped; other processes notice the version change.
+    """
+    invalidate_template_index(instance.user_id)
+
+
+def template_context(attendee_names: List[str], start: Optional[datetime], user=None) -> Dict[str, str]:
+    """Values for the placeholders of a template"""
+    names = [str(name) for name in attendee_names or []]
+    if len(names) > 1:
+        attendees = f"{', '.join(names[:-1])} and {names[-1]}"
+    else:
+        attendees = names[0] if names else ''
+    return {
+        'attendee': names[0] if names else '',
+        'attendees': attendees,
+        'date': start.strftime('%b %d').replace(' 0', ' ') if start else '',
+        'time': start.strftime('%I:%M %p').lstrip('0') if start else '',
+        'user': (getattr(user, 'first_name', '') or getattr(user, 'username', '')) if user else '',
+    }
+
+
+def template_event_info(template: CompiledTemplate, parsed: Dict, attendee_names: List[str], user=None) -> Dict:
+    """
+    extracted_info for a draft event built from a template and the local parser's output
+
+    A duration or end time stated in the message wins over the template's default duration.
+    """
+    info = {key: value for key, value in parsed.items() if key not in ('title', 'parser_confidence')}
+    start = datetime.fromisoformat(parsed['start_datetime']) if parsed.get('start_datetime') else None
+    rendered = template.render(template_context(attendee_names, start, user))
+    if parsed.get('duration'):
+        rendered['duration'] = parsed['duration']
+    if start is not None and not parsed.get('end_datetime') and not parsed.get('all_day'):
+        info['end_datetime'] = (start + timedelta(minutes=rendered['duration'])).isoformat()
+    info.update(rendered)
+    info['template'] = {'id': template.id, 'name': template.name}
+    if attendee_names:
+        info['attendees'] = attendee_names
+    return info
+
+
+class TemplateUsage:
+    """
+    Process-wide, thread-safe buffer of template uses.
+    Pending increments are written with one UPDATE ... SET usage_count = usage_count + n
+    per distinct n, once `flush_count` uses are pending, or by a timer thread `flush_seconds`
+    after the first use that found nothing pending.
+    """
+
+    def __init__(self, flush_count: Optional[int] = None, flush_seconds: Optional[float] = None):
+        self.flush_count = flush_count
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    def record(self, template_id) -> None:
+        flush_count = self.flush_count or getattr(settings, 'CALENDAR_TEMPLATE_USAGE_FLUSH_COUNT', 50)
+        flush_seconds = self.flush_seconds or getattr(settings, 'CALENDAR_TEMPLATE_USAGE_FLUSH_SECONDS', 60)
+        with self._lock:
+            self._pending[template_id] += 1
+            due = (sum(self._pending.values()) >= flush_count
+                   or time.monotonic() - self._last_flush >= flush_seconds)
+            if not due and self._timer is None:
+                self._timer = threading.Timer(flush_seconds, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if due:
+            self.flush()
+
+    def _flush_on_timer(self) -> None:
+        try:
+            self.flush()
+        finally:
+            # The timer thread's own connection; nothing else will close it
+            connection.close()
+
+    def pending(self) -> Dict:
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self) -> int:
+        """Write pending increments; returns the number of uses written"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        by_increment = defaultdict(list)
+        for template_id, uses in pending.items():
+            by_increment[uses].append(template_id)
+        written = 0
+        for uses, template_ids in by_increment.items():
+            try:
+                EventTemplate.objects.filter(pk__in=template_ids).update(usage_count=F('usage_count') + uses)
+                written += uses * len(template_ids)
+            except Exception as e:
+                print(f"[EVENT_TEMPLATES] Failed to flush usage counts: {e}")
+                # Keep them for the next flush
+                with self._lock:
+                    self._pending.update({template_id: uses for template_id in template_ids})
+        return written
+
+
+template_usage = TemplateUsage()
+atexit.register(template_usage.flush)
@@ -1,31 +1,68 @@
 # backend/inboxiq_project/calendar_agent/google_calendar_service.py
 
 import json
+import time
 import traceback
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from .availability import find_free_slots, find_common_free_slots, find_recurring_free_slots, occurrence_days
+from .conflicts import mirror_version
+from .models import CalendarSyncState
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover - Python < 3.9
+    from backports.zoneinfo import ZoneInfo
+
+# freebusy.query accepts at most this many calendars per request
+FREEBUSY_MAX_CALENDARS = 50
+
+# Calendar API batch requests may contain at most this many calls
+BATCH_MAX_REQUESTS = 50
+
+# events.list allows up to 2500 per page; 250 keeps each page's memory small
+EVENTS_PAGE_SIZE = 250
+
+# Partial response for events.list: only the event fields _format_event and the sync engine read
+EVENT_FIELDS = (
+    'id,etag,status,summary,description,location,start,end,transparency,recurrence,'
+    'recurringEventId,originalStartTime,'
+    'attendees(email,displayName,responseStatus,optional,self),creator,organizer,htmlLink,'
+    'created,updated,reminders'
+)
+EVENT_LIST_FIELDS = f'items({EVENT_FIELDS}),nextPageToken,nextSyncToken'
+
 
 class GoogleCalendarServiceError(Exception):
     """Custom exception for Google Calendar API errors"""
     pass
 
 
+class SyncTokenExpiredError(GoogleCalendarServiceError):
+    """The stored syncToken was rejected (HTTP 410); a full resync is required"""
+    pass
+
+
 class GoogleCalendarService:
     """Service for interacting with Google Calendar API"""
     
-    def __init__(self, access_token: str):
+    def __init__(self, access_token: str, user_id: int = None):
         """
         Initialize the Google Calendar service
         
         Args:
             access_token: OAuth2 access token for Google Calendar API
+            user_id: Owner of the token; enables the per-user calendar list cache
         """
         self.access_token = access_token
+        self.user_id = user_id
         self.service = None
         self._initialize_service()
     
@@ -41,18 +78,56 @@ class GoogleCalendarService:
         except Exception as e:
             raise GoogleCalendarServiceError(f"Failed to initialize Google Calendar service: {str(e)}")
     
-    def list_calendars(self) -> List[Dict]:
+    def list_calendars(self, revalidate: bool = False) -> List[Dict]:
         """
         List all calendars for the authenticated user
         
+        With a user_id the list is cached per user, together with the version of the
+        user's mirror (mirror_version(), which every sync and invalidation moves in the
+        database) it was checked at. A cached list younger than
+        CALENDAR_LIST_REVALIDATE_SECONDS and checked at the current version is returned
+        without a request; otherwise it is revalidated with If-None-Match, so an
+        unchanged list costs a 304.
+        
+        The Django cache may be per process, but the version is shared: once a sync or
+        invalidate_calendar_list_cache() anywhere moves it, every process revalidates on
+        its next read. Syncs always revalidate, so the mirror itself never uses a stale list.
+        
+        Args:
+            revalidate: Skip the freshness window and always ask Google (still conditional)
+        
         Returns:
             List of calendar dictionaries
         """
+        cached = cache.get(calendar_list_cache_key(self.user_id)) if self.user_id else None
+        version = mirror_version(self.user_id) if self.user_id else None
+        if cached and not revalidate and cached.get('version') == version:
+            fresh_for = getattr(settings, 'CALENDAR_LIST_REVALIDATE_SECONDS', 300)
+            if time.time() - cached['checked_at'] < fresh_for:
+                return cached['calendars']
+        
         try:
-            calendar_list = self.service.calendarList().list().execute()
+            request = self.service.calendarList().list(maxResults=250)
+            if cached and cached.get('etag'):
+                request.headers['If-None-Match'] = cached['etag']
+            
+            try:
+                calendar_list = request.execute()
+            except HttpError as e:
+                if cached and e.resp.status == 304:
+                    self._cache_calendar_list(cached['etag'], cached['calendars'], version)
+                    return cached['calendars']
+                raise
+            
+            items = calendar_list.get('items', [])
+            page_token = calendar_list.get('nextPageToken')
+            while page_token:
+                page = self.service.calendarList().list(maxResults=250, pageToken=page_token).execute()
+                items.extend(page.get('items', []))
+                page_token = page.get('nextPageToken')
             
             calendars = []
-            for calendar_item in calendar_list.get('items', []):
+            for calendar_item in items:
                 calendars.append({
                     'id': calendar_item['id'],
                     'summary': calendar_item.get('summary', ''),
@@ -61,8 +136,10 @@ class GoogleCalendarService:
                     'access_role': calendar_item.get('accessRole', ''),
                     'background_color': calendar_item.get('backgroundColor', ''),
                     'foreground_color': calendar_item.get('foregroundColor', ''),
+                    'time_zone': calendar_item.get('timeZone', ''),
                 })
             
+            self._cache_calendar_list(calendar_list.get('etag', ''), calendars, version)
             return calendars
             
         except HttpError as e:
@@ -70,6 +147,19 @@ class GoogleCalendarService:
         except Exception as e:
             raise GoogleCalendarServiceError(f"Unexpected error listing calendars: {str(e)}")
     
+    def _cache_calendar_list(self, etag: str, calendars: List[Dict], version=None):
+        if not self.user_id:
+            return
+        cache.set(
+            calendar_list_cache_key(self.user_id),
+            {'etag': etag, 'calendars': calendars, 'checked_at': time.time(), 'version': version},
+            getattr(settings, 'CALENDAR_LIST_CACHE_SECONDS', 86400),
+        )
+    
+    def get_primary_calendar(self) -> Dict:
+        """The primary calendar entry from the (cached) calendar list, or {} if there is none"""
+        return next((c for c in self.list_calendars() if c.get('primary')), {})
+    
     def get_primary_calendar_id(self) -> str:
         """
         Get the primary calendar ID for the user
@@ -78,19 +168,27 @@ class GoogleCalendarService:
             Primary calendar ID (usually the user's email)
         """
         try:
-            calendars = self.list_calendars()
-            
-            for calendar in calendars:
-                if calendar.get('primary', False):
-                    return calendar['id']
-            
             # Fallback to 'primary' if no primary calendar found
-            return 'primary'
+            return self.get_primary_calendar().get('id') or 'primary'
             
         except Exception as e:
             print(f"Error getting primary calendar ID: {e}")
             return 'primary'
     
+    def get_primary_time_zone(self) -> str:
+        """
+        Get the primary calendar's time zone
+        
+        Returns:
+            IANA time zone name, 'UTC' if unknown
+        """
+        try:
+            return self.get_primary_calendar().get('time_zone') or 'UTC'
+            
+        except Exception as e:
+            print(f"Error getting primary calendar time zone: {e}")
+            return 'UTC'
+    
     def create_event(self, 
                     title: str,
                     start_datetime: datetime,
@@ -99,7 +197,8 @@ class GoogleCalendarService:
                     location: str = '',
                     attendees: List[str] = None,
                     reminders: List[Dict] = None,
-                    calendar_id: str = 'primary') -> Dict:
+                    calendar_id: str = 'primary',
+                    recurrence: List[str] = None) -> Dict:
         """
         Create a new calendar event
         
@@ -112,38 +211,14 @@ class GoogleCalendarService:
             attendees: List of attendee email addresses
             reminders: List of reminder configurations
             calendar_id: Calendar ID to create event in
+            recurrence: RRULE lines making the event a recurring series
         
         Returns:
             Created event dictionary
         """
         try:
-            # Prepare event data
-            event_data = {
-                'summary': title,
-                'description': description,
-                'location': location,
-                'start': {
-                    'dateTime': start_datetime.isoformat(),
-                    'timeZone': str(start_datetime.tzinfo) if start_datetime.tzinfo else 'UTC',
-                },
-                'end': {
-                    'dateTime': end_datetime.isoformat(),
-                    'timeZone': str(end_datetime.tzinfo) if end_datetime.tzinfo else 'UTC',
-                },
-            }
-            
-            # Add attendees if provided
-            if attendees:
-                event_data['attendees'] = [{'email': email} for email in attendees]
-            
-            # Add reminders if provided
-            if reminders:
-                event_data['reminders'] = {
-                    'useDefault': False,
-                    'overrides': reminders
-                }
-            else:
-                event_data['reminders'] = {'useDefault': True}
+            event_data = _event_body(title, start_datetime, end_datetime, description,
+                                     location, attendees, reminders, recurrence)
             
             # Create the event
             created_event = self.service.events().insert(
@@ -166,10 +241,13 @@ class GoogleCalendarService:
                     description: str = None,
                     location: str = None,
                     attendees: List[str] = None,
-                    calendar_id: str = 'primary') -> Dict:
+                    calendar_id: str = 'primary',
+                    etag: str = None) -> Dict:
         """
         Update an existing calendar event
         
+        Sends only the changed fields with events.patch (one request, no read first).
+        
         Args:
             event_id: Google Calendar event ID
             title: New event title
@@ -179,56 +257,123 @@ class GoogleCalendarService:
             location: New location
             attendees: New list of attendee emails
             calendar_id: Calendar ID containing the event
+            etag: If given, the update only applies if the event still has this ETag
         
         Returns:
             Updated event dictionary
         """
         try:
-            # Get existing event
-            existing_event = self.service.events().get(
-                calendarId=calendar_id,
-                eventId=event_id
-            ).execute()
-            
-            # Update fields if provided
-            if title is not None:
-                existing_event['summary'] = title
-            
-            if description is not None:
-                existing_event['description'] = description
-            
-            if location is not None:
-                existing_event['location'] = location
-            
-            if start_datetime is not None:
-                existing_event['start'] = {
-                    'dateTime': start_datetime.isoformat(),
-                    'timeZone': str(start_datetime.tzinfo) if start_datetime.tzinfo else 'UTC',
-                }
-            
-            if end_datetime is not None:
-                existing_event['end'] = {
-                    'dateTime': end_datetime.isoformat(),
-                    'timeZone': str(end_datetime.tzinfo) if end_datetime.tzinfo else 'UTC',
-                }
-            
-            if attendees is not None:
-                existing_event['attendees'] = [{'email': email} for email in attendees]
-            
-            # Update the event
-            updated_event = self.service.events().update(
-                calendarId=calendar_id,
-                eventId=event_id,
-                body=existing_event
-            ).execute()
-            
-            return self._format_event(updated_event)
+            request = self._patch_request(event_id, calendar_id, etag, _event_patch(
+                title, start_datetime, end_datetime, description, location, attendees
+            ))
+            return self._format_event(request.execute())
             
         except HttpError as e:
+            if e.resp.status == 412:
+                raise GoogleCalendarServiceError(f"Event {event_id} was changed by someone else (ETag mismatch)")
             raise GoogleCalendarServiceError(f"Failed to update event: {str(e)}")
         except Exception as e:
             raise GoogleCalendarServiceError(f"Unexpected error updating event: {str(e)}")
     
+    def batch_create_events(self, events: List[Dict], calendar_id: str = 'primary') -> List[Dict]:
+        """
+        Create many events with up to BATCH_MAX_REQUESTS inserts per HTTP request
+        
+        Args:
+            events: Dicts with create_event's keyword arguments (title, start_datetime,
+                    end_datetime, and optionally description, location, attendees, reminders)
+            calendar_id: Calendar ID to create events in
+        
+        Returns:
+            One result per input, in order: {'index', 'success', 'event', 'error', 'status', 'conflict'}
+        """
+        requests = []
+        for event in events:
+            body = _event_body(
+                event['title'], event['start_datetime'], event['end_datetime'],
+                event.get('description', ''), event.get('location', ''),
+                event.get('attendees'), event.get('reminders'),
+            )
+            requests.append(self.service.events().insert(calendarId=calendar_id, body=body))
+        return self._execute_batch(requests)
+
+    def batch_import_events(self, events: List[Dict], calendar_id: str = 'primary') -> List[Dict]:
+        """
+        Import events from another calendar with up to BATCH_MAX_REQUESTS per HTTP request
+
+        Uses events.import, which keeps each event's iCalUID (importing the same UID again
+        does not create a second copy) and never sends invitations to attendees.
+
+        Args:
+            events: Raw event resources (summary, start, end, iCalUID, and optionally
+                    description, location, recurrence, attendees, status, transparency)
+            calendar_id: Calendar ID to import the events into
+
+        Returns:
+            One result per input, in order: {'index', 'success', 'event', 'error', 'status', 'conflict'}
+        """
+        requests = [self.service.events().import_(calendarId=calendar_id, body=body) for body in events]
+        return self._execute_batch(requests)
+
+    def batch_update_events(self, updates: List[Dict], calendar_id: str = 'primary') -> List[Dict]:
+        """
+        Patch many events with up to BATCH_MAX_REQUESTS patches per HTTP request
+        
+        Args:
+            updates: Dicts with 'event_id', an optional 'etag' (sent as If-Match) and any of
+                     update_event's fields (title, start_datetime, end_datetime, description,
+                     location, attendees)
+            calendar_id: Calendar ID containing the events
+        
+        Returns:
+            One result per input, in order: {'index', 'success', 'event', 'error', 'status', 'conflict'};
+            an event changed since its ETag was read comes back with status 412 and conflict True
+        """
+        requests = []
+        for update in updates:
+            patch = _event_patch(
+                update.get('title'), update.get('start_datetime'), update.get('end_datetime'),
+                update.get('description'), update.get('location'), update.get('attendees'),
+            )
+            requests.append(self._patch_request(update['event_id'], calendar_id, update.get('etag'), patch))
+        return self._execute_batch(requests)
+
+    def _patch_request(self, event_id: str, calendar_id: str, etag: Optional[str], patch: Dict):
+        request = self.service.events().patch(calendarId=calendar_id, eventId=event_id, body=patch)
+        if etag:
+            request.headers['If-Match'] = etag
+        return request
+    
+    def _execute_batch(self, requests: List) -> List[Dict]:
+        """Run API requests in batches of BATCH_MAX_REQUESTS and collect per-item results"""
+        results = [None] * len(requests)
+        
+        def callback(request_id, response, exception):
+            index = int(request_id)
+            if exception is None:
+                results[index] = {'index': index, 'success': True, 'event': self._format_event(response),
+                                  'error': None, 'status': 200, 'conflict': False}
+            else:
+                status = exception.resp.status if isinstance(exception, HttpError) else None
+                results[index] = {'index': index, 'success': False, 'event': None,
+                                  'error': str(exception), 'status': status, 'conflict': status == 412}
+        
+        for offset in range(0, len(requests), BATCH_MAX_REQUESTS):
+            batch = self.service.new_batch_http_request(callback=callback)
+            for index in range(offset, min(offset + BATCH_MAX_REQUESTS, len(requests))):
+                batch.add(requests[index], request_id=str(index))
+            try:
+                batch.execute()
+            except HttpError as e:
+                # The batch request itself failed; every item in it is unaccounted for
+                print(f"Calendar batch request failed: {e}")
+                for index in range(offset, min(offset + BATCH_MAX_REQUESTS, len(requests))):
+                    if results[index] is None:
+                        results[index] = {'index': index, 'success': False, 'event': None,
+                                          'error': str(e), 'status': e.resp.status, 'conflict': False}
+        
+        return results
+    
     def delete_event(self, event_id: str, calendar_id: str = 'primary') -> bool:
         """
         Delete a calendar event
@@ -264,40 +409,138 @@ class GoogleCalendarService:
         Args:
             start_date: Start date for event search
             end_date: End date for event search
-            max_results: Maximum number of events to return
+            max_results: Maximum number of events to return (None for all)
             calendar_id: Calendar ID to search
         
         Returns:
             List of event dictionaries
         """
-        try:
-            # Set default date range if not provided
-            if start_date is None:
-                start_date = timezone.now()
-            
-            if end_date is None:
-                end_date = start_date + timedelta(days=30)
-            
-            # Get events
-            events_result = self.service.events().list(
-                calendarId=calendar_id,
-                timeMin=start_date.isoformat(),
-                timeMax=end_date.isoformat(),
-                maxResults=max_results,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            events = []
-            for event in events_result.get('items', []):
-                events.append(self._format_event(event))
-            
-            return events
-            
-        except HttpError as e:
-            raise GoogleCalendarServiceError(f"Failed to get events: {str(e)}")
-        except Exception as e:
-            raise GoogleCalendarServiceError(f"Unexpected error getting events: {str(e)}")
+        return list(self.iter_events(start_date, end_date, calendar_id, max_results=max_results))
+    
+    def iter_events(self,
+                    start_date: datetime = None,
+                    end_date: datetime = None,
+                    calendar_id: str = 'primary',
+                    max_results: int = None,
+                    page_size: int = EVENTS_PAGE_SIZE) -> Iterator[Dict]:
+        """
+        Yield formatted events in start order, fetching one page at a time
+        
+        Only the current page is held in memory and no further pages are requested once
+        the caller stops iterating, so a year-long range costs what is actually consumed.
+        
+        Args:
+            start_date: Start date for event search
+            end_date: End date for event search
+            calendar_id: Calendar ID to search
+            max_results: Stop after this many events (None for all)
+            page_size: Events requested per page
+        
+        Yields:
+            Event dictionaries
+        """
+        # Set default date range if not provided
+        if start_date is None:
+            start_date = timezone.now()
+        
+        if end_date is None:
+            end_date = start_date + timedelta(days=30)
+        
+        if max_results is not None:
+            page_size = min(page_size, max_results)
+        
+        params = {
+            'calendarId': calendar_id,
+            'timeMin': start_date.isoformat(),
+            'timeMax': end_date.isoformat(),
+            'singleEvents': True,
+            'orderBy': 'startTime',
+        }
+        
+        count = 0
+        for page in self._iter_event_pages(params, page_size):
+            for event in page.get('items', []):
+                yield self._format_event(event)
+                count += 1
+                if max_results is not None and count >= max_results:
+                    return
+    
+    def _iter_event_pages(self, params: Dict, page_size: int = EVENTS_PAGE_SIZE) -> Iterator[Dict]:
+        """
+        Yield raw events.list response pages (with the EVENT_LIST_FIELDS mask) until
+        nextPageToken runs out. The last page carries nextSyncToken when Google returns one.
+        """
+        params = dict(params, maxResults=page_size, fields=EVENT_LIST_FIELDS)
+        while True:
+            try:
+                page = self.service.events().list(**params).execute()
+            except HttpError as e:
+                if params.get('syncToken') and getattr(e, 'resp', None) is not None and e.resp.status == 410:
+                    raise SyncTokenExpiredError(f"Sync token expired for calendar {params['calendarId']}")
+                raise GoogleCalendarServiceError(f"Failed to get events: {str(e)}")
+            except Exception as e:
+                raise GoogleCalendarServiceError(f"Unexpected error getting events: {str(e)}")
+            
+            yield page
+            
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return
+            params['pageToken'] = page_token
+    
+    def list_event_changes(self,
+                           calendar_id: str = 'primary',
+                           sync_token: str = None,
+                           time_min: datetime = None,
+                           time_max: datetime = None,
+                           single_events: bool = False,
+                           page_size: int = EVENTS_PAGE_SIZE,
+                           page_token: str = None) -> Iterator[Tuple[List[Dict], str, str]]:
+        """
+        Page through raw events for a full sync (no sync_token) or the changes since `sync_token`
+        
+        Pages are yielded as they arrive, so a caller applying them one at a time holds a
+        single page in memory however large the calendar is.
+        
+        By default recurring series come back once, as master events with their recurrence
+        lines, plus their modified and cancelled instances. Incremental results include
+        cancelled events (status 'cancelled') so deletions can be applied locally.
+        
+        Args:
+            calendar_id: Calendar to read
+            sync_token: nextSyncToken from a previous call, or None for a full sync
+            time_min: Lower bound for a full sync (ignored with sync_token)
+            time_max: Upper bound for a full sync (ignored with sync_token)
+            single_events: Have Google expand recurring events into instances instead
+                           (must match the value used when the sync token was issued)
+            page_size: Events per page
+            page_token: nextPageToken of the last page already applied, to resume the same listing
+        
+        Yields:
+            (raw Google events on the page, nextSyncToken, nextPageToken) - the sync token is ''
+            until the last page, which has no page token
+        
+        Raises:
+            SyncTokenExpiredError: if Google no longer accepts `sync_token` (on the first page)
+        """
+        params = {
+            'calendarId': calendar_id,
+            'singleEvents': single_events,
+        }
+        if sync_token:
+            # timeMin/timeMax/orderBy may not be combined with a syncToken
+            params['syncToken'] = sync_token
+        else:
+            if time_min is not None:
+                params['timeMin'] = time_min.isoformat()
+            if time_max is not None:
+                params['timeMax'] = time_max.isoformat()
+        
+        if page_token:
+            params['pageToken'] = page_token
+        
+        for page in self._iter_event_pages(params, page_size):
+            yield page.get('items', []), page.get('nextSyncToken', ''), page.get('nextPageToken', '')
     
     def get_event(self, event_id: str, calendar_id: str = 'primary') -> Dict:
         """
@@ -323,22 +566,83 @@ class GoogleCalendarService:
         except Exception as e:
             raise GoogleCalendarServiceError(f"Unexpected error getting event: {str(e)}")
     
+    def query_freebusy(self,
+                       start_date: datetime,
+                       end_date: datetime,
+                       calendar_ids: List[str],
+                       time_zone: str = 'UTC',
+                       errors: Dict = None) -> Dict[str, List[Tuple[datetime, datetime]]]:
+        """
+        Fetch busy intervals for several calendars with a single freebusy.query per
+        FREEBUSY_MAX_CALENDARS calendars.
+        
+        Args:
+            start_date: Start of the range (timezone-aware)
+            end_date: End of the range (timezone-aware)
+            calendar_ids: Calendar IDs (or attendee emails) to query
+            time_zone: Time zone used in the response
+            errors: Optional dict; filled with {calendar_id: [error, ...]} for unreadable calendars
+        
+        Returns:
+            Mapping of calendar ID to a list of (start, end) busy datetimes.
+            Calendars Google could not read are logged and returned with no busy time.
+        """
+        try:
+            busy_by_calendar = {}
+            for i in range(0, len(calendar_ids), FREEBUSY_MAX_CALENDARS):
+                chunk = calendar_ids[i:i + FREEBUSY_MAX_CALENDARS]
+                result = self.service.freebusy().query(body={
+                    'timeMin': start_date.isoformat(),
+                    'timeMax': end_date.isoformat(),
+                    'timeZone': time_zone,
+                    'items': [{'id': cal_id} for cal_id in chunk],
+                }).execute()
+                
+                for cal_id, info in result.get('calendars', {}).items():
+                    if info.get('errors'):
+                        print(f"Freebusy errors for calendar {cal_id}: {info['errors']}")
+                        if errors is not None:
+                            errors[cal_id] = info['errors']
+                    busy_by_calendar[cal_id] = [
+                        (_parse_rfc3339(b['start']), _parse_rfc3339(b['end']))
+                        for b in info.get('busy', [])
+                    ]
+            
+            return busy_by_calendar
+            
+        except HttpError as e:
+            raise GoogleCalendarServiceError(f"Failed to query free/busy: {str(e)}")
+        except Exception as e:
+            raise GoogleCalendarServiceError(f"Unexpected error querying free/busy: {str(e)}")
+    
     def find_free_time(self,
                       duration_minutes: int,
                       start_date: datetime = None,
                       end_date: datetime = None,
-                      calendar_id: str = 'primary') -> List[Dict]:
+                      calendar_ids: List[str] = None,
+                      time_zone: str = None,
+                      working_hours: Dict = None,
+                      preferred_hours: Tuple[int, int] = None,
+                      max_slots: int = None) -> List[Dict]:
         """
-        Find free time slots in the calendar
+        Find free time slots across all of the user's calendars
+        
+        Busy time comes from one freebusy query (all-day and multi-calendar events included),
+        is merged with a sorted sweep, clipped to working hours in the user's time zone and
+        turned into ranked slots (see availability.find_free_slots).
         
         Args:
             duration_minutes: Required duration in minutes
             start_date: Start date for search
             end_date: End date for search
-            calendar_id: Calendar ID to search
+            calendar_ids: Calendars to consider (defaults to every calendar in the user's list)
+            time_zone: IANA time zone for working hours (defaults to the primary calendar's)
+            working_hours: Overrides for settings.CALENDAR_WORKING_HOURS ({'start','end','days'})
+            preferred_hours: Optional (start_hour, end_hour) local range to rank higher
+            max_slots: Maximum number of slots to return
         
         Returns:
-            List of free time slot dictionaries
+            List of ranked free slot dictionaries
         """
         try:
             # Set default date range if not provided
@@ -348,43 +652,215 @@ class GoogleCalendarService:
             if end_date is None:
                 end_date = start_date + timedelta(days=7)
             
-            # Get existing events
-            events = self.get_events(start_date, end_date, calendar_id=calendar_id)
+            if calendar_ids is None or time_zone is None:
+                calendars = self.list_calendars()
+                if calendar_ids is None:
+                    calendar_ids = [c['id'] for c in calendars] or ['primary']
+                if time_zone is None:
+                    primary = next((c for c in calendars if c.get('primary')), {})
+                    time_zone = primary.get('time_zone') or 'UTC'
+            
+            busy_by_calendar = self.query_freebusy(start_date, end_date, calendar_ids, time_zone)
+            busy = [interval for intervals in busy_by_calendar.values() for interval in intervals]
+            
+            return find_free_slots(
+                busy,
+                start_date,
+                end_date,
+                duration_minutes,
+                time_zone=time_zone,
+                working_hours=working_hours,
+                preferred_hours=preferred_hours,
+                limit=max_slots,
+            )
+            
+        except GoogleCalendarServiceError:
+            raise
+        except Exception as e:
+            raise GoogleCalendarServiceError(f"Error finding free time: {str(e)}")
+    
+    def find_common_free_time(self,
+                              attendees: List[str],
+                              duration_minutes: int,
+                              start_date: datetime = None,
+                              end_date: datetime = None,
+                              time_zone: str = None,
+                              working_hours: Dict = None,
+                              preferred_hours: Tuple[int, int] = None,
+                              resolution_minutes: int = 15,
+                              max_slots: int = 10,
+                              include_self: bool = True) -> Dict:
+        """
+        Find slots where the user and every attendee are free
+        
+        Busy data for the user's calendars and all attendees comes from one freebusy query;
+        each attendee becomes a bitset row and the rows are intersected vectorially
+        (see availability.find_common_free_slots).
+        
+        Args:
+            attendees: Attendee email addresses
+            duration_minutes: Required duration in minutes
+            start_date: Start date for search
+            end_date: End date for search
+            time_zone: IANA time zone for working hours (defaults to the primary calendar's)
+            working_hours: Overrides for settings.CALENDAR_WORKING_HOURS
+            preferred_hours: Optional (start_hour, end_hour) local range to rank higher
+            resolution_minutes: Bitset cell size (e.g. 15 for quarter hours)
+            max_slots: Maximum number of slots to return
+            include_self: Also block the user's own calendars
+        
+        Returns:
+            {'slots': [...], 'time_zone': str, 'unavailable': {attendee: errors}}
+            where `unavailable` lists attendees whose busy data Google would not share
+        """
+        try:
+            if start_date is None:
+                start_date = timezone.now()
             
-            # Find free slots (simplified algorithm)
-            free_slots = []
-            current_time = start_date
+            if end_date is None:
+                end_date = start_date + timedelta(days=7)
             
-            # Sort events by start time
-            events.sort(key=lambda x: x['start_datetime'])
+            attendees, busy_by_person, time_zone, errors = self._busy_by_person(
+                attendees, start_date, end_date, time_zone, include_self
+            )
+            
+            slots = find_common_free_slots(
+                busy_by_person,
+                start_date,
+                end_date,
+                duration_minutes,
+                time_zone=time_zone,
+                working_hours=working_hours,
+                preferred_hours=preferred_hours,
+                resolution_minutes=resolution_minutes,
+                limit=max_slots,
+            )
             
-            for event in events:
-                event_start = datetime.fromisoformat(event['start_datetime'].replace('Z', '+00:00'))
-                
-                # Check if there's enough time before this event
-                if (event_start - current_time).total_seconds() >= duration_minutes * 60:
-                    free_slots.append({
-                        'start_datetime': current_time.isoformat(),
-                        'end_datetime': event_start.isoformat(),
-                        'duration_minutes': int((event_start - current_time).total_seconds() / 60)
-                    })
-                
-                # Move current time to after this event
-                event_end = datetime.fromisoformat(event['end_datetime'].replace('Z', '+00:00'))
-                current_time = max(current_time, event_end)
-            
-            # Check for free time after the last event
-            if (end_date - current_time).total_seconds() >= duration_minutes * 60:
-                free_slots.append({
-                    'start_datetime': current_time.isoformat(),
-                    'end_datetime': end_date.isoformat(),
-                    'duration_minutes': int((end_date - current_time).total_seconds() / 60)
-                })
+            return {
+                'slots': slots,
+                'time_zone': time_zone,
+                'unavailable': {email: errs for email, errs in errors.items() if email in attendees},
+            }
+            
+        except GoogleCalendarServiceError:
+            raise
+        except Exception as e:
+            raise GoogleCalendarServiceError(f"Error finding common free time: {str(e)}")
+    
+    def find_recurring_free_time(self,
+                                 rule: str,
+                                 duration_minutes: int,
+                                 attendees: List[str] = None,
+                                 start_date: datetime = None,
+                                 end_date: datetime = None,
+                                 time_zone: str = None,
+                                 working_hours: Dict = None,
+                                 preferred_hours: Tuple[int, int] = None,
+                                 resolution_minutes: int = 15,
+                                 max_slots: int = 10,
+                                 include_self: bool = True) -> Dict:
+        """
+        Find times of day that are free on every occurrence of a recurrence pattern
+        
+        Busy data for the whole horizon comes from one freebusy query; it is rasterised once
+        into per-day bitset rows and the occurrence days are intersected
+        (see availability.find_recurring_free_slots).
+        
+        Args:
+            rule: RRULE for the occurrence days, e.g. 'FREQ=WEEKLY;BYDAY=TU;COUNT=6'
+            duration_minutes: Required duration in minutes
+            attendees: Optional attendee email addresses who must also be free
+            start_date: First day to consider (defaults to now)
+            end_date: Optional end of the horizon, for rules without COUNT or UNTIL
+            time_zone: IANA time zone of the pattern (defaults to the primary calendar's)
+            working_hours: Overrides for settings.CALENDAR_WORKING_HOURS
+            preferred_hours: Optional (start_hour, end_hour) local range to rank higher
+            resolution_minutes: Bitset cell size (must divide a day)
+            max_slots: Maximum number of slots to return
+            include_self: Also block the user's own calendars
+        
+        Returns:
+            {'slots': [...], 'occurrences': int, 'time_zone': str, 'unavailable': {attendee: errors}}
+            where each slot lists its start on every occurrence day
+        """
+        try:
+            if start_date is None:
+                start_date = timezone.now()
+            if time_zone is None:
+                time_zone = self.get_primary_time_zone()
+            
+            days = occurrence_days(rule, start_date, end_date, time_zone)
+            if not days:
+                return {'slots': [], 'occurrences': 0, 'time_zone': time_zone, 'unavailable': {}}
+            
+            tz = ZoneInfo(time_zone)
+            horizon_start = max(start_date, datetime.combine(days[0], datetime.min.time(), tzinfo=tz))
+            horizon_end = datetime.combine(days[-1] + timedelta(days=1), datetime.min.time(), tzinfo=tz)
+            attendees, busy_by_person, time_zone, errors = self._busy_by_person(
+                attendees or [], horizon_start, horizon_end, time_zone, include_self
+            )
+            
+            slots = find_recurring_free_slots(
+                busy_by_person,
+                rule,
+                start_date,
+                duration_minutes,
+                end=end_date,
+                time_zone=time_zone,
+                working_hours=working_hours,
+                preferred_hours=preferred_hours,
+                resolution_minutes=resolution_minutes,
+                limit=max_slots,
+            )
             
-            return free_slots
+            return {
+                'slots': slots,
+                'occurrences': len(days),
+                'time_zone': time_zone,
+                'unavailable': {email: errs for email, errs in errors.items() if email in attendees},
+            }
             
+        except GoogleCalendarServiceError:
+            raise
         except Exception as e:
-            raise GoogleCalendarServiceError(f"Error finding free time: {str(e)}")
+            raise GoogleCalendarServiceError(f"Error finding recurring free time: {str(e)}")
+    
+    def _busy_by_person(self, attendees: List[str], start_date: datetime, end_date: datetime,
+                        time_zone: Optional[str], include_self: bool):
+        """
+        Busy intervals per person from one freebusy query
+        
+        Returns:
+            (normalised attendees, {person: intervals}, time_zone, errors); the user's own
+            calendars collapse into a single 'self' entry and unreadable attendees are left out
+        """
+        own_calendar_ids = []
+        if include_self or time_zone is None:
+            calendars = self.list_calendars()
+            if include_self:
+                own_calendar_ids = [c['id'] for c in calendars] or ['primary']
+            if time_zone is None:
+                primary = next((c for c in calendars if c.get('primary')), {})
+                time_zone = primary.get('time_zone') or 'UTC'
+        
+        attendees = [a for a in dict.fromkeys(a.strip().lower() for a in attendees if a) if a]
+        errors = {}
+        busy_by_calendar = self.query_freebusy(
+            start_date, end_date, own_calendar_ids + attendees, time_zone, errors=errors
+        )
+        
+        # One bitset row per person: the user's calendars collapse into a single 'self' row
+        busy_by_person = {
+            email: busy_by_calendar.get(email, [])
+            for email in attendees
+            if email not in errors
+        }
+        if own_calendar_ids:
+            busy_by_person['self'] = [
+                interval for cal_id in own_calendar_ids
+                for interval in busy_by_calendar.get(cal_id, [])
+            ]
+        return attendees, busy_by_person, time_zone, errors
     
     def _format_event(self, google_event: Dict) -> Dict:
         """
@@ -423,6 +899,8 @@ class GoogleCalendarService:
             
             return {
                 'id': google_event.get('id', ''),
+                # Pass back to update_event(etag=...) to patch only if nobody changed it since
+                'etag': google_event.get('etag'),
                 'title': google_event.get('summary', ''),
                 'description': google_event.get('description', ''),
                 'location': google_event.get('location', ''),
@@ -445,3 +923,87 @@ class GoogleCalendarService:
                 'title': google_event.get('summary', 'Untitled Event'),
                 'error': f"Failed to format event: {str(e)}"
             }
+
+
+def _event_time(value: datetime) -> Dict:
+    return {
+        'dateTime': value.isoformat(),
+        'timeZone': str(value.tzinfo) if value.tzinfo else 'UTC',
+    }
+
+
+def _event_body(title: str,
+                start_datetime: datetime,
+                end_datetime: datetime,
+                description: str = '',
+                location: str = '',
+                attendees: List[str] = None,
+                reminders: List[Dict] = None,
+                recurrence: List[str] = None) -> Dict:
+    """Request body for events.insert"""
+    event_data = {
+        'summary': title,
+        'description': description,
+        'location': location,
+        'start': _event_time(start_datetime),
+        'end': _event_time(end_datetime),
+    }
+    
+    # Add attendees if provided
+    if attendees:
+        event_data['attendees'] = [{'email': email} for email in attendees]
+    
+    # Add reminders if provided
+    if reminders:
+        event_data['reminders'] = {
+            'useDefault': False,
+            'overrides': reminders
+        }
+    else:
+        event_data['reminders'] = {'useDefault': True}
+    
+    if recurrence:
+        event_data['recurrence'] = recurrence
+    
+    return event_data
+
+
+def _event_patch(title: str = None,
+                 start_datetime: datetime = None,
+                 end_datetime: datetime = None,
+                 description: str = None,
+                 location: str = None,
+                 attendees: List[str] = None) -> Dict:
+    """Request body for events.patch containing only the fields being changed"""
+    patch = {}
+    if title is not None:
+        patch['summary'] = title
+    if description is not None:
+        patch['description'] = description
+    if location is not None:
+        patch['location'] = location
+    if start_datetime is not None:
+        patch['start'] = _event_time(start_datetime)
+    if end_datetime is not None:
+        patch['end'] = _event_time(end_datetime)
+    if attendees is not None:
+        patch['attendees'] = [{'email': email} for email in attendees]
+    return patch
+
+
+def calendar_list_cache_key(user_id: int) -> str:
+    return f"calendar_list_{user_id}"
+
+
+def invalidate_calendar_list_cache(user_id: int):
+    """
+    Drop a user's cached calendar list so the next read here fetches it unconditionally,
+    and move the mirror version so every other process revalidates its copy (see list_calendars).
+    """
+    CalendarSyncState.objects.filter(user_id=user_id).update(updated_at=timezone.now())
+    cache.delete(calendar_list_cache_key(user_id))
+
+
+def _parse_rfc3339(value: str) -> datetime:
+    """Parse an RFC 3339 timestamp from the API into an aware datetime."""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
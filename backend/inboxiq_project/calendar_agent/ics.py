@@ -0,0 +1,550 @@
+# backend/inboxiq_project/calendar_agent/ics.py
+"""
+Streaming iCalendar (.ics) import and export.
+
+Import decodes the file a chunk at a time, unfolds continuation lines and yields one
+VEVENT at a time. Each event is mapped to a Google event resource so the sync's own
+event_fields_from_google produces the CalendarEvent fields, and rows are written with
+bulk_create every `chunk_size` events; memory depends on the chunk size, not the file size
+(analytics changes are summed per day and written once at the end).
+With push_to_google each chunk first goes to Google through batched events.import calls
+and the rows keep the returned Google IDs, so the next sync updates them in place.
+
+Export reads the mirror in primary-key order, EXPORT_CHUNK_SIZE rows per query (keyset
+pagination, since MySQL's driver buffers a whole result set even under QuerySet.iterator()),
+and yields one VEVENT at a time for StreamingHttpResponse. Recurring series are written
+once with their RRULE lines.
+"""
+import codecs
+import re
+import uuid
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+
+from .analytics import ANALYTICS_FIELDS, AnalyticsDelta
+from .booking import invalidate_booking_slots
+from .conflicts import invalidate_conflict_index
+from .google_calendar_service import GoogleCalendarService
+from .models import CalendarEvent, CalendarSyncState
+from .sync import event_fields_from_google, primary_time_zone, series_id
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # pragma: no cover - Python < 3.9
+    from backports.zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Calendar ID that imported rows are filed under when they are not pushed to Google
+DEFAULT_IMPORT_CALENDAR = 'ics-import'
+IMPORT_CHUNK_SIZE = 500
+EXPORT_CHUNK_SIZE = 500
+READ_CHUNK_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 20
+# RFC 5545 content lines are folded at 75 octets
+FOLD_OCTETS = 75
+
+_UTC = ZoneInfo('UTC')
+_UNESCAPE_RE = re.compile(r'\\([\\;,nN])')
+_DURATION_RE = re.compile(r'^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+_PARTSTAT = {'ACCEPTED': 'accepted', 'DECLINED': 'declined', 'TENTATIVE': 'tentative',
+             'NEEDS-ACTION': 'needsAction'}
+_RESPONSE_STATUS = {value: key for key, value in _PARTSTAT.items()}
+_STATUSES = ('confirmed', 'tentative', 'cancelled')
+
+
+# --- Reading -----------------------------------------------------------------------------
+
+def read_chunks(fileobj, size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+    """A binary file as an iterator of chunks"""
+    while True:
+        chunk = fileobj.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _physical_lines(chunks: Iterable) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    pending = ''
+    for chunk in chunks:
+        text = pending + (decoder.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        lines = text.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending.rstrip('\r')
+
+
+def iter_lines(chunks: Iterable) -> Iterator[str]:
+    """Content lines of an .ics stream (bytes or str chunks), with folded lines joined"""
+    current = None
+    for line in _physical_lines(chunks):
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_line(line: str) -> Tuple[str, Dict[str, str], str]:
+    """'NAME;PARAM=x;...:value' -> (NAME, {PARAM: x}, value); quoted parameters may hold ':' and ';'"""
+    fields, start, in_quotes = [], 0, False
+    for index, char in enumerate(line):
+        if char == '"':
+            in_quotes = not in_quotes
+        elif not in_quotes and char in ';:':
+            fields.append(line[start:index])
+            start = index + 1
+            if char == ':':
+                break
+    else:
+        return line.upper(), {}, ''
+
+    params = {}
+    for field in fields[1:]:
+        key, _, param_value = field.partition('=')
+        params[key.upper()] = param_value.strip('"')
+    return fields[0].upper(), params, line[start:]
+
+
+def iter_vevents(lines: Iterable[str], calendar: Optional[Dict] = None) -> Iterator[List[Tuple[str, Dict, str]]]:
+    """
+    Each VEVENT's properties as (name, params, value) tuples, in file order
+
+    Nested components (VALARM) and VTIMEZONE definitions are skipped. Top-level VCALENDAR
+    properties (e.g. X-WR-TIMEZONE) are collected into `calendar` if a dict is given.
+    """
+    stack, props = [], None
+    for line in lines:
+        name, params, value = parse_line(line)
+        if name == 'BEGIN':
+            stack.append(value.upper())
+            if stack[-1] == 'VEVENT':
+                props = []
+        elif name == 'END':
+            component = stack.pop() if stack else ''
+            if component == 'VEVENT' and props is not None:
+                yield props
+                props = None
+        elif props is not None and stack[-1:] == ['VEVENT']:
+            props.append((name, params, value))
+        elif calendar is not None and stack == ['VCALENDAR']:
+            calendar[name] = value
+
+
+def _unescape(value: str) -> str:
+    return _UNESCAPE_RE.sub(lambda m: '\n' if m.group(1) in 'nN' else m.group(1), value)
+
+
+@lru_cache(maxsize=256)
+def resolve_time_zone(tzid: Optional[str], default: Optional[str] = None) -> Optional[str]:
+    """
+    An IANA zone name for a TZID: the ID itself, or the Area/City tail of a prefixed one
+    ("/mozilla.org/20050126_1/Europe/Berlin"). Unknown IDs (e.g. Windows names) give `default`.
+    """
+    parts = (tzid or '').strip('"/').split('/')
+    for index in range(len(parts)):
+        candidate = '/'.join(parts[index:])
+        try:
+            ZoneInfo(candidate)
+            return candidate
+        except (ZoneInfoNotFoundError, ValueError):
+            continue
+    return default
+
+
+def parse_duration(value: str) -> timedelta:
+    """An RFC 5545 DURATION ('PT1H30M', 'P1D', '-P1W') as a timedelta"""
+    match = _DURATION_RE.match(value.strip().upper())
+    if not match:
+        raise ValueError(f"Invalid DURATION: {value}")
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    delta = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                      minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -delta if sign == '-' else delta
+
+
+def _time_info(value: str, params: Dict[str, str], default_time_zone: str) -> Dict:
+    """A DTSTART/DTEND/RECURRENCE-ID value as a Google start/end object"""
+    value = value.strip()
+    if params.get('VALUE') == 'DATE' or len(value) == 8:
+        return {'date': f'{value[:4]}-{value[4:6]}-{value[6:8]}'}
+    naive = datetime.strptime(value[:15], '%Y%m%dT%H%M%S')
+    # UTC, or local time in TZID; floating times are taken in the default zone
+    time_zone = 'UTC' if value.endswith('Z') else resolve_time_zone(params.get('TZID'), default_time_zone)
+    return {'dateTime': naive.replace(tzinfo=ZoneInfo(time_zone)).isoformat(), 'timeZone': time_zone}
+
+
+def _shift(info: Dict, delta: timedelta) -> Dict:
+    if 'date' in info:
+        # All-day events last at least one day
+        return {'date': (date.fromisoformat(info['date']) + timedelta(days=max(delta.days, 1))).isoformat()}
+    return {'dateTime': (datetime.fromisoformat(info['dateTime']) + delta).isoformat(), 'timeZone': info['timeZone']}
+
+
+def _recurrence_line(name: str, params: Dict[str, str], value: str) -> str:
+    """An RRULE/RDATE/EXDATE property as a `recurrence` line that recurrence.build_ruleset accepts"""
+    if name in ('RRULE', 'EXRULE'):
+        return f'{name}:{value}'
+    kept = []
+    if params.get('VALUE') == 'DATE':
+        kept.append('VALUE=DATE')
+    # Unknown zones are dropped, leaving the times in the series' own zone
+    time_zone = resolve_time_zone(params.get('TZID'))
+    if time_zone:
+        kept.append(f'TZID={time_zone}')
+    # RDATE;VALUE=PERIOD values carry '/end'; only the start matters here
+    values = ','.join(item.split('/')[0] for item in value.split(','))
+    return ';'.join([name] + kept) + ':' + values
+
+
+def vevent_to_google(props: List[Tuple[str, Dict, str]], default_time_zone: str = 'UTC',
+                     own_email: str = '') -> Optional[Dict]:
+    """
+    A VEVENT as a Google event resource, or None if it has no DTSTART
+
+    Modified instances (RECURRENCE-ID) carry 'recurringEventId' set to the series UID.
+
+    Raises:
+        ValueError: A date, time or duration cannot be parsed
+    """
+    first, recurrence, attendees = {}, [], []
+    for name, params, value in props:
+        first.setdefault(name, (params, value))
+        if name in ('RRULE', 'EXRULE', 'RDATE', 'EXDATE'):
+            recurrence.append(_recurrence_line(name, params, value))
+        elif name == 'ATTENDEE':
+            email = value[7:] if value.lower().startswith('mailto:') else value
+            if '@' not in email:
+                continue
+            attendees.append({
+                'email': email,
+                'displayName': params.get('CN', ''),
+                'responseStatus': _PARTSTAT.get(params.get('PARTSTAT', '').upper(), 'needsAction'),
+                'optional': params.get('ROLE', '').upper() == 'OPT-PARTICIPANT',
+                'self': bool(own_email) and email.lower() == own_email,
+            })
+    if 'DTSTART' not in first:
+        return None
+
+    def text(name):
+        return _unescape(first[name][1]) if name in first else ''
+
+    start_params, start_value = first['DTSTART']
+    start = _time_info(start_value, start_params, default_time_zone)
+    if 'DTEND' in first:
+        end = _time_info(first['DTEND'][1], first['DTEND'][0], default_time_zone)
+    elif 'DURATION' in first:
+        end = _shift(start, parse_duration(first['DURATION'][1]))
+    else:
+        end = _shift(start, timedelta(0))
+
+    status = text('STATUS').lower()
+    item = {
+        'iCalUID': text('UID').strip()[:255] or f'{uuid.uuid4().hex}@inboxiq',
+        'summary': text('SUMMARY'),
+        'description': text('DESCRIPTION'),
+        'location': text('LOCATION'),
+        'start': start,
+        'end': end,
+        'status': status if status in _STATUSES else 'confirmed',
+        'transparency': 'transparent' if text('TRANSP').upper() == 'TRANSPARENT' else 'opaque',
+        'recurrence': recurrence,
+        'attendees': attendees,
+    }
+    if 'RECURRENCE-ID' in first:
+        item['recurringEventId'] = item['iCalUID']
+        item['originalStartTime'] = _time_info(first['RECURRENCE-ID'][1], first['RECURRENCE-ID'][0],
+                                               default_time_zone)
+        item['recurrence'] = []
+    return item
+
+
+def _import_body(item: Dict) -> Dict:
+    """The events.import request body for a parsed event"""
+    body = {key: value for key, value in item.items() if key not in ('recurringEventId', 'originalStartTime')}
+    body['attendees'] = [{k: v for k, v in a.items() if k != 'self'} for a in item['attendees']]
+    if not body['recurrence']:
+        del body['recurrence']
+    return body
+
+
+class IcsImporter:
+    """Imports .ics streams into one user's CalendarEvent rows, a chunk of events at a time"""
+
+    def __init__(self, user, calendar_id: str = DEFAULT_IMPORT_CALENDAR, time_zone: Optional[str] = None,
+                 calendar_service: Optional[GoogleCalendarService] = None, chunk_size: int = IMPORT_CHUNK_SIZE):
+        """
+        Args:
+            user: Owner of the imported events
+            calendar_id: Calendar the rows are filed under; with a calendar_service this is
+                         the Google calendar the events are imported into ('primary' is resolved)
+            time_zone: Zone for floating times and unknown TZIDs (default: the file's
+                       X-WR-TIMEZONE, else the user's primary calendar zone)
+            calendar_service: Push every event to Google before storing it (optional)
+            chunk_size: Events per bulk insert and per push round
+        """
+        self.user = user
+        self.calendar_service = calendar_service
+        self.calendar_id = calendar_id
+        if calendar_service is not None and calendar_id == 'primary':
+            self.calendar_id = calendar_service.get_primary_calendar_id()
+        self.time_zone = time_zone
+        self.chunk_size = chunk_size
+        self.analytics_time_zone = primary_time_zone(user)
+        self.own_email = (user.email or '').lower()
+        self.stats = {'imported': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+        # Analytics changes are netted across the whole import and written once at the end:
+        # their size grows with the distinct days and attendees touched, not with the events
+        self.analytics = AnalyticsDelta(user, self.analytics_time_zone)
+        # Modified instances stored before their series: counted in analytics once it is in
+        self._orphans: List[CalendarEvent] = []
+
+    def run(self, chunks: Iterable) -> Dict:
+        """
+        Import every VEVENT in an .ics stream (bytes chunks, e.g. UploadedFile.chunks())
+
+        Events already imported into this calendar (same UID and RECURRENCE-ID) are skipped.
+        When pushing, modified instances of a series are skipped: Google generates the
+        series' occurrences itself.
+
+        Returns:
+            {'imported', 'skipped', 'failed', 'errors': [first MAX_REPORTED_ERRORS messages]}
+        """
+        calendar = {}
+        batch = []
+        try:
+            for number, props in enumerate(iter_vevents(iter_lines(chunks), calendar), start=1):
+                if self.time_zone is None:
+                    self.time_zone = (resolve_time_zone(calendar.get('X-WR-TIMEZONE'))
+                                      or self.analytics_time_zone)
+                try:
+                    item = vevent_to_google(props, self.time_zone, self.own_email)
+                except ValueError as e:
+                    self._fail(f"Event {number}: {e}")
+                    continue
+                if item is None or (item['status'] == 'cancelled' and 'recurringEventId' not in item):
+                    self.stats['skipped'] += 1
+                    continue
+                batch.append(item)
+                if len(batch) >= self.chunk_size:
+                    self._write_chunk(batch)
+                    batch = []
+            if batch:
+                self._write_chunk(batch)
+        finally:
+            # Whatever was committed is counted, even if the import stopped part way
+            self._count_orphans()
+            self.analytics.flush()
+
+        if self.stats['imported']:
+            invalidate_conflict_index(self.user.pk)
+            invalidate_booking_slots(self.user.pk)
+        print(f"[ICS_IMPORT] {self.user.username}/{self.calendar_id}: {self.stats['imported']} imported, "
+              f"{self.stats['skipped']} skipped, {self.stats['failed']} failed")
+        return self.stats
+
+    def _fail(self, message: str) -> None:
+        self.stats['failed'] += 1
+        if len(self.stats['errors']) < MAX_REPORTED_ERRORS:
+            self.stats['errors'].append(message)
+
+    def _write_chunk(self, items: List[Dict]) -> None:
+        entries = {}
+        for item in items:
+            fields = event_fields_from_google(item, self.time_zone)
+            # A UID repeated within the chunk: the last copy wins
+            entries[(item['iCalUID'], fields['original_start_datetime'])] = (item, fields)
+
+        existing = set(CalendarEvent.objects
+                       .filter(user=self.user, calendar_id=self.calendar_id,
+                               ical_uid__in={uid for uid, _ in entries})
+                       .values_list('ical_uid', 'original_start_datetime'))
+        new = [entry for key, entry in entries.items() if key not in existing]
+        self.stats['skipped'] += len(items) - len(new)
+
+        google_ids = [None] * len(new)
+        if self.calendar_service is not None:
+            pushable = [index for index, (item, _) in enumerate(new) if 'recurringEventId' not in item]
+            self.stats['skipped'] += len(new) - len(pushable)
+            results = self.calendar_service.batch_import_events(
+                [_import_body(new[index][0]) for index in pushable], self.calendar_id
+            )
+            for index, result in zip(pushable, results):
+                if result['success']:
+                    google_ids[index] = result['event'].get('id')
+                else:
+                    self._fail(f"{new[index][0]['iCalUID']}: {result['error']}")
+            new, google_ids = ([entry for entry, gid in zip(new, google_ids) if gid],
+                               [gid for gid in google_ids if gid])
+
+        rows = [
+            CalendarEvent(user=self.user, calendar_id=self.calendar_id, google_event_id=google_id,
+                          ical_uid=item['iCalUID'], **fields)
+            for (item, fields), google_id in zip(new, google_ids)
+        ]
+        with transaction.atomic():
+            if self.calendar_service is not None and rows:
+                # Wait out a sync of this calendar: it may have mirrored (and counted) the
+                # events just pushed, and the Google ID is unique per calendar
+                list(CalendarSyncState.objects.select_for_update()
+                     .filter(user=self.user, calendar_id=self.calendar_id).values_list('pk'))
+                mirrored = set(CalendarEvent.objects
+                               .filter(user=self.user, calendar_id=self.calendar_id,
+                                       google_event_id__in=[row.google_event_id for row in rows])
+                               .values_list('google_event_id', flat=True))
+                self.stats['imported'] += len(mirrored)
+                rows = [row for row in rows if row.google_event_id not in mirrored]
+            CalendarEvent.objects.bulk_create(rows, batch_size=self.chunk_size)
+        self.stats['imported'] += len(rows)
+
+        self.analytics.masters = self._load_masters(rows)
+        for row in rows:
+            if row.recurring_event_id and (row.calendar_id, row.recurring_event_id) not in self.analytics.masters:
+                self._orphans.append(row)
+            else:
+                self.analytics.add(row)
+
+    def _load_masters(self, rows: Iterable[CalendarEvent]) -> Dict:
+        """Stored series masters that imported instances point at, keyed by (calendar_id, series ID)"""
+        ids = {row.recurring_event_id for row in rows if row.recurring_event_id}
+        if not ids:
+            return {}
+        masters = (CalendarEvent.objects
+                   .filter(user=self.user, calendar_id=self.calendar_id, is_recurring=True)
+                   .filter(Q(ical_uid__in=ids) | Q(google_event_id__in=ids))
+                   .only(*ANALYTICS_FIELDS))
+        return {(m.calendar_id, series_id(m)): m for m in masters}
+
+    def _count_orphans(self) -> None:
+        """Instances whose series came later in the file, now that every series is stored"""
+        if not self._orphans:
+            return
+        self.analytics.masters = self._load_masters(self._orphans)
+        for row in self._orphans:
+            self.analytics.add(row)
+        self._orphans = []
+
+
+# --- Writing -----------------------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return (value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _param(value: str) -> str:
+    value = value.replace('"', '')
+    return f'"{value}"' if any(char in value for char in ';:,') else value
+
+
+def fold(line: str) -> str:
+    """Fold a content line at FOLD_OCTETS octets without splitting a UTF-8 character"""
+    if len(line.encode('utf-8')) <= FOLD_OCTETS:
+        return line
+    parts, current, size, limit = [], [], 0, FOLD_OCTETS
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > limit:
+            parts.append(''.join(current))
+            # Continuation lines start with a space, which counts towards the limit
+            current, size, limit = [], 0, FOLD_OCTETS - 1
+        current.append(char)
+        size += width
+    parts.append(''.join(current))
+    return '\r\n '.join(parts)
+
+
+def _ics_time(name: str, value: datetime, event: CalendarEvent) -> str:
+    time_zone = resolve_time_zone(event.timezone)
+    if event.all_day:
+        return f"{name};VALUE=DATE:{value.astimezone(ZoneInfo(time_zone or 'UTC')).strftime('%Y%m%d')}"
+    if time_zone and time_zone != 'UTC':
+        return f"{name};TZID={time_zone}:{value.astimezone(ZoneInfo(time_zone)).strftime('%Y%m%dT%H%M%S')}"
+    return f"{name}:{value.astimezone(_UTC).strftime('%Y%m%dT%H%M%SZ')}"
+
+
+def event_uid(event: CalendarEvent) -> str:
+    """The event's iCalendar UID; a series and its modified instances share one"""
+    if event.ical_uid:
+        return event.ical_uid
+    if event.google_event_id:
+        return f"{event.recurring_event_id or event.google_event_id}@google.com"
+    return f"{event.pk}@inboxiq"
+
+
+def vevent_lines(event: CalendarEvent) -> List[str]:
+    """An event as unfolded VEVENT content lines"""
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{event_uid(event)}',
+        f"DTSTAMP:{(event.updated_at or datetime.now(_UTC)).astimezone(_UTC).strftime('%Y%m%dT%H%M%SZ')}",
+        _ics_time('DTSTART', event.start_datetime, event),
+        _ics_time('DTEND', event.end_datetime, event),
+    ]
+    if event.recurring_event_id and event.original_start_datetime:
+        lines.append(_ics_time('RECURRENCE-ID', event.original_start_datetime, event))
+    lines.extend(event.recurrence or [])
+    lines.append(f'SUMMARY:{_escape(event.title)}')
+    if event.description:
+        lines.append(f'DESCRIPTION:{_escape(event.description)}')
+    if event.location:
+        lines.append(f'LOCATION:{_escape(event.location)}')
+    if event.status in _STATUSES:
+        lines.append(f'STATUS:{event.status.upper()}')
+    lines.append(f"TRANSP:{'TRANSPARENT' if event.transparency == 'transparent' else 'OPAQUE'}")
+    for attendee in event.attendees or []:
+        if not attendee.get('email'):
+            continue
+        params = [f"PARTSTAT={_RESPONSE_STATUS.get(attendee.get('responseStatus'), 'NEEDS-ACTION')}"]
+        if attendee.get('name'):
+            params.insert(0, f"CN={_param(attendee['name'])}")
+        if attendee.get('optional'):
+            params.append('ROLE=OPT-PARTICIPANT')
+        lines.append(f"ATTENDEE;{';'.join(params)}:mailto:{attendee['email']}")
+    lines.append('END:VEVENT')
+    return lines
+
+
+def iter_ics(user, calendar_ids: Optional[Iterable[str]] = None, start: Optional[datetime] = None,
+             end: Optional[datetime] = None, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    A user's mirrored events as an .ics document, one VEVENT per yielded string
+
+    Rows are read `chunk_size` at a time, each query resuming after the last primary key,
+    so at most `chunk_size` events are in memory.
+    Drafts are left out; series are included whole if any part of them overlaps [start, end).
+    """
+    # X-WR-TIMEZONE tells importers (including ours) which zone all-day dates belong to
+    yield ('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//InboxIQ//Calendar Export//EN\r\nCALSCALE:GREGORIAN\r\n'
+           f'X-WR-TIMEZONE:{primary_time_zone(user)}\r\n')
+
+    rows = CalendarEvent.objects.filter(user=user).exclude(status='draft')
+    if calendar_ids:
+        rows = rows.filter(calendar_id__in=list(calendar_ids))
+    if end is not None:
+        rows = rows.filter(start_datetime__lt=end)
+    if start is not None:
+        rows = rows.filter(
+            Q(is_recurring=False, end_datetime__gt=start)
+            | Q(is_recurring=True, recurrence_ends_at__isnull=True)
+            | Q(is_recurring=True, recurrence_ends_at__gt=start)
+        )
+    last_pk = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+        for event in chunk:
+            yield '\r\n'.join(fold(line) for line in vevent_lines(event)) + '\r\n'
+        if len(chunk) < chunk_size:
+            break
+        last_pk = chunk[-1].pk
+
+    yield 'END:VCALENDAR\r\n'
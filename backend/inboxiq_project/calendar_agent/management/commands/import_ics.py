@@ -0,0 +1,49 @@
+# calendar_agent/management/commands/import_ics.py
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from calendar_agent.google_calendar_service import GoogleCalendarService
+from calendar_agent.ics import DEFAULT_IMPORT_CALENDAR, IMPORT_CHUNK_SIZE, IcsImporter, read_chunks
+from calendar_agent.models import CalendarIntegration
+
+
+class Command(BaseCommand):
+    help = "Import an .ics file into a user's calendar mirror, optionally pushing it to Google Calendar."
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Owner of the imported events')
+        parser.add_argument('path', help='.ics file to import')
+        parser.add_argument('--calendar-id', help=f'Calendar to file events under (default: {DEFAULT_IMPORT_CALENDAR}, '
+                                                  'or "primary" with --push)')
+        parser.add_argument('--time-zone', help='Zone for times without one (default: the file\'s, else the user\'s)')
+        parser.add_argument('--push', action='store_true', help='Also import the events into Google Calendar')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Events per bulk insert')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(username=options['username']).first()
+        if user is None:
+            raise CommandError(f"No user named {options['username']}")
+
+        calendar_service = None
+        if options['push']:
+            integration = CalendarIntegration.objects.filter(user=user).first()
+            if integration is None or not integration.is_token_valid():
+                raise CommandError(f"{user.username} has no valid Google Calendar connection")
+            calendar_service = GoogleCalendarService(integration.access_token, user_id=user.pk)
+
+        importer = IcsImporter(
+            user,
+            calendar_id=options['calendar_id'] or ('primary' if options['push'] else DEFAULT_IMPORT_CALENDAR),
+            time_zone=options['time_zone'],
+            calendar_service=calendar_service,
+            chunk_size=options['chunk_size'],
+        )
+        with open(options['path'], 'rb') as ics_file:
+            stats = importer.run(read_chunks(ics_file))
+
+        for error in stats['errors']:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['imported']} imported, {stats['skipped']} skipped, {stats['failed']} failed "
+            f"into {importer.calendar_id}"
+        ))
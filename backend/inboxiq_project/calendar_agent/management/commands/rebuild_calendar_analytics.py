@@ -0,0 +1,26 @@
+# calendar_agent/management/commands/rebuild_calendar_analytics.py
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from calendar_agent.analytics import rebuild_analytics
+from calendar_agent.models import CalendarSyncState
+from calendar_agent.sync import primary_time_zone
+
+
+class Command(BaseCommand):
+    help = "Recompute the calendar analytics tables from the local CalendarEvent mirror."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', dest='username', help='Only rebuild this username')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.filter(
+            pk__in=CalendarSyncState.objects.values('user_id')
+        )
+        if options['username']:
+            users = users.filter(username=options['username'])
+
+        for user in users:
+            rebuild_analytics(user, primary_time_zone(user))
+            self.stdout.write(f"{user.username}: rebuilt")
+        self.stdout.write(self.style.SUCCESS("Calendar analytics rebuilt"))
@@ -0,0 +1,42 @@
+# calendar_agent/management/commands/sync_calendars.py
+from django.core.management.base import BaseCommand
+
+from calendar_agent.booking import active_links, refresh_booking_slots
+from calendar_agent.google_calendar_service import GoogleCalendarService, GoogleCalendarServiceError
+from calendar_agent.models import CalendarIntegration
+from calendar_agent.sync import CalendarSync, SyncLeaseLostError
+
+
+class Command(BaseCommand):
+    help = "Sync connected users' Google calendars into the local CalendarEvent mirror and refresh booking slots."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', dest='username', help='Only sync this username')
+        parser.add_argument('--full', action='store_true', help='Ignore sync tokens and backfill from scratch')
+
+    def handle(self, *args, **options):
+        integrations = CalendarIntegration.objects.filter(sync_enabled=True).select_related('user')
+        if options['username']:
+            integrations = integrations.filter(user__username=options['username'])
+
+        for integration in integrations:
+            username = integration.user.username
+            if not integration.is_token_valid():
+                self.stdout.write(self.style.WARNING(f"{username}: token expired, skipped"))
+                continue
+
+            try:
+                service = GoogleCalendarService(integration.access_token, user_id=integration.user_id)
+                stats = CalendarSync(integration.user, service).sync(full=options['full'])
+            except (GoogleCalendarServiceError, SyncLeaseLostError) as e:
+                self.stdout.write(self.style.ERROR(f"{username}: {e}"))
+                continue
+
+            for calendar_id, result in stats.items():
+                self.stdout.write(f"{username} {calendar_id}: {result['mode']} "
+                                  f"upserted={result['upserted']} deleted={result['deleted']}")
+
+            # Warm the booking page caches so public traffic never waits on a recompute
+            for link in active_links(integration.user):
+                refresh_booking_slots(link)
+        self.stdout.write(self.style.SUCCESS("Calendar sync finished"))
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:33
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_agent', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calendar_id', models.CharField(max_length=255)),
+                ('summary', models.CharField(blank=True, max_length=255)),
+                ('time_zone', models.CharField(default='UTC', max_length=50)),
+                ('is_primary', models.BooleanField(default=False)),
+                ('sync_token', models.TextField(blank=True)),
+                ('last_full_sync_at', models.DateTimeField(blank=True, null=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'calendar_sync_states',
+            },
+        ),
+        migrations.AddField(
+            model_name='calendarevent',
+            name='calendar_id',
+            field=models.CharField(default='primary', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='calendarevent',
+            name='etag',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='calendarevent',
+            name='google_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='calendarevent',
+            name='transparency',
+            field=models.CharField(choices=[('opaque', 'Busy'), ('transparent', 'Free')], default='opaque', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['user', 'start_datetime'], name='cal_event_user_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['user', 'calendar_id', 'google_event_id'], name='cal_event_user_gid_idx'),
+        ),
+        migrations.AddField(
+            model_name='calendarsyncstate',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_sync_states', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='calendarsyncstate',
+            unique_together={('user', 'calendar_id')},
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def reset_sync_tokens(apps, schema_editor):
+    # Existing tokens were issued for Google-expanded instances (singleEvents=True);
+    # force a full resync so the mirror holds series masters instead
+    CalendarSyncState = apps.get_model('calendar_agent', 'CalendarSyncState')
+    CalendarSyncState.objects.update(sync_token='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_agent', '0002_calendar_sync'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarevent',
+            name='is_recurring',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='calendarevent',
+            name='original_start_datetime',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='calendarevent',
+            name='recurrence',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='calendarevent',
+            name='recurrence_ends_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='calendarevent',
+            name='recurring_event_id',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['user', 'is_recurring', 'start_datetime'], name='cal_event_user_recur_idx'),
+        ),
+        migrations.RunPython(reset_sync_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_agent', '0003_recurring_series'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(max_length=64, unique=True)),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('duration_minutes', models.IntegerField(default=30)),
+                ('slot_step_minutes', models.IntegerField(default=30)),
+                ('days_ahead', models.IntegerField(default=14)),
+                ('min_notice_minutes', models.IntegerField(default=120)),
+                ('calendar_id', models.CharField(default='primary', max_length=255)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_links', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'calendar_booking_links',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookingSlotCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slots', models.JSONField(blank=True, default=list)),
+                ('time_zone', models.CharField(default='UTC', max_length=50)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+                ('is_stale', models.BooleanField(default=True)),
+                ('link', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='slot_cache', to='calendar_agent.bookinglink')),
+            ],
+            options={
+                'db_table': 'calendar_booking_slot_cache',
+            },
+        ),
+        migrations.CreateModel(
+            name='Booking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_datetime', models.DateTimeField()),
+                ('end_datetime', models.DateTimeField()),
+                ('name', models.CharField(max_length=255)),
+                ('email', models.EmailField(max_length=254)),
+                ('notes', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('failed', 'Failed'), ('cancelled', 'Cancelled')], default='pending', max_length=20)),
+                ('google_event_id', models.CharField(blank=True, max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_bookings', to=settings.AUTH_USER_MODEL)),
+                ('link', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='calendar_agent.bookinglink')),
+            ],
+            options={
+                'db_table': 'calendar_bookings',
+                'ordering': ['start_datetime'],
+                'indexes': [models.Index(fields=['user', 'start_datetime'], name='cal_booking_user_start_idx')],
+            },
+        ),
+    ]
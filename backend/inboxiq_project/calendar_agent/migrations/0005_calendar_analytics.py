@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_agent', '0004_booking_links'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarAttendeeTime',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('month', models.DateField()),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('meeting_count', models.IntegerField(default=0)),
+                ('minutes', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_attendee_time', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'calendar_attendee_time',
+                'indexes': [models.Index(fields=['user', 'month'], name='cal_attendee_user_month_idx')],
+                'unique_together': {('user', 'email', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CalendarDailyLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('meeting_count', models.IntegerField(default=0)),
+                ('busy_minutes', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_daily_load', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'calendar_daily_load',
+                'ordering': ['date'],
+                'unique_together': {('user', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CalendarHourlyLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('hour', models.SmallIntegerField()),
+                ('busy_minutes', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_hourly_load', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'calendar_hourly_load',
+                'ordering': ['date', 'hour'],
+                'unique_together': {('user', 'date', 'hour')},
+            },
+        ),
+    ]
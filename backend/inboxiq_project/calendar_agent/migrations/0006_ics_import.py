@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_agent', '0005_calendar_analytics'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarevent',
+            name='ical_uid',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='calendarevent',
+            index=models.Index(fields=['user', 'calendar_id', 'ical_uid'], name='cal_event_user_uid_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_agent', '0006_ics_import'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='calendarmessage',
+            index=models.Index(fields=['session', 'timestamp', 'id'], name='cal_msg_session_ts_idx'),
+        ),
+    ]
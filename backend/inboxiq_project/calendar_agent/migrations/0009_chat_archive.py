@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_agent', '0008_session_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarsession',
+            name='is_archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ArchivedCalendarSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('payload', models.BinaryField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='calendar_agent.calendarsession')),
+            ],
+            options={
+                'db_table': 'calendar_session_archives',
+            },
+        ),
+    ]
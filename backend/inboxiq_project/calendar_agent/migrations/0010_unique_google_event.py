@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-19 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_events(apps, schema_editor):
+    # Concurrent syncs could mirror the same Google event twice; keep the oldest row.
+    # Analytics counted the duplicates too: run rebuild_calendar_analytics afterwards
+    CalendarEvent = apps.get_model('calendar_agent', 'CalendarEvent')
+    duplicates = (CalendarEvent.objects
+                  .filter(google_event_id__isnull=False)
+                  .values('user', 'calendar_id', 'google_event_id')
+                  .annotate(rows=Count('id'), keep=Min('id'))
+                  .filter(rows__gt=1)
+                  .order_by())
+    for group in list(duplicates):
+        (CalendarEvent.objects
+         .filter(user=group['user'], calendar_id=group['calendar_id'], google_event_id=group['google_event_id'])
+         .exclude(pk=group['keep'])
+         .delete())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_agent', '0009_chat_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_events, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='calendarevent',
+            name='cal_event_user_gid_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='calendarevent',
+            constraint=models.UniqueConstraint(fields=('user', 'calendar_id', 'google_event_id'), name='cal_event_user_gid_uniq'),
+        ),
+    ]
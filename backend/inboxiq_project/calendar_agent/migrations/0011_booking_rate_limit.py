@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_agent', '0010_unique_google_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='client_ip',
+            field=models.GenericIPAddressField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['link', 'created_at'], name='cal_booking_link_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['client_ip', 'created_at'], name='cal_booking_ip_created_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-19 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_agent', '0011_booking_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarsyncstate',
+            name='page_token',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='calendarsyncstate',
+            name='lease_owner',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='calendarsyncstate',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calendar_agent', '0012_sync_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calendarmessage',
+            name='insert_key',
+            field=models.UUIDField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
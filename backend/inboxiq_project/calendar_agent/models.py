@@ -1,8 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 import json
 
+from gmail_agent.history import record_messages
+
 User = get_user_model()
 
 
@@ -13,10 +15,21 @@ class CalendarSession(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+
+    # Denormalized from CalendarMessage, kept current by CalendarMessage.save() / record_messages()
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_preview = models.CharField(max_length=200, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    # Messages moved to ArchivedCalendarSession; restored when the session is opened
+    is_archived = models.BooleanField(default=False)
     
     class Meta:
         db_table = 'calendar_sessions'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a user's session list
+            models.Index(fields=['user', 'is_active', '-updated_at', '-id'], name='cal_session_list_idx'),
+        ]
     
     def __str__(self):
         return f"Calendar Session {self.session_id} - {self.user.username}"
@@ -40,8 +53,14 @@ class CalendarEvent(models.Model):
         ('yearly', 'Yearly'),
     ]
     
+    TRANSPARENCY_CHOICES = [
+        ('opaque', 'Busy'),
+        ('transparent', 'Free'),
+    ]
+    
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     google_event_id = models.CharField(max_length=255, null=True, blank=True)
+    calendar_id = models.CharField(max_length=255, default='primary')
     
     # Event details
     title = models.CharField(max_length=255)
@@ -57,6 +76,19 @@ class CalendarEvent(models.Model):
     # Status and metadata
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
     recurrence_rule = models.CharField(max_length=20, choices=RECURRENCE_CHOICES, default='none')
+    transparency = models.CharField(max_length=20, choices=TRANSPARENCY_CHOICES, default='opaque')
+    
+    # Recurring series: the master row holds the raw RRULE/RDATE/EXDATE lines and its first
+    # occurrence; modified or cancelled instances are separate rows pointing at the master
+    is_recurring = models.BooleanField(default=False)
+    recurrence = models.JSONField(default=list, blank=True)
+    recurrence_ends_at = models.DateTimeField(null=True, blank=True)
+    recurring_event_id = models.CharField(max_length=255, blank=True)
+    original_start_datetime = models.DateTimeField(null=True, blank=True)
+    
+    # UID of an event imported from an .ics file; imported rows that were not pushed to
+    # Google have no google_event_id, and their instances point at this in recurring_event_id
+    ical_uid = models.CharField(max_length=255, blank=True)
     
     # Attendees (stored as JSON)
     attendees = models.JSONField(default=list, blank=True)
@@ -64,6 +96,10 @@ class CalendarEvent(models.Model):
     # Reminders (stored as JSON)
     reminders = models.JSONField(default=list, blank=True)
     
+    # Google sync metadata
+    etag = models.CharField(max_length=100, blank=True)
+    google_updated_at = models.DateTimeField(null=True, blank=True)
+    
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -71,6 +107,15 @@ class CalendarEvent(models.Model):
     class Meta:
         db_table = 'calendar_events'
         ordering = ['start_datetime']
+        indexes = [
+            models.Index(fields=['user', 'start_datetime'], name='cal_event_user_start_idx'),
+            models.Index(fields=['user', 'is_recurring', 'start_datetime'], name='cal_event_user_recur_idx'),
+            models.Index(fields=['user', 'calendar_id', 'ical_uid'], name='cal_event_user_uid_idx'),
+        ]
+        constraints = [
+            # One mirror row per Google event; rows without a Google ID (local .ics imports) are exempt
+            models.UniqueConstraint(fields=['user', 'calendar_id', 'google_event_id'], name='cal_event_user_gid_uniq'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.start_datetime.strftime('%Y-%m-%d %H:%M')}"
@@ -129,15 +174,42 @@ class CalendarMessage(models.Model):
     
     # Metadata for special message types (stored as JSON)
     metadata = models.JSONField(default=dict, blank=True)
+    # Set by ChatTurn on backends that can't return ids from a multi-row INSERT, to read them back
+    insert_key = models.UUIDField(null=True, blank=True, editable=False, db_index=True)
     
     class Meta:
         db_table = 'calendar_messages'
         ordering = ['timestamp']
+        indexes = [
+            # Keyset pagination of a session's history
+            models.Index(fields=['session', 'timestamp', 'id'], name='cal_msg_session_ts_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            record_messages(CalendarSession, self.session_id, [self])
     
     def __str__(self):
         return f"{self.message_type}: {self.content[:50]}..."
 
 
+class ArchivedCalendarSession(models.Model):
+    """An inactive calendar session's messages, stored as zlib-compressed JSON (see gmail_agent.archive)"""
+    session = models.OneToOneField(CalendarSession, on_delete=models.CASCADE, related_name='archive')
+    message_count = models.PositiveIntegerField(default=0)
+    payload = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'calendar_session_archives'
+
+    def __str__(self):
+        return f"Archive of {self.session_id} ({self.message_count} messages)"
+
+
 class CalendarIntegration(models.Model):
     """User's calendar integration settings"""
     
@@ -177,6 +249,177 @@ class CalendarIntegration(models.Model):
         return timezone.now() < self.token_expires_at
 
 
+class CalendarSyncState(models.Model):
+    """Incremental sync position for one of a user's Google calendars"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calendar_sync_states')
+    calendar_id = models.CharField(max_length=255)
+    summary = models.CharField(max_length=255, blank=True)
+    time_zone = models.CharField(max_length=50, default='UTC')
+    is_primary = models.BooleanField(default=False)
+    
+    # nextSyncToken from the last completed events.list; empty means a full sync is needed
+    sync_token = models.TextField(blank=True)
+    # nextPageToken after the last page committed by an incremental sync that has not finished
+    page_token = models.TextField(blank=True)
+    # A sync holds the lease while it pages through Google; others wait for it or skip
+    lease_owner = models.CharField(max_length=32, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    last_full_sync_at = models.DateTimeField(null=True, blank=True)
+    last_synced_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'calendar_sync_states'
+        unique_together = ['user', 'calendar_id']
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.calendar_id}"
+
+
+class BookingLink(models.Model):
+    """Public booking page through which anyone with the link can book time with the user"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='booking_links')
+    slug = models.SlugField(max_length=64, unique=True)
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    
+    # Slot shape and bookable range
+    duration_minutes = models.IntegerField(default=30)
+    slot_step_minutes = models.IntegerField(default=30)
+    days_ahead = models.IntegerField(default=14)
+    min_notice_minutes = models.IntegerField(default=120)
+    calendar_id = models.CharField(max_length=255, default='primary')
+    
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'calendar_booking_links'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.title} ({self.slug}) - {self.user.username}"
+
+
+class BookingSlotCache(models.Model):
+    """Precomputed bookable slots for a booking link, rebuilt from the local calendar mirror"""
+    
+    link = models.OneToOneField(BookingLink, on_delete=models.CASCADE, related_name='slot_cache')
+    slots = models.JSONField(default=list, blank=True)  # ISO start times
+    time_zone = models.CharField(max_length=50, default='UTC')
+    computed_at = models.DateTimeField(null=True, blank=True)
+    
+    # Set by calendar sync and by new bookings; the next read recomputes
+    is_stale = models.BooleanField(default=True)
+    
+    class Meta:
+        db_table = 'calendar_booking_slot_cache'
+    
+    def __str__(self):
+        return f"Slots for {self.link.slug}"
+
+
+class Booking(models.Model):
+    """A slot booked through a booking link"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('confirmed', 'Confirmed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    
+    link = models.ForeignKey(BookingLink, on_delete=models.CASCADE, related_name='bookings')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calendar_bookings')
+    start_datetime = models.DateTimeField()
+    end_datetime = models.DateTimeField()
+    
+    # Who booked
+    name = models.CharField(max_length=255)
+    email = models.EmailField()
+    notes = models.TextField(blank=True)
+    client_ip = models.GenericIPAddressField(null=True, blank=True)  # for the public page's rate limits
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    google_event_id = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'calendar_bookings'
+        ordering = ['start_datetime']
+        indexes = [
+            models.Index(fields=['user', 'start_datetime'], name='cal_booking_user_start_idx'),
+            models.Index(fields=['link', 'created_at'], name='cal_booking_link_created_idx'),
+            models.Index(fields=['client_ip', 'created_at'], name='cal_booking_ip_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} - {self.start_datetime.strftime('%Y-%m-%d %H:%M')}"
+
+
+class CalendarDailyLoad(models.Model):
+    """Meetings and busy minutes per local day, maintained incrementally by calendar sync"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calendar_daily_load')
+    date = models.DateField()
+    meeting_count = models.IntegerField(default=0)
+    busy_minutes = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'calendar_daily_load'
+        unique_together = ['user', 'date']
+        ordering = ['date']
+    
+    def __str__(self):
+        return f"{self.user.username} {self.date}: {self.meeting_count} meetings"
+
+
+class CalendarHourlyLoad(models.Model):
+    """Busy minutes per local hour of each day, maintained incrementally by calendar sync"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calendar_hourly_load')
+    date = models.DateField()
+    hour = models.SmallIntegerField()
+    busy_minutes = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'calendar_hourly_load'
+        unique_together = ['user', 'date', 'hour']
+        ordering = ['date', 'hour']
+    
+    def __str__(self):
+        return f"{self.user.username} {self.date} {self.hour:02d}:00: {self.busy_minutes}m"
+
+
+class CalendarAttendeeTime(models.Model):
+    """Meetings and minutes spent with each attendee per month, maintained incrementally by calendar sync"""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='calendar_attendee_time')
+    email = models.EmailField()
+    month = models.DateField()  # First day of the month
+    name = models.CharField(max_length=255, blank=True)
+    meeting_count = models.IntegerField(default=0)
+    minutes = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'calendar_attendee_time'
+        unique_together = ['user', 'email', 'month']
+        indexes = [
+            models.Index(fields=['user', 'month'], name='cal_attendee_user_month_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.email} {self.month:%Y-%m}: {self.minutes}m"
+
+
 class EventTemplate(models.Model):
     """Templates for common event types"""
     
@@ -0,0 +1,164 @@
+# backend/inboxiq_project/calendar_agent/recurrence.py
+"""
+Local expansion of recurring events.
+
+The calendar mirror stores each recurring series once (the master event with its RRULE /
+RDATE / EXDATE lines) plus one row per modified or cancelled instance. Occurrences are
+generated here on demand for the requested window only, so a year-long query never has to
+fetch or store thousands of expanded instances.
+
+Rules are expanded in the event's local wall-clock time and then localised, so a weekly
+09:00 meeting stays at 09:00 across DST changes, as Google does.
+"""
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from dateutil.rrule import rruleset, rrulestr
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover - Python < 3.9
+    from backports.zoneinfo import ZoneInfo
+
+_UNTIL_RE = re.compile(r'UNTIL=(\d{8})(T\d{6})?(Z?)', re.IGNORECASE)
+_FREQ_RE = re.compile(r'FREQ=(\w+)', re.IGNORECASE)
+
+# Series with neither COUNT nor UNTIL have no last occurrence
+UNBOUNDED = None
+
+
+def _parse_ical_datetime(value: str, tz: ZoneInfo, params: Dict[str, str]) -> datetime:
+    """An RDATE/EXDATE value as a naive datetime in the series' local time"""
+    if params.get('VALUE') == 'DATE' or len(value) == 8:
+        return datetime.strptime(value[:8], '%Y%m%d')
+    parsed = datetime.strptime(value.rstrip('Z'), '%Y%m%dT%H%M%S')
+    if value.endswith('Z'):
+        return parsed.replace(tzinfo=ZoneInfo('UTC')).astimezone(tz).replace(tzinfo=None)
+    if 'TZID' in params:
+        return parsed.replace(tzinfo=ZoneInfo(params['TZID'])).astimezone(tz).replace(tzinfo=None)
+    return parsed
+
+
+def _localise_until(rule: str, tz: ZoneInfo, all_day: bool) -> str:
+    """Rewrite a UTC UNTIL as local wall-clock time, since expansion runs on naive local datetimes"""
+    def replace(match):
+        day, clock, utc = match.group(1), match.group(2) or '', match.group(3)
+        if not clock:
+            return f'UNTIL={day}T235959' if not all_day else f'UNTIL={day}'
+        until = datetime.strptime(day + clock, '%Y%m%dT%H%M%S')
+        if utc:
+            until = until.replace(tzinfo=ZoneInfo('UTC')).astimezone(tz).replace(tzinfo=None)
+        if all_day:
+            return f"UNTIL={until.strftime('%Y%m%d')}"
+        return f"UNTIL={until.strftime('%Y%m%dT%H%M%S')}"
+    return _UNTIL_RE.sub(replace, rule)
+
+
+def build_ruleset(recurrence: Iterable[str], dtstart: datetime, time_zone: str = 'UTC',
+                  all_day: bool = False) -> rruleset:
+    """
+    Parse Google's `recurrence` lines (RRULE, EXRULE, RDATE, EXDATE) into a dateutil rruleset
+    over naive local datetimes starting at `dtstart` (the master's first start).
+    """
+    tz = ZoneInfo(time_zone or 'UTC')
+    local_start = dtstart.astimezone(tz).replace(tzinfo=None)
+    if all_day:
+        local_start = datetime.combine(local_start.date(), datetime.min.time())
+
+    rules = rruleset()
+    rules.rdate(local_start)
+    for line in recurrence or []:
+        name, _, value = line.partition(':')
+        name, *param_parts = name.split(';')
+        params = dict(p.split('=', 1) for p in param_parts if '=' in p)
+        name = name.upper()
+
+        if name in ('RRULE', 'EXRULE'):
+            rule = rrulestr(_localise_until(value, tz, all_day), dtstart=local_start)
+            (rules.rrule if name == 'RRULE' else rules.exrule)(rule)
+        elif name in ('RDATE', 'EXDATE'):
+            for item in value.split(','):
+                when = _parse_ical_datetime(item.strip(), tz, params)
+                if all_day:
+                    when = datetime.combine(when.date(), datetime.min.time())
+                (rules.rdate if name == 'RDATE' else rules.exdate)(when)
+    return rules
+
+
+def series_end(recurrence: Iterable[str], dtstart: datetime, duration: timedelta,
+               time_zone: str = 'UTC', all_day: bool = False) -> Optional[datetime]:
+    """End of the last occurrence, or None for a series with no COUNT or UNTIL"""
+    rule_lines = [line for line in recurrence or [] if line.upper().startswith('RRULE')]
+    if any('COUNT=' not in line.upper() and 'UNTIL=' not in line.upper() for line in rule_lines):
+        return UNBOUNDED
+    tz = ZoneInfo(time_zone or 'UTC')
+    last = None
+    for last in build_ruleset(recurrence, dtstart, time_zone, all_day):
+        pass
+    if last is None:
+        return dtstart + duration
+    return _localise(last, tz) + duration
+
+
+def recurrence_frequency(recurrence: Iterable[str]) -> str:
+    """FREQ of the first RRULE in lowercase ('daily', 'weekly', ...), or 'none'"""
+    for line in recurrence or []:
+        match = _FREQ_RE.search(line)
+        if line.upper().startswith('RRULE') and match:
+            return match.group(1).lower()
+    return 'none'
+
+
+def _localise(naive: datetime, tz: ZoneInfo) -> datetime:
+    return naive.replace(tzinfo=tz)
+
+
+def local_duration(start: datetime, end: datetime, time_zone: str = 'UTC') -> timedelta:
+    """Wall-clock length of an event in its own time zone (an all-day event is always whole days)"""
+    tz = ZoneInfo(time_zone or 'UTC')
+    return end.astimezone(tz) - start.astimezone(tz)
+
+
+def instance_id(master_id: str, start: datetime, all_day: bool) -> str:
+    """Google's ID for an instance of a recurring event"""
+    if all_day:
+        return f"{master_id}_{start.strftime('%Y%m%d')}"
+    return f"{master_id}_{start.astimezone(ZoneInfo('UTC')).strftime('%Y%m%dT%H%M%SZ')}"
+
+
+def expand(recurrence: Iterable[str],
+           dtstart: datetime,
+           duration: timedelta,
+           window_start: datetime,
+           window_end: datetime,
+           time_zone: str = 'UTC',
+           all_day: bool = False,
+           overridden: Optional[Set[datetime]] = None) -> Iterator[Tuple[datetime, datetime]]:
+    """
+    Lazily yield (start, end) for each occurrence overlapping [window_start, window_end),
+    skipping occurrences whose original start is in `overridden` (moved or cancelled instances).
+    """
+    tz = ZoneInfo(time_zone or 'UTC')
+    rules = build_ruleset(recurrence, dtstart, time_zone, all_day)
+    overridden = overridden or set()
+
+    # Occurrences that started before the window but are still running overlap it
+    search_from = (window_start - duration).astimezone(tz).replace(tzinfo=None)
+    for naive in rules.xafter(search_from, inc=True):
+        start = _localise(naive, tz)
+        if start >= window_end:
+            return
+        end = start + duration
+        if end <= window_start or start in overridden:
+            continue
+        yield start, end
+
+
+def original_starts(rows: Iterable) -> Dict[str, Set[datetime]]:
+    """Group exception rows' original start times by master event ID"""
+    by_master: Dict[str, Set[datetime]] = {}
+    for recurring_event_id, original_start in rows:
+        if original_start is not None:
+            by_master.setdefault(recurring_event_id, set()).add(original_start)
+    return by_master
@@ -0,0 +1,536 @@
+# backend/inboxiq_project/calendar_agent/sync.py
+"""
+Local mirror of a user's Google calendars in CalendarEvent.
+
+The first sync of a calendar backfills a window of events (CALENDAR_SYNC_PAST_DAYS back,
+CALENDAR_SYNC_FUTURE_DAYS ahead) and stores the returned nextSyncToken in CalendarSyncState.
+Later syncs send that token and apply only the changes, including deletions. If Google
+rejects the token (HTTP 410) the calendar is backfilled again and rows it no longer has are dropped.
+
+Pages are fetched outside any transaction; each one is applied, with its page token, in a
+short transaction of its own. Concurrent syncs of a calendar are kept apart by a lease on
+its CalendarSyncState row rather than a row lock held across Google requests, and an
+interrupted incremental sync resumes from the last page it committed.
+
+Recurring series are stored once (master + modified/cancelled instances) and expanded
+locally per query window (see recurrence.py), rather than as Google-expanded instances.
+
+Event listing and free-time search read the indexed local rows instead of calling the API.
+"""
+import copy
+import heapq
+import uuid
+from datetime import datetime, time, timedelta
+from itertools import islice
+from time import monotonic, sleep
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .booking import invalidate_booking_slots
+from .analytics import ANALYTICS_FIELDS, AnalyticsDelta, load_masters, rebuild_analytics
+from .conflicts import invalidate_conflict_index
+from .google_calendar_service import (
+    GoogleCalendarService, SyncTokenExpiredError, _parse_rfc3339, invalidate_calendar_list_cache,
+)
+from .models import CalendarEvent, CalendarSyncState
+from .recurrence import expand, instance_id, local_duration, original_starts, recurrence_frequency, series_end
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover - Python < 3.9
+    from backports.zoneinfo import ZoneInfo
+
+# Statuses that never block time
+NON_BLOCKING_STATUSES = ('draft', 'cancelled')
+
+_EVENT_FIELDS = ['title', 'description', 'location', 'start_datetime', 'end_datetime', 'timezone',
+                 'all_day', 'status', 'transparency', 'attendees', 'reminders', 'etag', 'google_updated_at',
+                 'is_recurring', 'recurrence', 'recurrence_ends_at', 'recurrence_rule',
+                 'recurring_event_id', 'original_start_datetime']
+
+
+class SyncLeaseLostError(Exception):
+    """A sync's lease on its calendar expired and another sync took it over"""
+    pass
+
+
+class CalendarSync:
+    """Keeps CalendarEvent rows for one user in step with their Google calendars"""
+
+    def __init__(self, user, calendar_service: GoogleCalendarService):
+        self.user = user
+        self.calendar_service = calendar_service
+        # Analytics buckets use the primary calendar's zone; sync() takes it from the calendar list
+        self.time_zone = None
+
+    def sync(self, full: bool = False) -> Dict:
+        """
+        Sync every calendar in the user's calendar list
+
+        Args:
+            full: Ignore stored sync tokens and backfill from scratch
+
+        Returns:
+            Per-calendar stats: {calendar_id: {'mode', 'upserted', 'deleted'}}
+        """
+        if full:
+            invalidate_calendar_list_cache(self.user.pk)
+        # Always revalidate here: a sync is the point where calendar list changes are picked up
+        calendars = self.calendar_service.list_calendars(revalidate=True)
+        states = {s.calendar_id: s for s in CalendarSyncState.objects.filter(user=self.user)}
+        primary = next((c for c in calendars if c.get('primary')), None)
+        self.time_zone = (primary or {}).get('time_zone') or primary_time_zone(self.user)
+
+        stats = {}
+        for calendar in calendars:
+            states.pop(calendar['id'], None)
+            stats[calendar['id']] = self.sync_calendar(calendar, full=full)
+
+        # Calendars the user unsubscribed from: drop their mirror
+        for state in states.values():
+            with transaction.atomic():
+                if not list(CalendarSyncState.objects.select_for_update().filter(pk=state.pk)
+                            .filter(_lease_free(timezone.now())).values_list('pk')):
+                    # A concurrent sync already dropped it, or is still syncing it; the next sync retries
+                    continue
+                dropped = CalendarEvent.objects.filter(user=self.user, calendar_id=state.calendar_id)
+                analytics = AnalyticsDelta(self.user, self.time_zone, {
+                    (event.calendar_id, event.google_event_id): event
+                    for event in dropped.filter(is_recurring=True).only(*ANALYTICS_FIELDS)
+                })
+                for event in dropped.only(*ANALYTICS_FIELDS):
+                    analytics.remove(event)
+                analytics.flush()
+                dropped.delete()
+                state.delete()
+
+        if states or any(result['upserted'] or result['deleted'] for result in stats.values()):
+            invalidate_conflict_index(self.user.pk)
+            invalidate_booking_slots(self.user.pk)
+
+        return stats
+
+    def sync_calendar(self, calendar: Dict, full: bool = False) -> Dict:
+        """
+        Sync one calendar from the calendar list: incremental when a token is stored,
+        otherwise (or on 410) a windowed full sync
+
+        The sync holds the calendar's lease from the first fetch until its last page is
+        committed, so concurrent syncs of it (chat staleness checks, sync_calendars, other
+        workers) run one after another, each from the token the previous one stored. A sync
+        that cannot get the lease within CALENDAR_SYNC_LEASE_WAIT_SECONDS is skipped.
+
+        Raises:
+            SyncLeaseLostError: if the lease ran out mid-sync and another sync took over
+        """
+        state, _ = CalendarSyncState.objects.get_or_create(user=self.user, calendar_id=calendar['id'])
+        owner = self._take_lease(state)
+        if owner is None:
+            print(f"[CALENDAR_SYNC] {self.user.username}/{calendar['id']} is being synced elsewhere, skipped")
+            return {'mode': 'skipped', 'upserted': 0, 'deleted': 0}
+
+        try:
+            state.refresh_from_db()
+            state.summary = (calendar.get('summary') or '')[:255]
+            state.time_zone = calendar.get('time_zone') or 'UTC'
+            state.is_primary = bool(calendar.get('primary'))
+            if full:
+                state.sync_token = ''
+                state.page_token = ''
+            return self._sync_leased(state, owner)
+        finally:
+            (CalendarSyncState.objects.filter(pk=state.pk, lease_owner=owner)
+             .update(lease_owner='', lease_expires_at=None))
+
+    def _take_lease(self, state: CalendarSyncState) -> Optional[str]:
+        """Claim the calendar's lease, waiting while another sync holds it. Returns the owner key."""
+        owner = uuid.uuid4().hex
+        deadline = monotonic() + getattr(settings, 'CALENDAR_SYNC_LEASE_WAIT_SECONDS', 10)
+        while True:
+            now = timezone.now()
+            # A single conditional UPDATE: only one worker can move the lease off a free row
+            if (CalendarSyncState.objects.filter(pk=state.pk).filter(_lease_free(now))
+                    .update(lease_owner=owner, lease_expires_at=now + _lease_duration())):
+                return owner
+            if monotonic() >= deadline:
+                return None
+            sleep(0.25)
+
+    def _sync_leased(self, state: CalendarSyncState, owner: str) -> Dict:
+        if state.sync_token:
+            try:
+                pages = self.calendar_service.list_event_changes(state.calendar_id, sync_token=state.sync_token,
+                                                                 page_token=state.page_token or None)
+                return self._apply(state, owner, pages, mode='incremental')
+            except SyncTokenExpiredError:
+                print(f"[CALENDAR_SYNC] Sync token expired for {self.user.username}/{state.calendar_id}, resyncing")
+                state.page_token = ''
+
+        now = timezone.now()
+        pages = self.calendar_service.list_event_changes(
+            state.calendar_id,
+            time_min=now - timedelta(days=getattr(settings, 'CALENDAR_SYNC_PAST_DAYS', 30)),
+            time_max=now + timedelta(days=getattr(settings, 'CALENDAR_SYNC_FUTURE_DAYS', 365)),
+        )
+        return self._apply(state, owner, pages, mode='full')
+
+    def _save_leased(self, state: CalendarSyncState, owner: str) -> None:
+        """Inside a transaction: save the state if this sync still holds the lease, and renew it"""
+        if not list(CalendarSyncState.objects.select_for_update()
+                    .filter(pk=state.pk, lease_owner=owner).values_list('pk')):
+            raise SyncLeaseLostError(f"Lost the sync lease on {self.user.username}/{state.calendar_id}")
+        state.lease_owner = owner
+        state.lease_expires_at = timezone.now() + _lease_duration()
+        state.save()
+
+    def _apply(self, state: CalendarSyncState, owner: str,
+               pages: Iterable[Tuple[List[Dict], str, str]], mode: str) -> Dict:
+        """
+        Write the changes a page at a time, each page in its own transaction
+
+        Only one page of raw events is held at a time, and no transaction is open while the
+        next page is fetched. An incremental sync stores each page's nextPageToken with its
+        changes so an interrupted sync resumes after the last committed page; the sync token
+        advances only once every page is in. A full sync remembers the IDs it has seen and
+        removes the other rows at the end; interrupted, it starts over, which is safe because
+        unchanged rows are skipped by ETag.
+        """
+        rows = CalendarEvent.objects.filter(user=self.user, calendar_id=state.calendar_id,
+                                            google_event_id__isnull=False)
+        now = timezone.now()
+        time_zone = self.time_zone or primary_time_zone(self.user)
+        analytics = AnalyticsDelta(self.user, time_zone)
+        # Pre-sync state of series masters changed so far: later pages subtract their
+        # instances' old contribution against these
+        replaced_masters = {}
+        # Modified instances are counted at the end, once their series' final state is stored
+        deferred = set()
+        seen = set()
+        stats = {'mode': mode, 'upserted': 0, 'deleted': 0}
+        next_token = ''
+
+        try:
+            for items, sync_token, page_token in pages:
+                next_token = sync_token or next_token
+                with transaction.atomic():
+                    self._apply_page(state, rows, items, mode, now, analytics, replaced_masters,
+                                     deferred, seen, stats)
+                    if mode == 'incremental' and page_token:
+                        state.page_token = page_token
+                    self._save_leased(state, owner)
+
+            with transaction.atomic():
+                if mode == 'full':
+                    # Anything not in the backfill is gone (or outside the window)
+                    unseen = [pk for pk, event_id in rows.values_list('pk', 'google_event_id')
+                              if event_id not in seen]
+                    for start in range(0, len(unseen), 500):
+                        removed_events = list(CalendarEvent.objects.filter(pk__in=unseen[start:start + 500])
+                                              .only(*ANALYTICS_FIELDS))
+                        self._subtract(analytics, removed_events, replaced_masters, deferred)
+                        stats['deleted'] += self._delete(removed_events)
+
+                pending = list(deferred)
+                for start in range(0, len(pending), 500):
+                    instances = list(rows.filter(google_event_id__in=pending[start:start + 500])
+                                     .only(*ANALYTICS_FIELDS))
+                    analytics.masters = load_masters(self.user, instances)
+                    for event in instances:
+                        analytics.add(event)
+                analytics.flush()
+
+                state.sync_token = next_token
+                state.page_token = ''
+                state.last_synced_at = now
+                if mode == 'full':
+                    state.last_full_sync_at = now
+                self._save_leased(state, owner)
+        except Exception:
+            if stats['upserted'] or stats['deleted']:
+                # Committed pages are kept; their modified instances were taken out of the
+                # analytics but not yet added back, and caches may hold the old events
+                rebuild_analytics(self.user, time_zone)
+                invalidate_conflict_index(self.user.pk)
+                invalidate_booking_slots(self.user.pk)
+            raise
+
+        return stats
+
+    def _apply_page(self, state: CalendarSyncState, rows, items: List[Dict], mode: str, now: datetime,
+                    analytics: AnalyticsDelta, replaced_masters: Dict, deferred: set, seen: set,
+                    stats: Dict) -> None:
+        """Write one page of raw events to the mirror and analytics (the caller holds a transaction)"""
+        # A change feed may mention an event more than once; the last entry wins
+        latest = {item['id']: item for item in items}
+        # A cancelled instance of a series is kept (it suppresses that occurrence);
+        # a cancelled single event or series is removed
+        live = [item for item in latest.values() if not _is_removal(item)]
+        removed_events = []
+        if mode == 'full':
+            seen.update(item['id'] for item in live)
+        else:
+            removed_ids = [event_id for event_id, item in latest.items() if _is_removal(item)]
+            if removed_ids:
+                removed_events = list(rows.filter(Q(google_event_id__in=removed_ids) |
+                                                  Q(recurring_event_id__in=removed_ids))
+                                      .only(*ANALYTICS_FIELDS))
+
+        existing = {
+            event.google_event_id: event
+            for event in rows.filter(google_event_id__in=[item['id'] for item in live])
+        }
+        changes = [(existing.get(item['id']), event_fields_from_google(item, state.time_zone), item['id'])
+                   for item in live]
+        # Analytics: subtract every row's old state before anything changes, add new states after
+        self._subtract(analytics, removed_events + [
+            event for event, fields, _ in changes if event is not None and event.etag != fields['etag']
+        ], replaced_masters, deferred)
+        stats['deleted'] += self._delete(removed_events)
+
+        to_create, to_update = [], []
+        for event, fields, event_id in changes:
+            if event is None:
+                to_create.append(CalendarEvent(
+                    user=self.user, calendar_id=state.calendar_id, google_event_id=event_id, **fields
+                ))
+            elif event.etag != fields['etag']:
+                for name, value in fields.items():
+                    setattr(event, name, value)
+                event.updated_at = now
+                to_update.append(event)
+
+        CalendarEvent.objects.bulk_create(to_create, batch_size=500)
+        CalendarEvent.objects.bulk_update(to_update, _EVENT_FIELDS + ['updated_at'], batch_size=500)
+        stats['upserted'] += len(to_create) + len(to_update)
+
+        for event in to_create + to_update:
+            if event.recurring_event_id:
+                deferred.add(event.google_event_id)
+            else:
+                analytics.add(event)
+        analytics.flush()
+
+    def _subtract(self, analytics: AnalyticsDelta, old_events: List[CalendarEvent],
+                  replaced_masters: Dict, deferred: set) -> None:
+        """Take rows' current state out of the analytics before they are changed or deleted"""
+        # Instances changed earlier in this sync were never added back yet
+        old_events = [event for event in old_events if event.google_event_id not in deferred]
+        analytics.masters = {**load_masters(self.user, old_events), **replaced_masters}
+        for event in old_events:
+            analytics.remove(event)
+            if event.is_recurring:
+                # Copied: the row is about to take its new field values
+                replaced_masters.setdefault((event.calendar_id, event.google_event_id), copy.copy(event))
+
+    @staticmethod
+    def _delete(events: List[CalendarEvent]) -> int:
+        if not events:
+            return 0
+        deleted, _ = CalendarEvent.objects.filter(pk__in=[event.pk for event in events]).delete()
+        return deleted
+
+
+def _lease_free(now: datetime) -> Q:
+    return Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now)
+
+
+def _lease_duration() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'CALENDAR_SYNC_LEASE_SECONDS', 300))
+
+
+def _is_removal(item: Dict) -> bool:
+    return item.get('status') == 'cancelled' and not item.get('recurringEventId')
+
+
+def _google_time(info: Dict, time_zone: str) -> datetime:
+    """A Google start/end/originalStartTime object as an aware datetime (dates are local midnight)"""
+    if 'dateTime' in info:
+        return _parse_rfc3339(info['dateTime'])
+    return datetime.combine(datetime.fromisoformat(info['date']).date(), time(0), tzinfo=ZoneInfo(time_zone))
+
+
+def event_fields_from_google(item: Dict, default_time_zone: str = 'UTC') -> Dict:
+    """Map a raw Google event onto CalendarEvent field values"""
+    # Cancelled instances of a series carry only originalStartTime
+    original_info = item.get('originalStartTime')
+    start_info = item.get('start') or original_info or {}
+    end_info = item.get('end') or start_info
+    time_zone = start_info.get('timeZone') or default_time_zone or 'UTC'
+
+    # All-day: dates are local to the calendar, end date is exclusive
+    start = _google_time(start_info, time_zone)
+    end = _google_time(end_info, time_zone)
+    all_day = 'dateTime' not in start_info
+
+    recurrence = item.get('recurrence') or []
+    recurrence_ends_at = None
+    if recurrence:
+        recurrence_ends_at = series_end(recurrence, start, local_duration(start, end, time_zone),
+                                        time_zone, all_day)
+    frequency = recurrence_frequency(recurrence)
+
+    attendees = []
+    declined_by_self = False
+    for attendee in item.get('attendees', []):
+        attendees.append({
+            'email': attendee.get('email', ''),
+            'name': attendee.get('displayName', ''),
+            'responseStatus': attendee.get('responseStatus', 'needsAction'),
+            'optional': attendee.get('optional', False),
+        })
+        if attendee.get('self') and attendee.get('responseStatus') == 'declined':
+            declined_by_self = True
+
+    status = item.get('status', 'confirmed')
+    transparency = item.get('transparency', 'opaque')
+    if declined_by_self:
+        # Free/busy ignores events the user declined; mirror that
+        transparency = 'transparent'
+
+    return {
+        'title': (item.get('summary') or 'Untitled Event')[:255],
+        'description': item.get('description', ''),
+        'location': (item.get('location') or '')[:500],
+        'start_datetime': start,
+        'end_datetime': end,
+        'timezone': time_zone[:50],
+        'all_day': all_day,
+        'status': status if status in dict(CalendarEvent.STATUS_CHOICES) else 'confirmed',
+        'transparency': transparency if transparency in dict(CalendarEvent.TRANSPARENCY_CHOICES) else 'opaque',
+        'attendees': attendees,
+        'reminders': item.get('reminders', {}).get('overrides', []),
+        'etag': item.get('etag', '')[:100],
+        'google_updated_at': _parse_rfc3339(item['updated']) if item.get('updated') else None,
+        'is_recurring': bool(recurrence),
+        'recurrence': recurrence,
+        'recurrence_ends_at': recurrence_ends_at,
+        'recurrence_rule': frequency if frequency in dict(CalendarEvent.RECURRENCE_CHOICES) else 'none',
+        'recurring_event_id': item.get('recurringEventId', ''),
+        'original_start_datetime': _google_time(original_info, time_zone) if original_info else None,
+    }
+
+
+def ensure_synced(user, calendar_service: GoogleCalendarService, max_age_seconds: int = None) -> bool:
+    """
+    Run a sync if the user's mirror is missing or older than `max_age_seconds`
+    (default settings.CALENDAR_SYNC_MAX_AGE_SECONDS). Returns True if a sync ran.
+    """
+    if max_age_seconds is None:
+        max_age_seconds = getattr(settings, 'CALENDAR_SYNC_MAX_AGE_SECONDS', 60)
+
+    # A calendar whose first sync never completed has no last_synced_at and counts as stale
+    oldest = (CalendarSyncState.objects
+              .filter(user=user)
+              .order_by(F('last_synced_at').asc(nulls_first=True))
+              .values_list('last_synced_at', flat=True)
+              .first())
+    if oldest and timezone.now() - oldest < timedelta(seconds=max_age_seconds):
+        return False
+
+    CalendarSync(user, calendar_service).sync()
+    return True
+
+
+def primary_time_zone(user) -> str:
+    """Time zone of the user's primary calendar as recorded by the last sync"""
+    state = CalendarSyncState.objects.filter(user=user, is_primary=True).only('time_zone').first()
+    return state.time_zone if state else 'UTC'
+
+
+def _event_rows(user, calendar_ids: Optional[Iterable[str]] = None, busy_only: bool = False):
+    rows = CalendarEvent.objects.filter(user=user).exclude(status__in=NON_BLOCKING_STATUSES)
+    if busy_only:
+        rows = rows.filter(transparency='opaque')
+    if calendar_ids is not None:
+        rows = rows.filter(calendar_id__in=list(calendar_ids))
+    return rows
+
+
+def series_id(event: CalendarEvent) -> str:
+    """What a series' modified instances reference in recurring_event_id: the Google ID, or the .ics UID"""
+    return event.google_event_id or event.ical_uid
+
+
+def _occurrences(master: CalendarEvent, start: datetime, end: datetime,
+                 overridden) -> Iterator[CalendarEvent]:
+    """Unsaved CalendarEvent copies of a series' occurrences in [start, end)"""
+    duration = local_duration(master.start_datetime, master.end_datetime, master.timezone)
+    for occurrence_start, occurrence_end in expand(master.recurrence, master.start_datetime, duration,
+                                                   start, end, master.timezone, master.all_day, overridden):
+        instance = copy.copy(master)
+        instance.pk = None
+        instance.google_event_id = instance_id(series_id(master), occurrence_start, master.all_day)
+        instance.recurring_event_id = series_id(master)
+        instance.original_start_datetime = occurrence_start
+        instance.start_datetime = occurrence_start
+        instance.end_datetime = occurrence_end
+        instance.is_recurring = False
+        instance.recurrence = []
+        yield instance
+
+
+def local_events(user, start: datetime, end: datetime, limit: Optional[int] = None,
+                 calendar_ids: Optional[Iterable[str]] = None, busy_only: bool = False) -> List[CalendarEvent]:
+    """
+    Mirrored events overlapping [start, end), ordered by start
+
+    Single events and modified instances come from an index range scan on (user, start);
+    recurring series that overlap the window are expanded locally, skipping occurrences that
+    were moved or cancelled. Expanded occurrences are unsaved CalendarEvent copies.
+    """
+    singles = list(_event_rows(user, calendar_ids, busy_only)
+                   .filter(is_recurring=False, start_datetime__lt=end, end_datetime__gt=start)
+                   .order_by('start_datetime')[:limit])
+
+    masters = list(_event_rows(user, calendar_ids, busy_only)
+                   .filter(is_recurring=True, start_datetime__lt=end)
+                   .filter(Q(recurrence_ends_at__isnull=True) | Q(recurrence_ends_at__gt=start)))
+    if not masters:
+        return singles
+
+    exceptions = (CalendarEvent.objects
+                  .filter(user=user, recurring_event_id__in=[series_id(m) for m in masters])
+                  .values_list('calendar_id', 'recurring_event_id', 'original_start_datetime'))
+    overridden = original_starts(((cal_id, event_id), original) for cal_id, event_id, original in exceptions)
+
+    streams = [singles] + [
+        _occurrences(master, start, end, overridden.get((master.calendar_id, series_id(master))))
+        for master in masters
+    ]
+    merged = heapq.merge(*streams, key=lambda event: event.start_datetime)
+    return list(islice(merged, limit))
+
+
+def local_busy_intervals(user, start: datetime, end: datetime,
+                         calendar_ids: Optional[Iterable[str]] = None) -> List[Tuple[datetime, datetime]]:
+    """(start, end) pairs of mirrored events, including recurring occurrences, that block time in [start, end)"""
+    return [(event.start_datetime, event.end_datetime)
+            for event in local_events(user, start, end, calendar_ids=calendar_ids, busy_only=True)]
+
+
+def serialize_local_event(event: CalendarEvent, time_zone: str = 'UTC') -> Dict:
+    """A mirrored event in the same shape as GoogleCalendarService._format_event output"""
+    tz = ZoneInfo(time_zone or 'UTC')
+    if event.all_day:
+        start = event.start_datetime.astimezone(ZoneInfo(event.timezone or 'UTC')).date().isoformat()
+        end = event.end_datetime.astimezone(ZoneInfo(event.timezone or 'UTC')).date().isoformat()
+    else:
+        start = event.start_datetime.astimezone(tz).isoformat()
+        end = event.end_datetime.astimezone(tz).isoformat()
+    return {
+        'id': event.google_event_id or '',
+        'etag': event.etag or None,
+        'calendar_id': event.calendar_id,
+        'title': event.title,
+        'description': event.description,
+        'location': event.location,
+        'start_datetime': start,
+        'end_datetime': end,
+        'all_day': event.all_day,
+        'status': event.status,
+        'attendees': event.attendees,
+    }
@@ -1,3 +1,393 @@
-from django.test import TestCase
+import json
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from calendar_agent import datetime_parser
+from calendar_agent.availability import find_recurring_free_slots, occurrence_days, rank_slots
+from calendar_agent.booking import BookingError, reserve_slot
+from calendar_agent.conflicts import conflict_index, invalidate_conflict_index
+from calendar_agent.event_templates import TemplateUsage
+from calendar_agent.google_calendar_service import (
+    GoogleCalendarService, GoogleCalendarServiceError, SyncTokenExpiredError,
+)
+from calendar_agent.models import (
+    Booking, BookingLink, CalendarEvent, CalendarIntegration, CalendarMessage, CalendarSession, CalendarSyncState,
+)
+from calendar_agent.sync import CalendarSync
+
+User = get_user_model()
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover - Python < 3.9
+    from backports.zoneinfo import ZoneInfo
+
+LONDON = ZoneInfo('Europe/London')
+
+
+class OccurrenceDaysTests(SimpleTestCase):
+    start = datetime(2026, 10, 19, 10, 0, tzinfo=LONDON)  # a Monday
+
+    def test_utc_until(self):
+        days = occurrence_days('FREQ=WEEKLY;BYDAY=TU;UNTIL=20261201T000000Z', self.start, time_zone='Europe/London')
+        self.assertEqual(days[0], date(2026, 10, 20))
+        self.assertEqual(days[-1], date(2026, 12, 1))
+        self.assertEqual(len(days), 7)
+
+    def test_floating_until_is_local(self):
+        days = occurrence_days('RRULE:FREQ=WEEKLY;BYDAY=TU;UNTIL=20261110T080000', self.start,
+                               time_zone='Europe/London')
+        self.assertEqual(days[-1], date(2026, 11, 10))
+
+    def test_date_until_includes_that_day(self):
+        days = occurrence_days('FREQ=WEEKLY;BYDAY=TU;UNTIL=20261103', self.start, time_zone='America/New_York')
+        self.assertEqual(days, [date(2026, 10, 20), date(2026, 10, 27), date(2026, 11, 3)])
+
+    def test_end_and_count(self):
+        end = datetime(2026, 10, 20, 12, 0, tzinfo=LONDON)
+        self.assertEqual(occurrence_days('FREQ=DAILY;COUNT=5', self.start, end, 'Europe/London'),
+                         [date(2026, 10, 19), date(2026, 10, 20)])
+
+    def test_invalid_rule(self):
+        with self.assertRaises(ValueError):
+            occurrence_days('FREQ=FORTNIGHTLY', self.start)
+
+
+class RankSlotsTests(SimpleTestCase):
+    horizon = datetime(2026, 10, 19, 8, 0, tzinfo=LONDON)
+
+    def test_candidates_at_each_step(self):
+        free = [(datetime(2026, 10, 20, 9, 0, tzinfo=LONDON), datetime(2026, 10, 20, 11, 0, tzinfo=LONDON))]
+        starts = sorted(slot['start_datetime'][11:16] for slot in rank_slots(free, 60, self.horizon, 'Europe/London'))
+        self.assertEqual(starts, ['09:00', '09:15', '09:30', '09:45', '10:00'])
+
+    def test_preferred_hours_inside_a_window(self):
+        free = [(datetime(2026, 10, 20, 9, 0, tzinfo=LONDON), datetime(2026, 10, 20, 17, 0, tzinfo=LONDON))]
+        best = rank_slots(free, 60, self.horizon, 'Europe/London', preferred_hours=(14, 16), limit=1)[0]
+        self.assertEqual(best['start_datetime'], '2026-10-20T14:00:00+01:00')
+
+    def test_recurring_slots_with_until(self):
+        slots = find_recurring_free_slots({}, 'FREQ=WEEKLY;BYDAY=TU;UNTIL=20261201T000000Z', self.horizon, 30,
+                                          time_zone='Europe/London', preferred_hours=(15, 16), limit=1)
+        self.assertEqual(slots[0]['start_datetime'], '2026-10-20T15:00:00+01:00')
+        self.assertEqual(len(slots[0]['occurrences']), 7)
+
+
+class DatetimeParserTests(SimpleTestCase):
+    now = datetime(2026, 10, 19, 10, 0, tzinfo=LONDON)  # Monday morning
+
+    def parse(self, text):
+        return datetime_parser.parse(text, 'Europe/London', self.now)
+
+    def test_impossible_date_defers(self):
+        result = self.parse('meeting feb 30 at 3pm')
+        self.assertLess(result.confidence, 0.6)
+
+    def test_this_weekday_already_passed_rolls_forward(self):
+        result = self.parse('this monday at 9am')
+        self.assertEqual(result.start, datetime(2026, 10, 26, 9, 0, tzinfo=LONDON))
+
+    def test_recurrence_is_kept_out_of_the_title(self):
+        result = self.parse('standup every day at 9am')
+        self.assertEqual(result.title, 'Standup')
+        self.assertEqual(result.recurrence, 'RRULE:FREQ=DAILY')
+        self.assertEqual(result.start, datetime(2026, 10, 20, 9, 0, tzinfo=LONDON))
+        self.assertGreaterEqual(result.confidence, 0.6)
+
+
+def raw_event(event_id, hour, etag='1', status='confirmed'):
+    return {'id': event_id, 'etag': etag, 'summary': event_id, 'status': status,
+            'start': {'dateTime': f'2026-10-20T{hour:02d}:00:00+01:00'},
+            'end': {'dateTime': f'2026-10-20T{hour + 1:02d}:00:00+01:00'}}
+
+
+class FakeCalendarService:
+    """Scripted events.list feeds keyed by (sync_token, page_token); 'fail' in a feed raises there"""
+
+    def __init__(self, feeds):
+        self.feeds = feeds
+        self.calls = []
+
+    def list_calendars(self, revalidate=False):
+        return [{'id': 'primary', 'summary': 'Me', 'time_zone': 'Europe/London', 'primary': True}]
+
+    def list_event_changes(self, calendar_id, sync_token=None, time_min=None, time_max=None, page_token=None):
+        self.calls.append((sync_token, page_token))
+        if sync_token == 'expired':
+            raise SyncTokenExpiredError('Sync token expired for calendar primary')
+        for page in self.feeds[(sync_token, page_token)]:
+            if page == 'fail':
+                raise GoogleCalendarServiceError('Failed to get events: 503')
+            yield page
+
+
+class CalendarSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('sync-user')
+
+    def state(self, **fields):
+        state, _ = CalendarSyncState.objects.get_or_create(user=self.user, calendar_id='primary')
+        CalendarSyncState.objects.filter(pk=state.pk).update(**fields)
+        state.refresh_from_db()
+        return state
+
+    def event_ids(self):
+        return set(CalendarEvent.objects.filter(user=self.user).values_list('google_event_id', flat=True))
+
+    def test_expired_token_falls_back_to_full_sync(self):
+        self.state(sync_token='expired')
+        CalendarEvent.objects.create(user=self.user, calendar_id='primary', google_event_id='gone', title='Gone',
+                                     start_datetime=timezone.now(), end_datetime=timezone.now() + timedelta(hours=1))
+        service = FakeCalendarService({(None, None): [([raw_event('a', 9)], '', 'p2'),
+                                                      ([raw_event('b', 11)], 'tok-1', '')]})
+
+        stats = CalendarSync(self.user, service).sync()
+
+        self.assertEqual(stats['primary'], {'mode': 'full', 'upserted': 2, 'deleted': 1})
+        self.assertEqual(self.event_ids(), {'a', 'b'})
+        state = self.state()
+        self.assertEqual(state.sync_token, 'tok-1')
+        self.assertIsNotNone(state.last_full_sync_at)
+        self.assertEqual(state.lease_owner, '')
+
+    def test_interrupted_incremental_sync_resumes_from_committed_page(self):
+        self.state(sync_token='tok-1')
+        service = FakeCalendarService({
+            ('tok-1', None): [([raw_event('a', 9)], '', 'p2'), 'fail'],
+            ('tok-1', 'p2'): [([raw_event('a', 9, status='cancelled'), raw_event('b', 11)], 'tok-2', '')],
+        })
+
+        with self.assertRaises(GoogleCalendarServiceError):
+            CalendarSync(self.user, service).sync()
+        state = self.state()
+        self.assertEqual((state.sync_token, state.page_token, state.lease_owner), ('tok-1', 'p2', ''))
+        self.assertEqual(self.event_ids(), {'a'})
+
+        stats = CalendarSync(self.user, service).sync()
+        self.assertEqual(service.calls[-1], ('tok-1', 'p2'))
+        self.assertEqual(stats['primary'], {'mode': 'incremental', 'upserted': 1, 'deleted': 1})
+        self.assertEqual(self.event_ids(), {'b'})
+        state = self.state()
+        self.assertEqual((state.sync_token, state.page_token), ('tok-2', ''))
+
+    @override_settings(CALENDAR_SYNC_LEASE_WAIT_SECONDS=0)
+    def test_held_lease_skips_and_expired_lease_is_taken_over(self):
+        self.state(sync_token='tok-1', lease_owner='other', lease_expires_at=timezone.now() + timedelta(minutes=1))
+        service = FakeCalendarService({('tok-1', None): [([raw_event('a', 9)], 'tok-2', '')]})
+
+        stats = CalendarSync(self.user, service).sync()
+        self.assertEqual(stats['primary']['mode'], 'skipped')
+        self.assertEqual(service.calls, [])
+
+        self.state(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        stats = CalendarSync(self.user, service).sync()
+        self.assertEqual(stats['primary']['mode'], 'incremental')
+        self.assertEqual(self.state().sync_token, 'tok-2')
+
+
+class ConflictIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('index-user')
+        CalendarSyncState.objects.create(user=self.user, calendar_id='primary')
+        start = timezone.now() + timedelta(days=1)
+        CalendarEvent.objects.create(user=self.user, calendar_id='primary', google_event_id='busy', title='Busy',
+                                     status='confirmed', start_datetime=start, end_datetime=start + timedelta(hours=1))
+        invalidate_conflict_index(self.user.pk)
+
+    def test_kept_in_memory_until_the_version_moves(self):
+        index = conflict_index(self.user)
+        self.assertEqual(len(index), 1)
+        with self.assertNumQueries(0):
+            self.assertIs(conflict_index(self.user), index)
+
+        invalidate_conflict_index(self.user.pk)
+        self.assertIsNot(conflict_index(self.user), index)
+
+    @override_settings(CALENDAR_CONFLICT_VERSION_CHECK_SECONDS=0)
+    def test_version_moved_by_another_worker_rebuilds(self):
+        index = conflict_index(self.user)
+        self.assertIs(conflict_index(self.user), index)
+        # What invalidate_conflict_index() does in another process
+        CalendarSyncState.objects.filter(user=self.user).update(updated_at=timezone.now() + timedelta(seconds=1))
+        self.assertIsNot(conflict_index(self.user), index)
+
+
+class ConfirmEventTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('confirm-user')
+        CalendarIntegration.objects.create(user=self.user, access_token='token',
+                                           token_expires_at=timezone.now() + timedelta(hours=1))
+        CalendarSyncState.objects.create(user=self.user, calendar_id='primary', time_zone='Europe/London')
+        self.session = CalendarSession.objects.create(user=self.user, session_id='session-1')
+        self.start = (timezone.now() + timedelta(days=2)).replace(microsecond=0)
+        self.draft = CalendarMessage.objects.create(session=self.session, message_type='assistant', content='Draft',
+                                                    metadata={'type': 'event_draft', 'event_info': {
+                                                        'title': 'Review', 'time_zone': 'Europe/London',
+                                                        'start_datetime': self.start.isoformat(), 'duration': 30,
+                                                    }})
+        self.client.force_login(self.user)
+        invalidate_conflict_index(self.user.pk)
+
+    def confirm(self):
+        return self.client.post(reverse('confirm_calendar_event'), json.dumps({
+            'session_id': 'session-1', 'message_id': self.draft.pk,
+        }), content_type='application/json')
+
+    @mock.patch.object(GoogleCalendarService, '__init__', return_value=None)
+    @mock.patch.object(GoogleCalendarService, 'create_event', return_value={'id': 'evt-1', 'title': 'Review'})
+    def test_confirm_creates_once_and_indexes_the_event(self, create_event, _init):
+        self.assertEqual(len(conflict_index(self.user)), 0)
+
+        response = self.confirm()
+        self.assertEqual(response.status_code, 201)
+        kwargs = create_event.call_args.kwargs
+        self.assertEqual(kwargs['title'], 'Review')
+        self.assertEqual(kwargs['end_datetime'] - kwargs['start_datetime'], timedelta(minutes=30))
+        self.assertEqual(str(kwargs['start_datetime'].tzinfo), 'Europe/London')
+
+        self.draft.refresh_from_db()
+        self.assertEqual(self.draft.metadata['event_id'], 'evt-1')
+        conflicts = conflict_index(self.user).conflicts(self.start, self.start + timedelta(minutes=10))
+        self.assertEqual([conflict['id'] for conflict in conflicts], ['evt-1'])
+
+        self.assertEqual(self.confirm().status_code, 409)
+        self.assertEqual(create_event.call_count, 1)
+
+    @mock.patch.object(GoogleCalendarService, '__init__', return_value=None)
+    @mock.patch.object(GoogleCalendarService, 'create_event', return_value={'id': 'evt-2', 'title': 'Sync'})
+    def test_template_use_is_counted_on_confirm(self, create_event, _init):
+        self.draft.metadata['event_info']['template'] = {'id': 7, 'name': 'Sync'}
+        self.draft.save()
+        with mock.patch('calendar_agent.views.template_usage') as template_usage:
+            self.assertEqual(self.confirm().status_code, 201)
+        template_usage.record.assert_called_once_with(7)
+
+    @mock.patch.object(GoogleCalendarService, '__init__', return_value=None)
+    @mock.patch.object(GoogleCalendarService, 'create_event', side_effect=GoogleCalendarServiceError('quota'))
+    def test_failed_create_can_be_retried(self, create_event, _init):
+        self.assertEqual(self.confirm().status_code, 502)
+        self.draft.refresh_from_db()
+        self.assertNotIn('confirming', self.draft.metadata)
+        self.assertEqual(self.confirm().status_code, 502)
+        self.assertEqual(create_event.call_count, 2)
+
+
+class FakeCalendarList:
+    """calendarList() of the API client: one calendar, answering If-None-Match with a 304"""
+
+    def __init__(self, etag='"v1"'):
+        self.etag = etag
+        self.requests = []
+
+    def __call__(self):
+        return self
+
+    def list(self, **kwargs):
+        request = mock.Mock(headers={})
+
+        def execute():
+            self.requests.append(dict(request.headers))
+            if request.headers.get('If-None-Match') == self.etag:
+                raise HttpError(mock.Mock(status=304, reason='Not Modified'), b'')
+            return {'etag': self.etag, 'items': [{'id': 'primary', 'summary': 'Me', 'primary': True}]}
+        request.execute = execute
+        return request
+
+
+class CalendarListCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('list-user')
+        CalendarSyncState.objects.create(user=self.user, calendar_id='primary')
+        cache.clear()
+        self.calendar_list = FakeCalendarList()
+        self.calendar_service = GoogleCalendarService.__new__(GoogleCalendarService)
+        self.calendar_service.user_id = self.user.pk
+        self.calendar_service.service = mock.Mock(calendarList=self.calendar_list)
+
+    def test_fresh_list_is_served_until_the_version_moves(self):
+        self.calendar_service.list_calendars()
+        self.calendar_service.list_calendars()
+        self.assertEqual(self.calendar_list.requests, [{}])
+
+        # A sync on another worker moves the version: the cached copy is revalidated, not trusted
+        CalendarSyncState.objects.filter(user=self.user).update(updated_at=timezone.now() + timedelta(seconds=1))
+        calendars = self.calendar_service.list_calendars()
+        self.assertEqual(self.calendar_list.requests[-1], {'If-None-Match': '"v1"'})
+        self.assertEqual([calendar['id'] for calendar in calendars], ['primary'])
+        self.calendar_service.list_calendars()
+        self.assertEqual(len(self.calendar_list.requests), 2)
+
+
+@mock.patch('calendar_agent.event_templates.EventTemplate')
+class TemplateUsageTests(SimpleTestCase):
+    def test_flushes_at_the_count(self, event_template):
+        usage = TemplateUsage(flush_count=2, flush_seconds=60)
+        usage.record(1)
+        self.assertEqual(usage.pending(), {1: 1})
+        usage.record(1)
+        self.assertEqual(usage.pending(), {})
+        event_template.objects.filter.assert_called_once_with(pk__in=[1])
+        self.assertIsNone(usage._timer)
+
+    def test_flushes_on_a_timer_when_quiet(self, event_template):
+        usage = TemplateUsage(flush_count=50, flush_seconds=0.05)
+        usage.record(3)
+        deadline = time.monotonic() + 2
+        while usage.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(usage.pending(), {})
+        event_template.objects.filter.assert_called_once_with(pk__in=[3])
+
+
+@mock.patch.object(GoogleCalendarService, '__init__', return_value=None)
+@mock.patch.object(GoogleCalendarService, 'create_event', return_value={'id': 'evt-1', 'title': 'Intro call'})
+class BookingTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('booking-owner')
+        CalendarIntegration.objects.create(user=self.owner, access_token='token',
+                                           token_expires_at=timezone.now() + timedelta(hours=1))
+        CalendarSyncState.objects.create(user=self.owner, calendar_id='primary', is_primary=True,
+                                         time_zone='Europe/London', last_synced_at=timezone.now())
+        self.link = BookingLink.objects.create(user=self.owner, slug='intro', title='Intro call')
+
+    def slots(self):
+        return [slot['start_datetime'] for slot in self.client.get('/api/calendar/book/intro/').json()['slots']]
+
+    def book(self, start, email, ip='10.0.0.1'):
+        body = json.dumps({'start': start, 'name': 'Guest', 'email': email})
+        return self.client.post('/api/calendar/book/intro/', body, content_type='application/json', REMOTE_ADDR=ip)
+
+    def test_slot_cannot_be_reserved_twice(self, create_event, _init):
+        start = self.slots()[0]
+        self.assertEqual(self.book(start, 'a@example.com').status_code, 201)
+        self.assertNotIn(start, self.slots())
+
+        # Straight to the reservation, as a request that read the page before the first booking would
+        with self.assertRaises(BookingError) as raised:
+            reserve_slot('intro', datetime.fromisoformat(start), 'Guest', 'b@example.com')
+        self.assertEqual((raised.exception.code, raised.exception.status), ('SLOT_UNAVAILABLE', 409))
+        self.assertEqual(Booking.objects.filter(status__in=['pending', 'confirmed']).count(), 1)
+        self.assertEqual(create_event.call_count, 1)
+
+    @override_settings(CALENDAR_BOOKING_MAX_PER_IP=2)
+    def test_rate_limited_per_client_ip(self, create_event, _init):
+        starts = self.slots()
+        self.assertEqual(self.book(starts[0], 'a@example.com').status_code, 201)
+        self.assertEqual(self.book(starts[1], 'b@example.com').status_code, 201)
+
+        response = self.book(starts[2], 'c@example.com')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json()['code'], 'RATE_LIMITED')
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(create_event.call_count, 2)
+
+        self.assertEqual(self.book(starts[2], 'c@example.com', ip='10.0.0.2').status_code, 201)
 
-# Create your tests here.
@@ -8,4 +8,24 @@ urlpatterns = [
     path('start/', views.start_calendar_session, name='start_calendar_session'),
     path('send/', views.send_calendar_message, name='send_calendar_message'),
     path('history/<str:session_id>/', views.get_calendar_history, name='get_calendar_history'),
+    path('sessions/', views.get_calendar_sessions, name='get_calendar_sessions'),
+    path('events/confirm/', views.confirm_calendar_event, name='confirm_calendar_event'),
+
+    # Scheduling
+    path('availability/', views.find_group_availability, name='find_group_availability'),
+    path('availability/recurring/', views.find_recurring_availability, name='find_recurring_availability'),
+
+    # Batched event writes
+    path('events/bulk/', views.bulk_events, name='bulk_events'),
+
+    # Analytics
+    path('analytics/', views.get_calendar_analytics, name='get_calendar_analytics'),
+
+    # iCalendar import / export
+    path('ics/import/', views.import_ics, name='import_ics'),
+    path('ics/export/', views.export_ics, name='export_ics'),
+
+    # Booking links (owner) and public booking pages
+    path('booking-links/', views.booking_links, name='booking_links'),
+    path('book/<slug:slug>/', views.public_booking_page, name='public_booking_page'),
 ]
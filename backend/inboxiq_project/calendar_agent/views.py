@@ -1,10 +1,12 @@
 # backend/inboxiq_project/calendar_agent/views.py
 
 import json
+import re
 import uuid
 import traceback
-from datetime import datetime, timedelta
-from django.http import JsonResponse
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
@@ -12,9 +14,31 @@ from django.shortcuts import get_object_or_404
 from django.db import transaction
 from django.utils import timezone
 
-from .models import CalendarSession, CalendarMessage, CalendarEvent, CalendarIntegration
+from .models import BookingLink, CalendarSession, CalendarMessage, CalendarEvent, CalendarIntegration
 from .google_calendar_service import GoogleCalendarService, GoogleCalendarServiceError
+from .analytics import calendar_analytics
+from .attendees import extract_attendee_names, resolve_attendees
+from .availability import find_free_slots, occurrence_days
+from .booking import (
+    BookingError, booking_slots, confirm_booking, new_booking_slug, refresh_booking_slots, reserve_slot,
+    serialize_booking, serialize_booking_link,
+)
+from .conflicts import conflict_index, record_created_event
+from .event_templates import template_event_info, template_index, template_usage
+from .ics import DEFAULT_IMPORT_CALENDAR, IcsImporter, iter_ics, resolve_time_zone
+from .sync import ensure_synced, local_busy_intervals, local_events, primary_time_zone, serialize_local_event
+from . import datetime_parser
 from gmail_agent.gemini_service import GeminiService  # Reuse Gemini service
+from gmail_agent.archive import ensure_rehydrated
+from gmail_agent.chat_turn import ChatTurn
+from gmail_agent.history import CursorError, message_page, session_page
+from gmail_agent.idempotency import idempotent
+from gmail_agent.model_metrics import model_metrics
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # pragma: no cover - Python < 3.9
+    from backports.zoneinfo import ZoneInfo
 
 
 def _cors_response(resp):
@@ -77,13 +101,14 @@ def start_calendar_session(request):
 
 @csrf_exempt
 @require_http_methods(["POST", "OPTIONS"])
+@idempotent('calendar_send')
 def send_calendar_message(request):
     """Send a message in a calendar session"""
     if request.method == 'OPTIONS':
         response = JsonResponse({})
         response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
         response['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie, Idempotency-Key'
         response['Access-Control-Allow-Credentials'] = 'true'
         return response
 
@@ -113,19 +138,18 @@ def send_calendar_message(request):
             return _cors_response(response)
 
         calendar_session = get_object_or_404(CalendarSession, session_id=session_id, user=request.user)
+        ensure_rehydrated(calendar_session, 'calendar')
 
-        # Create user message
-        user_message = CalendarMessage.objects.create(
-            session=calendar_session,
-            message_type='user',
-            content=message_content
-        )
+        # Rows for this turn are queued and written together by turn.flush()
+        turn = ChatTurn(calendar_session, CalendarMessage)
+        turn.add_message('user', message_content)
 
         # Initialize Gemini service
         try:
-            gemini_service = GeminiService(use_mock=True)
+            gemini_service = GeminiService.from_settings()
         except Exception as e:
             print(f"[CALENDAR_MESSAGE] Error initializing Gemini: {e}")
+            turn.flush()
             response = JsonResponse({
                 'message': {
                     'id': None,
@@ -138,10 +162,13 @@ def send_calendar_message(request):
 
         # Analyze calendar intent
         try:
-            calendar_intent = analyze_calendar_intent(message_content, gemini_service)
+            calendar_intent = analyze_calendar_intent(message_content, gemini_service,
+                                                      time_zone=primary_time_zone(request.user),
+                                                      user=request.user)
             print(f"[CALENDAR_MESSAGE] Intent analysis: {calendar_intent}")
         except Exception as e:
             print(f"[CALENDAR_MESSAGE] Error analyzing intent: {e}")
+            turn.flush()
             response = JsonResponse({
                 'message': {
                     'id': None,
@@ -154,15 +181,16 @@ def send_calendar_message(request):
 
         # Handle different calendar intents
         if calendar_intent.get('intent') == 'create_event':
-            response_data = handle_create_event_intent(request.user, calendar_session, calendar_intent, gemini_service)
+            response_data = handle_create_event_intent(request.user, turn, calendar_intent, gemini_service)
         elif calendar_intent.get('intent') == 'find_free_time':
-            response_data = handle_find_free_time_intent(request.user, calendar_session, calendar_intent, gemini_service)
+            response_data = handle_find_free_time_intent(request.user, turn, calendar_intent, gemini_service)
         elif calendar_intent.get('intent') == 'list_events':
-            response_data = handle_list_events_intent(request.user, calendar_session, calendar_intent, gemini_service)
+            response_data = handle_list_events_intent(request.user, turn, calendar_intent, gemini_service)
         else:
-            response_data = handle_general_calendar_chat(calendar_session, message_content, gemini_service)
+            response_data = handle_general_calendar_chat(turn, message_content, gemini_service)
 
-        calendar_session.save()
+        # Whatever a handler didn't write (e.g. the user message when it failed)
+        turn.flush()
         response = JsonResponse(response_data)
         return _cors_response(response)
 
@@ -173,8 +201,27 @@ def send_calendar_message(request):
         return _cors_response(response)
 
 
-def analyze_calendar_intent(message: str, gemini_service) -> dict:
-    """Analyze user message for calendar-related intents"""
+def analyze_calendar_intent(message: str, gemini_service, time_zone: str = 'UTC', now=None, user=None) -> dict:
+    """
+    Analyze user message for calendar-related intents
+    
+    The rule-based pass runs first: a message naming one of the user's event templates, or
+    an event request whose date/time the local parser resolves confidently, is answered
+    without a model call.
+    """
+    local_intent = _fallback_intent_analysis(message, time_zone, now)
+    if user is not None and local_intent['intent'] in ('create_event', 'general_chat'):
+        # Without a "book"/"schedule"-style verb the template name must appear as written
+        with model_metrics.track('calendar_template', backend='local') as call:
+            template_intent = _template_intent(user, message, time_zone, now,
+                                               phrase_only=local_intent['intent'] == 'general_chat')
+            call.cache = 'hit' if template_intent else 'miss'
+        if template_intent:
+            return template_intent
+    min_confidence = getattr(settings, 'CALENDAR_PARSER_MIN_CONFIDENCE', 0.6)
+    if (local_intent['intent'] == 'create_event'
+            and local_intent['extracted_info'].get('parser_confidence', 0) >= min_confidence):
+        return local_intent
     
     calendar_prompt = f"""
     Analyze this message for calendar-related intent:
@@ -227,18 +274,59 @@ def analyze_calendar_intent(message: str, gemini_service) -> dict:
         # Try to parse JSON response
         try:
             intent_data = json.loads(response)
-            return intent_data
         except json.JSONDecodeError:
             # Fallback: simple keyword matching
-            return _fallback_intent_analysis(message)
+            return local_intent
+        
+        if intent_data.get('intent') == 'create_event':
+            # The model returns dates as free text; keep whatever the parser did resolve
+            if local_intent['intent'] == 'create_event':
+                parsed = {k: v for k, v in local_intent['extracted_info'].items() if k != 'description'}
+            else:
+                parsed = datetime_parser.parse(message, time_zone, now).as_extracted_info()
+                attendee_names = extract_attendee_names(message)
+                if attendee_names:
+                    parsed['attendees'] = attendee_names
+            model_info = intent_data.get('extracted_info') or {}
+            if not parsed.get('parser_confidence'):
+                parsed = {}
+            if model_info.get('title'):
+                parsed.pop('title', None)
+            intent_data['extracted_info'] = {**model_info, **parsed}
+        return intent_data
             
     except Exception as e:
         print(f"Error in calendar intent analysis: {e}")
-        return _fallback_intent_analysis(message)
+        return local_intent
+
+
+def _template_intent(user, message: str, time_zone: str = 'UTC', now=None, phrase_only: bool = False):
+    """A create_event intent rendered from the user's event template named in the message, or None"""
+    try:
+        index = template_index(user)
+    except Exception as e:
+        print(f"[EVENT_TEMPLATES] Could not load templates: {e}")
+        return None
+    template = index.match(message) if len(index) else None
+    if template is None or (phrase_only and not template.name_pattern.search(message)):
+        return None
+
+    # Keep the template's name (e.g. "1:1") away from the date/time parser
+    parsed = datetime_parser.parse(template.name_pattern.sub(' ', message), time_zone, now)
+    if phrase_only and not parsed.found and not re.search(r'\b(?:usual|regular)\b', message, re.IGNORECASE):
+        # "what does sync mean?" names a template without asking for one
+        return None
+    extracted_info = template_event_info(template, parsed.as_extracted_info(),
+                                         extract_attendee_names(message), user)
+    return {
+        'intent': 'create_event',
+        'confidence': 0.9,
+        'extracted_info': extracted_info
+    }
 
 
-def _fallback_intent_analysis(message: str) -> dict:
-    """Fallback intent analysis using simple keyword matching"""
+def _fallback_intent_analysis(message: str, time_zone: str = 'UTC', now=None) -> dict:
+    """Fallback intent analysis using simple keyword matching and the local date/time parser"""
     
     message_lower = message.lower()
     
@@ -274,13 +362,19 @@ def _fallback_intent_analysis(message: str) -> dict:
     ]) and not any(phrase in message_lower for phrase in [
         'show', 'list', 'what do i have', 'my calendar', 'free', 'available'
     ]):
+        parsed = datetime_parser.parse(message, time_zone, now)
+        extracted_info = {
+            'description': message,
+            **parsed.as_extracted_info(),
+            'title': parsed.title or 'New Event',
+        }
+        attendee_names = extract_attendee_names(message)
+        if attendee_names:
+            extracted_info['attendees'] = attendee_names
         return {
             'intent': 'create_event',
             'confidence': 0.7,
-            'extracted_info': {
-                'title': 'New Event',
-                'description': message
-            }
+            'extracted_info': extracted_info
         }
     
     # Default to general chat
@@ -291,7 +385,7 @@ def _fallback_intent_analysis(message: str) -> dict:
     }
 
 
-def handle_create_event_intent(user, calendar_session, intent_data, gemini_service):
+def handle_create_event_intent(user, turn, intent_data, gemini_service):
     """Handle create event intent"""
     try:
         extracted_info = intent_data.get('extracted_info', {})
@@ -299,32 +393,50 @@ def handle_create_event_intent(user, calendar_session, intent_data, gemini_servi
         # Create a draft event
         event_title = extracted_info.get('title', 'New Event')
         event_description = extracted_info.get('description', '')
-        
-        # For now, create a draft event in our database
-        # In a full implementation, you'd parse dates/times and create actual calendar events
+        start_value = extracted_info.get('start_datetime')
+        end_value = extracted_info.get('end_datetime')
         
         response_content = f"I'll help you create an event: '{event_title}'"
+        if extracted_info.get('template'):
+            response_content += f" (from your '{extracted_info['template']['name']}' template)"
         
-        if event_description:
+        if start_value:
+            start_time = datetime.fromisoformat(start_value)
+            if extracted_info.get('all_day'):
+                response_content += f"\n\nWhen: {start_time.strftime('%A, %B %d')} (all day)"
+            else:
+                response_content += f"\n\nWhen: {start_time.strftime('%A, %B %d at %I:%M %p')}"
+                if end_value:
+                    response_content += f" – {datetime.fromisoformat(end_value).strftime('%I:%M %p')}"
+                response_content += _conflict_notice(user, extracted_info)
+        elif event_description:
             response_content += f"\n\nDescription: {event_description}"
         
+        attendee_names = extracted_info.get('attendees') or []
+        if isinstance(attendee_names, str):
+            attendee_names = [attendee_names]
+        if extracted_info.get('location'):
+            response_content += f"\n\nWhere: {extracted_info['location']}"
+        if attendee_names:
+            response_content += _attendee_notice(user, attendee_names, extracted_info)
+        
         response_content += "\n\nTo complete the event creation, I'll need:"
-        response_content += "\n• Date and time"
-        response_content += "\n• Duration (if not specified)"
-        response_content += "\n• Location (optional)"
-        response_content += "\n• Attendees (optional)"
+        if not start_value:
+            response_content += "\n• Date and time"
+        if not end_value and not extracted_info.get('all_day'):
+            response_content += "\n• Duration (if not specified)"
+        if not extracted_info.get('location'):
+            response_content += "\n• Location (optional)"
+        if not attendee_names:
+            response_content += "\n• Attendees (optional)"
         
         response_content += "\n\nPlease provide these details, or I can suggest some options."
 
-        assistant_message = CalendarMessage.objects.create(
-            session=calendar_session,
-            message_type='assistant',
-            content=response_content,
-            metadata={
-                'type': 'event_draft',
-                'event_info': extracted_info
-            }
-        )
+        assistant_message = turn.add_message('assistant', response_content, {
+            'type': 'event_draft',
+            'event_info': extracted_info
+        })
+        turn.flush()
 
         return {
             'message': {
@@ -341,10 +453,84 @@ def handle_create_event_intent(user, calendar_session, intent_data, gemini_servi
 
     except Exception as e:
         print(f"Error handling create event intent: {e}")
-        return handle_general_calendar_chat(calendar_session, "I'd like to create an event", gemini_service)
+        return handle_general_calendar_chat(turn, "I'd like to create an event", gemini_service)
+
+
+def _attendee_notice(user, names: list, extracted_info: dict) -> str:
+    """
+    Resolve attendee names against the user's contacts and describe the outcome.
+    Replaces `extracted_info['attendees']` with resolved emails and records
+    'attendee_candidates' for names that matched more than one contact.
+    """
+    try:
+        resolution = resolve_attendees(user, [str(n) for n in names], getattr(user, 'access_token', None))
+    except Exception as e:
+        print(f"[CALENDAR_ATTENDEES] Attendee resolution failed: {e}")
+        return ''
+
+    extracted_info['attendees'] = [match['email'] for match in resolution['resolved']]
+    notice = ''
+    if resolution['resolved']:
+        notice += "\n\nAttendees:"
+        for match in resolution['resolved']:
+            notice += f"\n• {match['name']} <{match['email']}>" if match['name'] else f"\n• {match['email']}"
+    if resolution['ambiguous']:
+        extracted_info['attendee_candidates'] = resolution['ambiguous']
+        for item in resolution['ambiguous']:
+            notice += f"\n\nWhich {item['query']} did you mean?"
+            for i, candidate in enumerate(item['candidates']):
+                notice += f"\n{i+1}. {candidate['name']} <{candidate['email']}>"
+    if resolution['unresolved']:
+        notice += f"\n\nI couldn't find an email address for: {', '.join(resolution['unresolved'])}"
+    return notice
+
+
+def _conflict_notice(user, extracted_info: dict) -> str:
+    """
+    Warn about mirrored events overlapping the drafted time and suggest the nearest free slot.
+    Records what it found in `extracted_info` ('conflicts', 'suggested_slot').
+    """
+    start_time = datetime.fromisoformat(extracted_info['start_datetime'])
+    if extracted_info.get('end_datetime'):
+        end_time = datetime.fromisoformat(extracted_info['end_datetime'])
+    else:
+        end_time = start_time + timedelta(minutes=60)  # Default 1 hour
+
+    try:
+        index = conflict_index(user, start_time, end_time)
+    except Exception as e:
+        print(f"[CALENDAR_CONFLICTS] Conflict check failed: {e}")
+        return ''
+    if index is None:
+        return ''
+    conflicts = index.conflicts(start_time, end_time)
+    if not conflicts:
+        return ''
+
+    tz = start_time.tzinfo
+    notice = "\n\nThis overlaps with:"
+    for conflict in conflicts[:3]:
+        notice += (f"\n• {conflict['title'] or 'Busy'} "
+                   f"({conflict['start_datetime'].astimezone(tz).strftime('%I:%M %p')} – "
+                   f"{conflict['end_datetime'].astimezone(tz).strftime('%I:%M %p')})")
+    extracted_info['conflicts'] = [
+        {**conflict, 'start_datetime': conflict['start_datetime'].isoformat(),
+         'end_datetime': conflict['end_datetime'].isoformat()}
+        for conflict in conflicts
+    ]
+
+    suggestion = index.nearest_free(start_time, end_time - start_time, not_before=timezone.now())
+    if suggestion:
+        suggested_start = suggestion[0].astimezone(tz)
+        notice += f"\n\nThe nearest free slot is {suggested_start.strftime('%A, %B %d at %I:%M %p')}."
+        extracted_info['suggested_slot'] = {
+            'start_datetime': suggested_start.isoformat(),
+            'end_datetime': suggestion[1].astimezone(tz).isoformat(),
+        }
+    return notice
 
 
-def handle_find_free_time_intent(user, calendar_session, intent_data, gemini_service):
+def handle_find_free_time_intent(user, turn, intent_data, gemini_service):
     """Handle find free time intent"""
     try:
         # Check if user has calendar integration
@@ -355,11 +541,8 @@ def handle_find_free_time_intent(user, calendar_session, intent_data, gemini_ser
         except CalendarIntegration.DoesNotExist:
             response_content = "To find your free time, I need access to your Google Calendar. Please connect your calendar first."
             
-            assistant_message = CalendarMessage.objects.create(
-                session=calendar_session,
-                message_type='assistant',
-                content=response_content
-            )
+            assistant_message = turn.add_message('assistant', response_content)
+            turn.flush()
             
             return {
                 'message': {
@@ -372,21 +555,35 @@ def handle_find_free_time_intent(user, calendar_session, intent_data, gemini_ser
         
         # If we have calendar access, find free time
         try:
-            calendar_service = GoogleCalendarService(calendar_integration.access_token)
+            calendar_service = GoogleCalendarService(calendar_integration.access_token, user_id=user.pk)
             
             # Get free time for the next week (simplified)
             start_date = timezone.now()
             end_date = start_date + timedelta(days=7)
             
-            free_slots = calendar_service.find_free_time(
-                duration_minutes=60,  # Default 1 hour
-                start_date=start_date,
-                end_date=end_date
-            )
+            try:
+                # Busy time from the local mirror (an incremental sync runs if it is stale)
+                ensure_synced(user, calendar_service)
+                free_slots = find_free_slots(
+                    local_busy_intervals(user, start_date, end_date),
+                    start_date,
+                    end_date,
+                    60,  # Default 1 hour
+                    time_zone=primary_time_zone(user),
+                    limit=5
+                )
+            except GoogleCalendarServiceError as e:
+                print(f"Calendar sync failed, querying Google directly: {e}")
+                free_slots = calendar_service.find_free_time(
+                    duration_minutes=60,
+                    start_date=start_date,
+                    end_date=end_date,
+                    max_slots=5
+                )
             
             if free_slots:
-                response_content = "Here are some available time slots:\n\n"
-                for i, slot in enumerate(free_slots[:5]):  # Show first 5 slots
+                response_content = "Here are the best available time slots:\n\n"
+                for i, slot in enumerate(free_slots):
                     start_time = datetime.fromisoformat(slot['start_datetime'].replace('Z', '+00:00'))
                     response_content += f"{i+1}. {start_time.strftime('%A, %B %d at %I:%M %p')}\n"
                 
@@ -398,11 +595,8 @@ def handle_find_free_time_intent(user, calendar_session, intent_data, gemini_ser
             print(f"Error finding free time: {e}")
             response_content = f"I encountered an error while checking your calendar: {str(e)}"
 
-        assistant_message = CalendarMessage.objects.create(
-            session=calendar_session,
-            message_type='assistant',
-            content=response_content
-        )
+        assistant_message = turn.add_message('assistant', response_content)
+        turn.flush()
 
         return {
             'message': {
@@ -415,10 +609,10 @@ def handle_find_free_time_intent(user, calendar_session, intent_data, gemini_ser
 
     except Exception as e:
         print(f"Error handling find free time intent: {e}")
-        return handle_general_calendar_chat(calendar_session, "When am I free?", gemini_service)
+        return handle_general_calendar_chat(turn, "When am I free?", gemini_service)
 
 
-def handle_list_events_intent(user, calendar_session, intent_data, gemini_service):
+def handle_list_events_intent(user, turn, intent_data, gemini_service):
     """Handle list events intent"""
     try:
         # Check if user has calendar integration
@@ -429,11 +623,8 @@ def handle_list_events_intent(user, calendar_session, intent_data, gemini_servic
         except CalendarIntegration.DoesNotExist:
             response_content = "To show your calendar events, I need access to your Google Calendar. Please connect your calendar first."
             
-            assistant_message = CalendarMessage.objects.create(
-                session=calendar_session,
-                message_type='assistant',
-                content=response_content
-            )
+            assistant_message = turn.add_message('assistant', response_content)
+            turn.flush()
             
             return {
                 'message': {
@@ -446,17 +637,26 @@ def handle_list_events_intent(user, calendar_session, intent_data, gemini_servic
         
         # Get upcoming events
         try:
-            calendar_service = GoogleCalendarService(calendar_integration.access_token)
+            calendar_service = GoogleCalendarService(calendar_integration.access_token, user_id=user.pk)
             
             # Get events for the next week
             start_date = timezone.now()
             end_date = start_date + timedelta(days=7)
             
-            events = calendar_service.get_events(
-                start_date=start_date,
-                end_date=end_date,
-                max_results=10
-            )
+            try:
+                ensure_synced(user, calendar_service)
+                time_zone = primary_time_zone(user)
+                events = [
+                    serialize_local_event(event, time_zone)
+                    for event in local_events(user, start_date, end_date, limit=10)
+                ]
+            except GoogleCalendarServiceError as e:
+                print(f"Calendar sync failed, querying Google directly: {e}")
+                events = calendar_service.get_events(
+                    start_date=start_date,
+                    end_date=end_date,
+                    max_results=10
+                )
             
             if events:
                 response_content = "Here are your upcoming events:\n\n"
@@ -474,11 +674,8 @@ def handle_list_events_intent(user, calendar_session, intent_data, gemini_servic
             print(f"Error listing events: {e}")
             response_content = f"I encountered an error while checking your calendar: {str(e)}"
 
-        assistant_message = CalendarMessage.objects.create(
-            session=calendar_session,
-            message_type='assistant',
-            content=response_content
-        )
+        assistant_message = turn.add_message('assistant', response_content)
+        turn.flush()
 
         return {
             'message': {
@@ -491,14 +688,13 @@ def handle_list_events_intent(user, calendar_session, intent_data, gemini_servic
 
     except Exception as e:
         print(f"Error handling list events intent: {e}")
-        return handle_general_calendar_chat(calendar_session, "Show my calendar", gemini_service)
+        return handle_general_calendar_chat(turn, "Show my calendar", gemini_service)
 
 
-def handle_general_calendar_chat(calendar_session, message_content, gemini_service):
+def handle_general_calendar_chat(turn, message_content, gemini_service):
     """Handle general calendar conversation"""
     try:
-        recent_messages = CalendarMessage.objects.filter(session=calendar_session).order_by('-timestamp')[:10]
-        chat_history = [{'message_type': msg.message_type, 'content': msg.content} for msg in reversed(recent_messages)]
+        chat_history = turn.history(10)
 
         # Create calendar-specific prompt
         calendar_prompt = f"""
@@ -519,11 +715,8 @@ def handle_general_calendar_chat(calendar_session, message_content, gemini_servi
 
         response_content = gemini_service.generate_chat_response(calendar_prompt, chat_history)
 
-        assistant_message = CalendarMessage.objects.create(
-            session=calendar_session,
-            message_type='assistant',
-            content=response_content
-        )
+        assistant_message = turn.add_message('assistant', response_content)
+        turn.flush()
 
         return {
             'message': {
@@ -537,11 +730,8 @@ def handle_general_calendar_chat(calendar_session, message_content, gemini_servi
     except Exception as e:
         print(f"Error handling general calendar chat: {e}")
         
-        assistant_message = CalendarMessage.objects.create(
-            session=calendar_session,
-            message_type='assistant',
-            content="I'm sorry, I encountered an error processing your message. Please try again."
-        )
+        assistant_message = turn.add_message('assistant', "I'm sorry, I encountered an error processing your message. Please try again.")
+        turn.flush()
         
         return {
             'message': {
@@ -556,7 +746,11 @@ def handle_general_calendar_chat(calendar_session, message_content, gemini_servi
 @csrf_exempt
 @require_http_methods(["GET", "OPTIONS"])
 def get_calendar_history(request, session_id):
-    """Get calendar chat history for a session"""
+    """
+    Get one page of calendar chat history for a session
+
+    Query params: limit, before / after (cursors from a previous page), include_metadata=true
+    """
     if request.method == 'OPTIONS':
         response = JsonResponse({})
         response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
@@ -571,25 +765,752 @@ def get_calendar_history(request, session_id):
             return _cors_response(response)
 
         calendar_session = get_object_or_404(CalendarSession, session_id=session_id, user=request.user)
-        messages = CalendarMessage.objects.filter(session=calendar_session).order_by('timestamp')
-
-        message_list = [
-            {
-                'id': msg.id,
-                'type': msg.message_type,
-                'content': msg.content,
-                'timestamp': msg.timestamp.isoformat(),
-                'metadata': msg.metadata
-            }
-            for msg in messages
-        ]
+        ensure_rehydrated(calendar_session, 'calendar')
+        page = message_page(CalendarMessage.objects.filter(session=calendar_session), request.GET)
 
         response = JsonResponse({
             'session_id': session_id,
-            'messages': message_list
+            **page
         })
         return _cors_response(response)
 
+    except CursorError as e:
+        response = JsonResponse({'error': str(e)}, status=400)
+        return _cors_response(response)
+
     except Exception as e:
         response = JsonResponse({'error': str(e)}, status=500)
         return _cors_response(response)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "OPTIONS"])
+def get_calendar_sessions(request):
+    """
+    Get one page of the current user's calendar sessions, most recently active first
+
+    Query params: limit, before (cursor from the previous page)
+    """
+    if request.method == 'OPTIONS':
+        response = JsonResponse({})
+        response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
+        response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        response['Access-Control-Allow-Credentials'] = 'true'
+        return response
+
+    try:
+        if not request.user.is_authenticated:
+            response = JsonResponse({'error': 'Not authenticated'}, status=401)
+            return _cors_response(response)
+
+        sessions = CalendarSession.objects.filter(user=request.user, is_active=True)
+        return _cors_response(JsonResponse(session_page(sessions, request.GET)))
+
+    except CursorError as e:
+        response = JsonResponse({'error': str(e)}, status=400)
+        return _cors_response(response)
+
+    except Exception as e:
+        response = JsonResponse({'error': str(e)}, status=500)
+        return _cors_response(response)
+
+
+@csrf_exempt
+@require_http_methods(["POST", "OPTIONS"])
+@idempotent('calendar_confirm')
+def confirm_calendar_event(request):
+    """
+    Create the Google event for an event draft from the chat (an assistant message with
+    metadata type 'event_draft')
+
+    Body: {"session_id", "message_id", "calendar_id" (optional),
+           "event": {"title", "start_datetime", "end_datetime", "location", "description", "attendees"} (optional
+           changes to the draft)}
+    A draft is created at most once: confirming it again is a 409.
+    """
+    if request.method == 'OPTIONS':
+        response = JsonResponse({})
+        response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
+        response['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie, Idempotency-Key'
+        response['Access-Control-Allow-Credentials'] = 'true'
+        return response
+
+    try:
+        if not request.user.is_authenticated:
+            response = JsonResponse({'error': 'Not authenticated'}, status=401)
+            return _cors_response(response)
+
+        try:
+            data = json.loads(request.body or "{}")
+        except json.JSONDecodeError:
+            response = JsonResponse({'error': 'Invalid JSON in request body', 'code': 'INVALID_JSON'}, status=400)
+            return _cors_response(response)
+
+        if not data.get('session_id') or not data.get('message_id'):
+            response = JsonResponse({'error': 'Session ID and message ID are required',
+                                     'code': 'MISSING_REQUIRED_FIELDS'}, status=400)
+            return _cors_response(response)
+
+        calendar_session = get_object_or_404(CalendarSession, session_id=data['session_id'], user=request.user)
+        ensure_rehydrated(calendar_session, 'calendar')
+        draft = CalendarMessage.objects.filter(session=calendar_session, pk=data['message_id'],
+                                               message_type='assistant').first()
+        if draft is None or draft.metadata.get('type') != 'event_draft':
+            response = JsonResponse({'error': 'Event draft not found', 'code': 'DRAFT_NOT_FOUND'}, status=404)
+            return _cors_response(response)
+
+        event_info = {**draft.metadata.get('event_info', {}), **(data.get('event') or {})}
+        try:
+            time_zone = event_info.get('time_zone') or primary_time_zone(request.user)
+            start_time = _parse_request_datetime(event_info.get('start_datetime'))
+            end_time = _parse_request_datetime(event_info.get('end_datetime'))
+            if start_time is None:
+                raise ValueError('the event needs a start time')
+            if event_info.get('all_day'):
+                raise ValueError('all-day events cannot be created from the chat yet')
+            start_time = start_time.astimezone(ZoneInfo(resolve_time_zone(time_zone, 'UTC')))
+            end_time = (end_time.astimezone(start_time.tzinfo) if end_time
+                        else start_time + timedelta(minutes=int(event_info.get('duration') or 60)))
+            if end_time <= start_time:
+                raise ValueError('the event must end after it starts')
+            attendees = event_info.get('attendees') or []
+            if isinstance(attendees, str):
+                attendees = [attendees]
+        except (ValueError, TypeError) as e:
+            response = JsonResponse({'error': f'Invalid event: {e}', 'code': 'INVALID_EVENT'}, status=400)
+            return _cors_response(response)
+
+        try:
+            calendar_integration = CalendarIntegration.objects.get(user=request.user)
+            if not calendar_integration.is_token_valid():
+                raise CalendarIntegration.DoesNotExist()
+        except CalendarIntegration.DoesNotExist:
+            response = JsonResponse({'error': 'Google Calendar is not connected', 'code': 'NO_CALENDAR'}, status=400)
+            return _cors_response(response)
+
+        # Claim the draft so a second confirmation can't create the event twice
+        with transaction.atomic():
+            draft = CalendarMessage.objects.select_for_update().get(pk=draft.pk)
+            if draft.metadata.get('event_id') or draft.metadata.get('confirming'):
+                response = JsonResponse({'error': 'This draft has already been confirmed',
+                                         'code': 'ALREADY_CONFIRMED'}, status=409)
+                return _cors_response(response)
+            CalendarMessage.objects.filter(pk=draft.pk).update(metadata={**draft.metadata, 'confirming': True})
+
+        calendar_id = str(data.get('calendar_id') or 'primary')
+        try:
+            calendar_service = GoogleCalendarService(calendar_integration.access_token, user_id=request.user.pk)
+            event = calendar_service.create_event(
+                title=str(event_info.get('title') or 'New Event'),
+                start_datetime=start_time,
+                end_datetime=end_time,
+                description=str(event_info.get('description') or ''),
+                location=str(event_info.get('location') or ''),
+                attendees=[str(email) for email in attendees if '@' in str(email)],
+                calendar_id=calendar_id,
+                recurrence=event_info.get('recurrence') or None,
+            )
+        except GoogleCalendarServiceError as e:
+            print(f"[CALENDAR_CONFIRM] Failed to create event for draft {draft.pk}: {e}")
+            CalendarMessage.objects.filter(pk=draft.pk).update(metadata=draft.metadata)
+            response = JsonResponse({'error': str(e), 'code': 'CREATE_FAILED'}, status=502)
+            return _cors_response(response)
+
+        CalendarMessage.objects.filter(pk=draft.pk).update(metadata={**draft.metadata, 'event_id': event.get('id')})
+        if event_info.get('template'):
+            # A template is counted as used once an event is actually created from it
+            template_usage.record(event_info['template']['id'])
+        if not event_info.get('recurrence'):
+            # A series is indexed once the next sync has mirrored it
+            record_created_event(request.user, start_time, end_time, event.get('id', ''), event.get('title', ''))
+
+        content = (f"Created '{event.get('title') or 'New Event'}' on "
+                   f"{start_time.strftime('%A, %B %d at %I:%M %p')}.")
+        turn = ChatTurn(calendar_session, CalendarMessage)
+        message = turn.add_message('assistant', content, {'type': 'event_created', 'draft_id': draft.pk,
+                                                          'event': event})
+        turn.flush()
+        print(f"[CALENDAR_CONFIRM] {request.user.username} created {event.get('id')} from draft {draft.pk}")
+
+        response = JsonResponse({
+            'event': event,
+            'message': {
+                'id': message.id,
+                'type': 'assistant',
+                'content': content,
+                'timestamp': message.timestamp.isoformat(),
+                'metadata': {'type': 'event_created', 'draft_id': draft.pk, 'event': event},
+            }
+        }, status=201)
+        return _cors_response(response)
+
+    except Exception as e:
+        print(f"[CALENDAR_CONFIRM] Error: {e}")
+        traceback.print_exc()
+        response = JsonResponse({'error': str(e)}, status=500)
+        return _cors_response(response)
+
+
+@csrf_exempt
+@require_http_methods(["POST", "OPTIONS"])
+def find_group_availability(request):
+    """
+    Find common free slots for the user and several attendees.
+    
+    Body: {"attendees": ["a@x.com", ...], "duration_minutes": 60,
+           "start": ISO datetime (optional), "end": ISO datetime or "days": N (optional),
+           "time_zone": "Europe/London" (optional), "resolution_minutes": 15 (optional)}
+    """
+    if request.method == 'OPTIONS':
+        response = JsonResponse({})
+        response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
+        response['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie'
+        response['Access-Control-Allow-Credentials'] = 'true'
+        return response
+
+    try:
+        if not request.user.is_authenticated:
+            response = JsonResponse({'error': 'Not authenticated'}, status=401)
+            return _cors_response(response)
+
+        try:
+            data = json.loads(request.body or "{}")
+            attendees = data.get('attendees') or []
+            duration_minutes = int(data.get('duration_minutes', 60))
+            resolution_minutes = int(data.get('resolution_minutes', 15))
+            start_date = _parse_request_datetime(data.get('start')) or timezone.now()
+            end_date = _parse_request_datetime(data.get('end')) or start_date + timedelta(days=int(data.get('days', 7)))
+        except (ValueError, TypeError) as e:
+            response = JsonResponse({'error': f'Invalid request: {e}', 'code': 'INVALID_REQUEST'}, status=400)
+            return _cors_response(response)
+
+        if not isinstance(attendees, list) or not attendees:
+            response = JsonResponse({'error': 'At least one attendee is required', 'code': 'MISSING_ATTENDEES'}, status=400)
+            return _cors_response(response)
+        if duration_minutes <= 0 or resolution_minutes not in (1, 5, 10, 15, 30, 60) or end_date <= start_date:
+            response = JsonResponse({'error': 'Invalid duration, resolution or range', 'code': 'INVALID_RANGE'}, status=400)
+            return _cors_response(response)
+
+        try:
+            calendar_integration = CalendarIntegration.objects.get(user=request.user)
+            if not calendar_integration.is_token_valid():
+                raise CalendarIntegration.DoesNotExist()
+        except CalendarIntegration.DoesNotExist:
+            response = JsonResponse({'error': 'Google Calendar is not connected', 'code': 'NO_CALENDAR'}, status=400)
+            return _cors_response(response)
+
+        calendar_service = GoogleCalendarService(calendar_integration.access_token, user_id=request.user.pk)
+        result = calendar_service.find_common_free_time(
+            attendees=attendees,
+            duration_minutes=duration_minutes,
+            start_date=start_date,
+            end_date=end_date,
+            time_zone=data.get('time_zone'),
+            resolution_minutes=resolution_minutes,
+            max_slots=int(data.get('max_slots', 10)),
+        )
+
+        response = JsonResponse(result)
+        return _cors_response(response)
+
+    except GoogleCalendarServiceError as e:
+        print(f"[GROUP_AVAILABILITY] Calendar API error: {e}")
+        response = JsonResponse({'error': str(e), 'code': 'CALENDAR_API_ERROR'}, status=502)
+        return _cors_response(response)
+    except Exception as e:
+        print(f"[GROUP_AVAILABILITY] Error: {e}")
+        traceback.print_exc()
+        response = JsonResponse({'error': str(e)}, status=500)
+        return _cors_response(response)
+
+
+@csrf_exempt
+@require_http_methods(["POST", "OPTIONS"])
+def find_recurring_availability(request):
+    """
+    Find a time of day that is free on every occurrence of a recurrence pattern.
+    
+    Body: {"rule": "FREQ=WEEKLY;BYDAY=TU;COUNT=6", "duration_minutes": 30,
+           "attendees": ["a@x.com", ...] (optional), "start": ISO datetime (optional),
+           "end": ISO datetime (optional, for rules without COUNT/UNTIL),
+           "time_zone": "Europe/London" (optional), "resolution_minutes": 15 (optional),
+           "preferred_hours": [9, 12] (optional)}
+    """
+    if request.method == 'OPTIONS':
+        response = JsonResponse({})
+        response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
+        response['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie'
+        response['Access-Control-Allow-Credentials'] = 'true'
+        return response
+
+    try:
+        if not request.user.is_authenticated:
+            response = JsonResponse({'error': 'Not authenticated'}, status=401)
+            return _cors_response(response)
+
+        try:
+            data = json.loads(request.body or "{}")
+            rule = str(data.get('rule') or '').strip()
+            attendees = data.get('attendees') or []
+            duration_minutes = int(data.get('duration_minutes', 30))
+            resolution_minutes = int(data.get('resolution_minutes', 15))
+            start_date = _parse_request_datetime(data.get('start')) or timezone.now()
+            end_date = _parse_request_datetime(data.get('end'))
+            preferred_hours = tuple(int(h) for h in data['preferred_hours']) if data.get('preferred_hours') else None
+        except (ValueError, TypeError) as e:
+            response = JsonResponse({'error': f'Invalid request: {e}', 'code': 'INVALID_REQUEST'}, status=400)
+            return _cors_response(response)
+
+        if not rule or not isinstance(attendees, list):
+            response = JsonResponse({'error': 'A recurrence rule is required', 'code': 'MISSING_RULE'}, status=400)
+            return _cors_response(response)
+        if (duration_minutes <= 0 or resolution_minutes not in (1, 5, 10, 15, 30, 60)
+                or (end_date and end_date <= start_date) or (preferred_hours and len(preferred_hours) != 2)):
+            response = JsonResponse({'error': 'Invalid duration, resolution or range', 'code': 'INVALID_RANGE'}, status=400)
+            return _cors_response(response)
+        try:
+            occurrence_days(rule, start_date, end_date, max_occurrences=1)
+        except ValueError as e:
+            response = JsonResponse({'error': f'Invalid recurrence rule: {e}', 'code': 'INVALID_RULE'}, status=400)
+            return _cors_response(response)
+
+        try:
+            calendar_integration = CalendarIntegration.objects.get(user=request.user)
+            if not calendar_integration.is_token_valid():
+                raise CalendarIntegration.DoesNotExist()
+        except CalendarIntegration.DoesNotExist:
+            response = JsonResponse({'error': 'Google Calendar is not connected', 'code': 'NO_CALENDAR'}, status=400)
+            return _cors_response(response)
+
+        calendar_service = GoogleCalendarService(calendar_integration.access_token, user_id=request.user.pk)
+        result = calendar_service.find_recurring_free_time(
+            rule=rule,
+            duration_minutes=duration_minutes,
+            attendees=attendees,
+            start_date=start_date,
+            end_date=end_date,
+            time_zone=data.get('time_zone'),
+            preferred_hours=preferred_hours,
+            resolution_minutes=resolution_minutes,
+            max_slots=int(data.get('max_slots', 10)),
+        )
+
+        response = JsonResponse(result)
+        return _cors_response(response)
+
+    except GoogleCalendarServiceError as e:
+        print(f"[RECURRING_AVAILABILITY] Calendar API error: {e}")
+        response = JsonResponse({'error': str(e), 'code': 'CALENDAR_API_ERROR'}, status=502)
+        return _cors_response(response)
+    except Exception as e:
+        print(f"[RECURRING_AVAILABILITY] Error: {e}")
+        traceback.print_exc()
+        response = JsonResponse({'error': str(e)}, status=500)
+        return _cors_response(response)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST", "OPTIONS"])
+def booking_links(request):
+    """
+    List the user's booking links (GET) or create one (POST).
+    
+    POST body: {"title": "30 minute call", "duration_minutes": 30, "days_ahead": 14,
+                "min_notice_minutes": 120, "slot_step_minutes": 30, "description": "..."}
+    """
+    if request.method == 'OPTIONS':
+        response = JsonResponse({})
+        response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
+        response['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie'
+        response['Access-Control-Allow-Credentials'] = 'true'
+        return response
+
+    try:
+        if not request.user.is_authenticated:
+            response = JsonResponse({'error': 'Not authenticated'}, status=401)
+            return _cors_response(response)
+
+        if request.method == 'GET':
+            links = BookingLink.objects.filter(user=request.user)
+            response = JsonResponse({'links': [serialize_booking_link(link) for link in links]})
+            return _cors_response(response)
+
+        try:
+            data = json.loads(request.body or "{}")
+            title = str(data.get('title') or 'Meeting').strip()[:255]
+            duration_minutes = int(data.get('duration_minutes', 30))
+            slot_step_minutes = int(data.get('slot_step_minutes', 30))
+            days_ahead = int(data.get('days_ahead', 14))
+            min_notice_minutes = int(data.get('min_notice_minutes', 120))
+        except (ValueError, TypeError) as e:
+            response = JsonResponse({'error': f'Invalid request: {e}', 'code': 'INVALID_REQUEST'}, status=400)
+            return _cors_response(response)
+
+        if (duration_minutes <= 0 or slot_step_minutes not in (5, 10, 15, 20, 30, 60)
+                or not 0 < days_ahead <= 90 or min_notice_minutes < 0):
+            response = JsonResponse({'error': 'Invalid duration, step or range', 'code': 'INVALID_RANGE'}, status=400)
+            return _cors_response(response)
+
+        link = BookingLink.objects.create(
+            user=request.user,
+            slug=new_booking_slug(),
+            title=title,
+            description=data.get('description', ''),
+            duration_minutes=duration_minutes,
+            slot_step_minutes=slot_step_minutes,
+            days_ahead=days_ahead,
+            min_notice_minutes=min_notice_minutes,
+        )
+        refresh_booking_slots(link)
+
+        response = JsonResponse(serialize_booking_link(link), status=201)
+        return _cors_response(response)
+
+    except Exception as e:
+        print(f"[BOOKING_LINKS] Error: {e}")
+        traceback.print_exc()
+        response = JsonResponse({'error': str(e)}, status=500)
+        return _cors_response(response)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST", "OPTIONS"])
+def public_booking_page(request, slug):
+    """
+    Public booking page: no login required.
+    
+    GET lists bookable slots from the precomputed cache (never calls Google).
+    POST body: {"start": ISO datetime, "name": "...", "email": "...", "notes": "..."}
+    POST is rate limited per client IP, per link and per email (429 with Retry-After).
+    """
+    if request.method == 'OPTIONS':
+        response = JsonResponse({})
+        response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
+        response['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'Content-Type'
+        response['Access-Control-Allow-Credentials'] = 'true'
+        return response
+
+    try:
+        if request.method == 'GET':
+            link = BookingLink.objects.filter(slug=slug, is_active=True).first()
+            if link is None:
+                response = JsonResponse({'error': 'Booking link not found', 'code': 'NOT_FOUND'}, status=404)
+                return _cors_response(response)
+
+            response = JsonResponse({**serialize_booking_link(link), **booking_slots(link)})
+            return _cors_response(response)
+
+        try:
+            data = json.loads(request.body or "{}")
+            start = _parse_request_datetime(data.get('start'))
+            name = str(data.get('name') or '').strip()[:255]
+            email = str(data.get('email') or '').strip()
+        except (ValueError, TypeError) as e:
+            response = JsonResponse({'error': f'Invalid request: {e}', 'code': 'INVALID_REQUEST'}, status=400)
+            return _cors_response(response)
+
+        if not start or not name or '@' not in email:
+            response = JsonResponse({'error': 'start, name and email are required', 'code': 'INVALID_REQUEST'}, status=400)
+            return _cors_response(response)
+
+        booking = reserve_slot(slug, start, name, email, str(data.get('notes') or ''),
+                               client_ip=request.META.get('REMOTE_ADDR') or None)
+        booking = confirm_booking(booking)
+        if booking.status != 'confirmed':
+            response = JsonResponse({'error': 'The booking could not be added to the calendar',
+                                     'code': 'CALENDAR_API_ERROR'}, status=502)
+            return _cors_response(response)
+
+        response = JsonResponse(serialize_booking(booking), status=201)
+        return _cors_response(response)
+
+    except BookingError as e:
+        response = JsonResponse({'error': str(e), 'code': e.code}, status=e.status)
+        if e.retry_after:
+            response['Retry-After'] = str(e.retry_after)
+            response['Access-Control-Expose-Headers'] = 'Retry-After'
+        return _cors_response(response)
+    except Exception as e:
+        print(f"[BOOKING_PAGE] Error: {e}")
+        traceback.print_exc()
+        response = JsonResponse({'error': str(e)}, status=500)
+        return _cors_response(response)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "OPTIONS"])
+def get_calendar_analytics(request):
+    """
+    Meeting load per day, busiest hours and time per attendee from the precomputed tables.
+    
+    Query: ?start=YYYY-MM-DD&end=YYYY-MM-DD (default: the last 30 days), &top=10
+    """
+    if request.method == 'OPTIONS':
+        response = JsonResponse({})
+        response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
+        response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        response['Access-Control-Allow-Credentials'] = 'true'
+        return response
+
+    try:
+        if not request.user.is_authenticated:
+            response = JsonResponse({'error': 'Not authenticated'}, status=401)
+            return _cors_response(response)
+
+        try:
+            today = timezone.now().date()
+            end_date = date.fromisoformat(request.GET['end']) if request.GET.get('end') else today
+            start_date = (date.fromisoformat(request.GET['start']) if request.GET.get('start')
+                          else end_date - timedelta(days=29))
+            top = min(int(request.GET.get('top', 10)), 100)
+        except ValueError as e:
+            response = JsonResponse({'error': f'Invalid request: {e}', 'code': 'INVALID_REQUEST'}, status=400)
+            return _cors_response(response)
+
+        if end_date < start_date or (end_date - start_date).days > 366:
+            response = JsonResponse({'error': 'Invalid range', 'code': 'INVALID_RANGE'}, status=400)
+            return _cors_response(response)
+
+        result = calendar_analytics(request.user, start_date, end_date, top_attendees=top)
+        response = JsonResponse({
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'time_zone': primary_time_zone(request.user),
+            **result,
+        })
+        return _cors_response(response)
+
+    except Exception as e:
+        print(f"[CALENDAR_ANALYTICS] Error: {e}")
+        traceback.print_exc()
+        response = JsonResponse({'error': str(e)}, status=500)
+        return _cors_response(response)
+
+
+@csrf_exempt
+@require_http_methods(["POST", "OPTIONS"])
+def import_ics(request):
+    """
+    Import an uploaded .ics file into the user's calendar mirror.
+    
+    Multipart form: file=<calendar.ics>, optional calendar_id, time_zone, and push=true to
+    also import the events into Google Calendar (calendar_id then names the Google calendar,
+    default "primary"). The upload is parsed as it is read and stored in chunks.
+    """
+    if request.method == 'OPTIONS':
+        response = JsonResponse({})
+        response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
+        response['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie'
+        response['Access-Control-Allow-Credentials'] = 'true'
+        return response
+
+    try:
+        if not request.user.is_authenticated:
+            response = JsonResponse({'error': 'Not authenticated'}, status=401)
+            return _cors_response(response)
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            response = JsonResponse({'error': 'No .ics file uploaded', 'code': 'MISSING_FILE'}, status=400)
+            return _cors_response(response)
+
+        time_zone = request.POST.get('time_zone') or None
+        if time_zone and not resolve_time_zone(time_zone):
+            response = JsonResponse({'error': f'Unknown time zone: {time_zone}', 'code': 'INVALID_TIME_ZONE'}, status=400)
+            return _cors_response(response)
+
+        push = request.POST.get('push', '').lower() in ('1', 'true', 'yes')
+        calendar_service = None
+        if push:
+            try:
+                calendar_integration = CalendarIntegration.objects.get(user=request.user)
+                if not calendar_integration.is_token_valid():
+                    raise CalendarIntegration.DoesNotExist()
+            except CalendarIntegration.DoesNotExist:
+                response = JsonResponse({'error': 'Google Calendar is not connected', 'code': 'NO_CALENDAR'}, status=400)
+                return _cors_response(response)
+            calendar_service = GoogleCalendarService(calendar_integration.access_token, user_id=request.user.pk)
+
+        default_calendar = 'primary' if push else DEFAULT_IMPORT_CALENDAR
+        importer = IcsImporter(
+            request.user,
+            calendar_id=(request.POST.get('calendar_id') or default_calendar)[:255],
+            time_zone=resolve_time_zone(time_zone),
+            calendar_service=calendar_service,
+        )
+        stats = importer.run(upload.chunks())
+
+        response = JsonResponse({'calendar_id': importer.calendar_id, 'pushed': push, **stats})
+        return _cors_response(response)
+
+    except Exception as e:
+        print(f"[ICS_IMPORT] Error: {e}")
+        traceback.print_exc()
+        response = JsonResponse({'error': str(e)}, status=500)
+        return _cors_response(response)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "OPTIONS"])
+def export_ics(request):
+    """
+    Download the user's mirrored events as an .ics file, streamed as it is generated.
+    
+    Query: optional ?calendar_id=... (repeatable), &start=ISO datetime, &end=ISO datetime
+    """
+    if request.method == 'OPTIONS':
+        response = JsonResponse({})
+        response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
+        response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        response['Access-Control-Allow-Credentials'] = 'true'
+        return response
+
+    try:
+        if not request.user.is_authenticated:
+            response = JsonResponse({'error': 'Not authenticated'}, status=401)
+            return _cors_response(response)
+
+        try:
+            start_date = _parse_request_datetime(request.GET.get('start'))
+            end_date = _parse_request_datetime(request.GET.get('end'))
+        except ValueError as e:
+            response = JsonResponse({'error': f'Invalid request: {e}', 'code': 'INVALID_REQUEST'}, status=400)
+            return _cors_response(response)
+
+        response = StreamingHttpResponse(
+            iter_ics(request.user, request.GET.getlist('calendar_id'), start_date, end_date),
+            content_type='text/calendar; charset=utf-8',
+        )
+        response['Content-Disposition'] = 'attachment; filename="calendar.ics"'
+        return _cors_response(response)
+
+    except Exception as e:
+        print(f"[ICS_EXPORT] Error: {e}")
+        traceback.print_exc()
+        response = JsonResponse({'error': str(e)}, status=500)
+        return _cors_response(response)
+
+
+# Most creates plus updates accepted by one bulk request
+BULK_EVENTS_MAX_ITEMS = 500
+
+
+@csrf_exempt
+@require_http_methods(["POST", "OPTIONS"])
+def bulk_events(request):
+    """
+    Create and reschedule many events with batched Calendar API requests (50 calls per HTTP request).
+    
+    Body: {"calendar_id": "primary" (optional),
+           "create": [{"title", "start_datetime", "end_datetime", "description", "location", "attendees"}, ...],
+           "update": [{"event_id", "etag" (optional), "start_datetime", "end_datetime", "title", ...}, ...]}
+    An update without an etag uses the mirrored event's, so an event changed in Google since the
+    last sync is not overwritten: its result has "conflict": true (HTTP 412) and nothing is patched.
+    """
+    if request.method == 'OPTIONS':
+        response = JsonResponse({})
+        response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
+        response['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie'
+        response['Access-Control-Allow-Credentials'] = 'true'
+        return response
+
+    try:
+        if not request.user.is_authenticated:
+            response = JsonResponse({'error': 'Not authenticated'}, status=401)
+            return _cors_response(response)
+
+        try:
+            data = json.loads(request.body or "{}")
+            calendar_id = str(data.get('calendar_id') or 'primary')
+            creates = [{
+                **item,
+                'title': str(item.get('title') or 'New Event'),
+                'start_datetime': _parse_request_datetime(item['start_datetime']),
+                'end_datetime': _parse_request_datetime(item['end_datetime']),
+            } for item in data.get('create') or []]
+            updates = [{
+                **item,
+                'event_id': str(item['event_id']),
+                'start_datetime': _parse_request_datetime(item.get('start_datetime')),
+                'end_datetime': _parse_request_datetime(item.get('end_datetime')),
+            } for item in data.get('update') or []]
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            response = JsonResponse({'error': f'Invalid request: {e}', 'code': 'INVALID_REQUEST'}, status=400)
+            return _cors_response(response)
+
+        if not creates and not updates:
+            response = JsonResponse({'error': 'Nothing to create or update', 'code': 'MISSING_EVENTS'}, status=400)
+            return _cors_response(response)
+        if len(creates) + len(updates) > BULK_EVENTS_MAX_ITEMS:
+            response = JsonResponse({'error': f'At most {BULK_EVENTS_MAX_ITEMS} events per request',
+                                     'code': 'TOO_MANY_EVENTS'}, status=400)
+            return _cors_response(response)
+        if any(item['end_datetime'] <= item['start_datetime'] for item in creates):
+            response = JsonResponse({'error': 'Every event must end after it starts', 'code': 'INVALID_RANGE'}, status=400)
+            return _cors_response(response)
+
+        try:
+            calendar_integration = CalendarIntegration.objects.get(user=request.user)
+            if not calendar_integration.is_token_valid():
+                raise CalendarIntegration.DoesNotExist()
+        except CalendarIntegration.DoesNotExist:
+            response = JsonResponse({'error': 'Google Calendar is not connected', 'code': 'NO_CALENDAR'}, status=400)
+            return _cors_response(response)
+
+        # If-Match with the ETag the mirror last saw for each event
+        etags = dict(CalendarEvent.objects
+                     .filter(user=request.user, calendar_id=calendar_id,
+                             google_event_id__in=[item['event_id'] for item in updates if not item.get('etag')])
+                     .values_list('google_event_id', 'etag'))
+        for item in updates:
+            item['etag'] = item.get('etag') or etags.get(item['event_id']) or None
+
+        calendar_service = GoogleCalendarService(calendar_integration.access_token, user_id=request.user.pk)
+        created = calendar_service.batch_create_events(creates, calendar_id) if creates else []
+        updated = calendar_service.batch_update_events(updates, calendar_id) if updates else []
+
+        if any(result['success'] for result in created + updated):
+            # Pull the changes into the mirror (an incremental sync), which also refreshes the
+            # conflict index and booking slots
+            try:
+                ensure_synced(request.user, calendar_service, max_age_seconds=0)
+            except Exception as e:
+                print(f"[BULK_EVENTS] Sync after bulk write failed: {e}")
+
+        print(f"[BULK_EVENTS] {request.user.username}/{calendar_id}: "
+              f"{sum(r['success'] for r in created)}/{len(created)} created, "
+              f"{sum(r['success'] for r in updated)}/{len(updated)} updated, "
+              f"{sum(r['conflict'] for r in updated)} conflicts")
+        response = JsonResponse({
+            'calendar_id': calendar_id,
+            'created': created,
+            'updated': updated,
+            'conflicts': [result['index'] for result in updated if result['conflict']],
+        })
+        return _cors_response(response)
+
+    except Exception as e:
+        print(f"[BULK_EVENTS] Error: {e}")
+        traceback.print_exc()
+        response = JsonResponse({'error': str(e)}, status=500)
+        return _cors_response(response)
+
+
+def _parse_request_datetime(value):
+    """Parse an ISO datetime from a request body; naive values are taken as UTC."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
@@ -0,0 +1,177 @@
+# backend/inboxiq_project/gmail_agent/archive.py
+"""
+Archival of inactive chat sessions, shared by the Gmail and Calendar agents.
+
+Sessions untouched for CHAT_ARCHIVE_AFTER_DAYS have their messages moved out of the
+message table into one archive row per session: the messages as JSON, zlib-compressed.
+The session row itself stays (with its denormalized count and preview), flagged
+is_archived, so session lists are unaffected.
+
+Opening an archived session rehydrates it: the messages are re-inserted with their
+original ids and timestamps, so history cursors issued before archival stay valid.
+A message written to an archived session before it was rehydrated simply joins the
+restored ones.
+
+archive_inactive() moves sessions in small batches, one short transaction each, so the
+message table is never locked for long (see the archive_chat_sessions command).
+"""
+import json
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+# agent -> (session model, message model, archive model)
+ARCHIVE_TARGETS = {
+    'gmail': ('gmail_agent.ChatSession', 'gmail_agent.ChatMessage', 'gmail_agent.ArchivedChatSession'),
+    'calendar': ('calendar_agent.CalendarSession', 'calendar_agent.CalendarMessage',
+                 'calendar_agent.ArchivedCalendarSession'),
+}
+
+MESSAGE_FIELDS = ('id', 'message_type', 'content', 'metadata', 'timestamp')
+COMPRESSION_LEVEL = 6
+
+
+def target_models(agent: str):
+    return tuple(apps.get_model(label) for label in ARCHIVE_TARGETS[agent])
+
+
+def compress_messages(rows: List[Dict]) -> bytes:
+    payload = [dict(row, timestamp=row['timestamp'].isoformat()) for row in rows]
+    return zlib.compress(json.dumps(payload, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+
+
+def decompress_messages(payload: bytes) -> List[Dict]:
+    rows = json.loads(zlib.decompress(bytes(payload)).decode())
+    for row in rows:
+        row['timestamp'] = datetime.fromisoformat(row['timestamp'])
+    return rows
+
+
+def archive_sessions(session_ids: List[int], session_model, message_model, archive_model,
+                     cutoff: datetime) -> Dict:
+    """
+    Move the messages of the given sessions into archive rows, in one transaction
+
+    Inactivity is checked again on the locked rows, so a session that received a message
+    after it was picked as a candidate (updated_at moved past `cutoff`) is left alone.
+    Only messages read here are deleted, so one written concurrently stays in the
+    message table. Sessions with a message that another row references are skipped.
+
+    Returns:
+        {'sessions': archived sessions, 'messages': messages moved, 'bytes': compressed size}
+    """
+    stats = {'sessions': 0, 'messages': 0, 'bytes': 0}
+    with transaction.atomic():
+        sessions = list(session_model.objects
+                        .select_for_update()
+                        .filter(pk__in=session_ids, is_archived=False, updated_at__lt=cutoff)
+                        .values_list('pk', flat=True))
+        if not sessions:
+            return stats
+        # Deleting messages another row points at (EmailDraft.chat_message) would cascade to it
+        pinned = set()
+        for relation in message_model._meta.related_objects:
+            pinned.update(message_model.objects
+                          .filter(session_id__in=sessions, **{f'{relation.name}__isnull': False})
+                          .values_list('session_id', flat=True))
+
+        by_session = {pk: [] for pk in sessions if pk not in pinned}
+        rows = (message_model.objects
+                .filter(session_id__in=list(by_session))
+                .order_by('session_id', 'timestamp', 'id')
+                .values('session_id', *MESSAGE_FIELDS))
+        for row in rows.iterator(chunk_size=2000):
+            by_session[row.pop('session_id')].append(row)
+
+        archives, message_ids = [], []
+        for session_id, messages in by_session.items():
+            payload = compress_messages(messages)
+            archives.append(archive_model(session_id=session_id, message_count=len(messages), payload=payload))
+            message_ids.extend(row['id'] for row in messages)
+            stats['bytes'] += len(payload)
+        archive_model.objects.bulk_create(archives)
+        for start in range(0, len(message_ids), 1000):
+            message_model.objects.filter(pk__in=message_ids[start:start + 1000]).delete()
+        session_model.objects.filter(pk__in=list(by_session)).update(is_archived=True)
+
+    stats['sessions'] = len(by_session)
+    stats['messages'] = len(message_ids)
+    return stats
+
+
+def rehydrate(session, message_model, archive_model) -> int:
+    """
+    Put an archived session's messages back in the message table
+
+    Returns:
+        number of messages restored
+    """
+    with transaction.atomic():
+        archive = archive_model.objects.select_for_update().filter(session=session).first()
+        restored = 0
+        if archive is not None:
+            rows = decompress_messages(archive.payload)
+            messages = [message_model(session=session, **row) for row in rows]
+            message_model.objects.bulk_create(messages, batch_size=500)
+            # bulk_create stamps auto_now_add fields with the current time; put the originals back
+            for message, row in zip(messages, rows):
+                message.timestamp = row['timestamp']
+            message_model.objects.bulk_update(messages, ['timestamp'], batch_size=500)
+            archive.delete()
+            restored = len(messages)
+        type(session).objects.filter(pk=session.pk).update(is_archived=False)
+    session.is_archived = False
+    print(f"[ARCHIVE] Rehydrated {restored} messages for session {session.session_id}")
+    return restored
+
+
+def ensure_rehydrated(session, agent: str) -> None:
+    """Rehydrate the session if it was archived (the flag is already on the loaded row)"""
+    if session.is_archived:
+        _, message_model, archive_model = target_models(agent)
+        rehydrate(session, message_model, archive_model)
+
+
+def archive_inactive(agent: str, days: Optional[int] = None, batch_size: int = 100,
+                     pause_seconds: float = 0.0, dry_run: bool = False, limit: Optional[int] = None) -> Dict:
+    """
+    Archive every session of `agent` inactive for `days`, `batch_size` sessions per transaction
+
+    Args:
+        days: inactivity threshold (default CHAT_ARCHIVE_AFTER_DAYS)
+        pause_seconds: sleep between batches to leave the database room for live traffic
+        dry_run: count candidates without moving anything
+        limit: stop after this many sessions
+
+    Returns:
+        {'sessions', 'messages', 'bytes', 'batches'} (only 'sessions' for a dry run)
+    """
+    session_model, message_model, archive_model = target_models(agent)
+    days = days if days is not None else getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 90)
+    cutoff = timezone.now() - timedelta(days=days)
+    candidates = session_model.objects.filter(is_archived=False, updated_at__lt=cutoff, message_count__gt=0)
+    if dry_run:
+        count = candidates.count()
+        return {'sessions': min(count, limit) if limit else count}
+
+    totals = {'sessions': 0, 'messages': 0, 'bytes': 0, 'batches': 0}
+    last_pk = 0
+    while limit is None or totals['sessions'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - totals['sessions'])
+        batch = list(candidates.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:size])
+        if not batch:
+            break
+        last_pk = batch[-1]
+        stats = archive_sessions(batch, session_model, message_model, archive_model, cutoff)
+        for key in ('sessions', 'messages', 'bytes'):
+            totals[key] += stats[key]
+        totals['batches'] += 1
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    return totals
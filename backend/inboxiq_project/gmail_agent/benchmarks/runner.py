@@ -0,0 +1,317 @@
+# gmail_agent/benchmarks/runner.py
+"""
+Offline benchmark for the local intent classifiers, contact search-term extraction and the
+calendar date/time parser.
+
+Runs every labelled item in a versioned corpus through the code under test, and reports
+precision/recall per label plus per-call latency percentiles. The result is a stable,
+key-sorted JSON document so two runs (e.g. before/after a change) can be diffed directly.
+"""
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import platform
+import subprocess
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+CORPUS_DIR = Path(__file__).resolve().parent / 'corpus'
+DEFAULT_CORPUS = CORPUS_DIR / 'intents_v2.json'
+# Items never used while developing the code under test; scored separately as '<task>_holdout'
+HOLDOUT_CORPUS = CORPUS_DIR / 'holdout_v1.json'
+
+
+def load_corpus(path) -> Dict:
+    path = Path(path)
+    raw = path.read_bytes()
+    corpus = json.loads(raw)
+    corpus['sha256'] = hashlib.sha256(raw).hexdigest()
+    corpus['path'] = path.name
+    return corpus
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def latency_summary(samples_ns: List[int]) -> Dict:
+    """Latency percentiles in microseconds."""
+    values = sorted(samples_ns)
+    if not values:
+        return {'calls': 0}
+    to_us = lambda ns: round(ns / 1000.0, 2)  # noqa: E731
+    return {
+        'calls': len(values),
+        'mean_us': to_us(sum(values) / len(values)),
+        'p50_us': to_us(_percentile(values, 50)),
+        'p90_us': to_us(_percentile(values, 90)),
+        'p99_us': to_us(_percentile(values, 99)),
+        'max_us': to_us(values[-1]),
+    }
+
+
+def classification_report(pairs) -> Dict:
+    """pairs: iterable of (expected_label, predicted_label)."""
+    pairs = list(pairs)
+    tp, fp, fn, support = Counter(), Counter(), Counter(), Counter()
+    for expected, predicted in pairs:
+        support[expected] += 1
+        if expected == predicted:
+            tp[expected] += 1
+        else:
+            fp[predicted] += 1
+            fn[expected] += 1
+
+    per_label = {}
+    for label in sorted(set(support) | set(fp)):
+        p_den = tp[label] + fp[label]
+        r_den = tp[label] + fn[label]
+        precision = tp[label] / p_den if p_den else 0.0
+        recall = tp[label] / r_den if r_den else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if (precision + recall) else 0.0
+        per_label[label] = {
+            'precision': round(precision, 4),
+            'recall': round(recall, 4),
+            'f1': round(f1, 4),
+            'support': support[label],
+        }
+
+    correct = sum(tp.values())
+    return {
+        'accuracy': round(correct / len(pairs), 4) if pairs else None,
+        'per_label': per_label,
+    }
+
+
+def _timed(fn: Callable, arg, repeat: int, samples: List[int]):
+    """Call fn(arg) `repeat` times, appending each latency to `samples`; return the last result."""
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        result = fn(arg)
+        samples.append(time.perf_counter_ns() - started)
+    return result
+
+
+def _norm(value) -> str:
+    return ' '.join(str(value or '').lower().split())
+
+
+# -------------------
+# Tasks
+# -------------------
+def bench_email_intent(items, repeat: int) -> Dict:
+    from gmail_agent.gemini_service import GeminiService
+    service = GeminiService(use_mock=True)
+
+    samples, pairs, errors = [], [], []
+    recipient_hits = recipient_total = 0
+    for item in items:
+        result = _timed(service._mock_analyze_intent, item['text'], repeat, samples)
+        predicted = result.get('intent')
+        pairs.append((item['label'], predicted))
+        if predicted != item['label']:
+            errors.append({'id': item['id'], 'expected': item['label'], 'got': predicted})
+        if item['label'] == 'email' and item.get('recipient'):
+            recipient_total += 1
+            if _norm(result.get('recipient_info')) == _norm(item['recipient']):
+                recipient_hits += 1
+
+    report = classification_report(pairs)
+    report['recipient_exact_match'] = round(recipient_hits / recipient_total, 4) if recipient_total else None
+    report['latency'] = latency_summary(samples)
+    report['misclassified'] = errors
+    return report
+
+
+def bench_calendar_intent(items, repeat: int) -> Dict:
+    from calendar_agent.views import _fallback_intent_analysis
+
+    samples, pairs, errors = [], [], []
+    for item in items:
+        result = _timed(_fallback_intent_analysis, item['text'], repeat, samples)
+        predicted = result.get('intent')
+        pairs.append((item['label'], predicted))
+        if predicted != item['label']:
+            errors.append({'id': item['id'], 'expected': item['label'], 'got': predicted})
+
+    report = classification_report(pairs)
+    report['latency'] = latency_summary(samples)
+    report['misclassified'] = errors
+    return report
+
+
+def bench_contact_terms(items, repeat: int) -> Dict:
+    from gmail_agent.gemini_service import GeminiService
+    service = GeminiService(use_mock=True)
+
+    samples = []
+    precision_sum = recall_sum = 0.0
+    misses = []
+    for item in items:
+        terms = _timed(service.extract_contact_search_terms, item['text'], repeat, samples)
+        got = {_norm(t) for t in terms}
+        expected = {_norm(t) for t in item['expected_terms']}
+        hit = got & expected
+        precision_sum += len(hit) / len(got) if got else 0.0
+        recall_sum += len(hit) / len(expected) if expected else 1.0
+        if expected - got:
+            misses.append({'id': item['id'], 'missing': sorted(expected - got)})
+
+    n = len(items) or 1
+    return {
+        'term_precision': round(precision_sum / n, 4),
+        'term_recall': round(recall_sum / n, 4),
+        'latency': latency_summary(samples),
+        'missing_terms': misses,
+    }
+
+
+# datetime_parse items are local times written against this reference, unless an item
+# carries its own 'now' and 'time_zone'. A null 'start' means the parser should defer to the model.
+DATETIME_NOW = (2026, 10, 19, 10, 0)
+DATETIME_TIME_ZONE = 'Europe/London'
+
+
+def bench_datetime_parse(items, repeat: int) -> Dict:
+    from django.conf import settings
+    from zoneinfo import ZoneInfo
+    from calendar_agent import datetime_parser
+
+    default_now = datetime(*DATETIME_NOW, tzinfo=ZoneInfo(DATETIME_TIME_ZONE))
+    min_confidence = getattr(settings, 'CALENDAR_PARSER_MIN_CONFIDENCE', 0.6)
+
+    samples, failures = [], []
+    start_hits = date_hits = time_hits = duration_hits = duration_total = low_confidence = 0
+    recurrence_hits = recurrence_total = defer_hits = defer_total = 0
+    for item in items:
+        time_zone = item.get('time_zone', DATETIME_TIME_ZONE)
+        now = (datetime.fromisoformat(item['now']).replace(tzinfo=ZoneInfo(time_zone))
+               if item.get('now') else default_now)
+        parse = lambda text: datetime_parser.parse(text, time_zone, now)  # noqa: E731
+        result = _timed(parse, item['text'], repeat, samples)
+        confident = result.confidence >= min_confidence
+        low_confidence += not confident
+        got = result.start.astimezone(now.tzinfo).replace(tzinfo=None) if result.start else None
+
+        if item['start'] is None:
+            defer_total += 1
+            defer_hits += not confident
+            date_ok = time_ok = not confident
+            expected = None
+        else:
+            expected = datetime.fromisoformat(item['start'])
+            date_ok = got is not None and got.date() == expected.date()
+            time_ok = got is not None and got.time() == expected.time()
+        date_hits += date_ok
+        time_hits += time_ok
+        start_hits += date_ok and time_ok
+        if item.get('duration_minutes') is not None:
+            duration_total += 1
+            duration_hits += result.duration_minutes == item['duration_minutes']
+        if item.get('recurrence') is not None:
+            recurrence_total += 1
+            recurrence_hits += result.recurrence == item['recurrence']
+        if not (date_ok and time_ok) and len(failures) < 25:
+            failures.append({'id': item['id'], 'text': item['text'],
+                             'expected': expected.isoformat() if expected else 'defer',
+                             'got': got.isoformat() if got else None,
+                             'confidence': round(result.confidence, 2)})
+
+    n = len(items) or 1
+    return {
+        'start_exact_match': round(start_hits / n, 4),
+        'date_accuracy': round(date_hits / n, 4),
+        'time_accuracy': round(time_hits / n, 4),
+        'duration_accuracy': round(duration_hits / duration_total, 4) if duration_total else None,
+        'recurrence_accuracy': round(recurrence_hits / recurrence_total, 4) if recurrence_total else None,
+        'defer_accuracy': round(defer_hits / defer_total, 4) if defer_total else None,
+        'low_confidence_rate': round(low_confidence / n, 4),
+        'latency': latency_summary(samples),
+        'failures': failures,
+    }
+
+
+TASKS: Dict[str, Callable] = {
+    'email_intent': bench_email_intent,
+    'calendar_intent': bench_calendar_intent,
+    'contact_terms': bench_contact_terms,
+    'datetime_parse': bench_datetime_parse,
+}
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=Path(__file__).resolve().parent, timeout=5)
+        return out.stdout.strip() or 'unknown'
+    except Exception:
+        return 'unknown'
+
+
+def run_benchmark(corpus_path=DEFAULT_CORPUS, repeat: int = 5, tasks=None, holdout_path=HOLDOUT_CORPUS) -> Dict:
+    """
+    Run the selected tasks (default: all) over the corpus and return the result document.
+
+    Tasks that also have items in the holdout corpus are run over those too, reported
+    as '<task>_holdout'; pass holdout_path=None to skip it.
+    """
+    corpus = load_corpus(corpus_path)
+    by_task = defaultdict(list)
+    for item in corpus['items']:
+        by_task[item['task']].append(item)
+    holdout = load_corpus(holdout_path) if holdout_path else None
+    holdout_by_task = defaultdict(list)
+    for item in (holdout or {}).get('items', []):
+        holdout_by_task[item['task']].append(item)
+
+    selected = tasks or [t for t in TASKS if by_task.get(t)]
+    results = {}
+
+    # The code under test prints and logs per call; keep that out of the timings and the console
+    model_log = logging.getLogger('inboxiq')
+    previous_level = model_log.level
+    model_log.setLevel(logging.WARNING)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for task in selected:
+                results[task] = TASKS[task](by_task.get(task, []), repeat)
+                results[task]['items'] = len(by_task.get(task, []))
+                if holdout_by_task.get(task):
+                    results[f'{task}_holdout'] = TASKS[task](holdout_by_task[task], repeat)
+                    results[f'{task}_holdout']['items'] = len(holdout_by_task[task])
+    finally:
+        model_log.setLevel(previous_level)
+
+    return {
+        'corpus': {
+            'name': corpus.get('name'),
+            'version': corpus.get('version'),
+            'file': corpus['path'],
+            'sha256': corpus['sha256'],
+        },
+        'holdout': {
+            'name': holdout.get('name'),
+            'version': holdout.get('version'),
+            'file': holdout['path'],
+            'sha256': holdout['sha256'],
+        } if holdout else None,
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'repeat': repeat,
+        'tasks': results,
+    }
+
+
+def write_result(result: Dict, path) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, sort_keys=True, ensure_ascii=False)
+        f.write('\n')
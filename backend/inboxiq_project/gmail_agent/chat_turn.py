@@ -0,0 +1,118 @@
+# backend/inboxiq_project/gmail_agent/chat_turn.py
+"""
+Unit of work for one chat turn, shared by the Gmail and Calendar agents.
+
+Rows made during a turn (the user message, an EmailDraft, the assistant reply) are queued
+on a ChatTurn and written by flush() in one transaction: queued rows first with one
+bulk_create per model, then the turn's messages in one bulk_create, then one UPDATE that
+folds them into the session (message_count, last message, updated_at). Model and Google
+calls happen while rows are queued, never inside the transaction. On backends that can't
+return ids from a multi-row INSERT (MySQL), each row carries a client-generated insert_key
+and one SELECT per model reads the ids back.
+
+    turn = ChatTurn(chat_session, ChatMessage)
+    turn.add_message('user', text)
+    draft = turn.add(EmailDraft(...))
+    reply = turn.add_message('assistant', content, lambda: {'draft_id': draft.id})
+    turn.flush()
+"""
+import uuid
+from typing import Callable, Dict, List, Optional, Union
+
+from django.db import connections, router, transaction
+
+from .history import record_messages
+
+Metadata = Union[Dict, Callable[[], Dict], None]
+
+
+def _insert(model, objs: List) -> None:
+    """INSERT objs with one multi-row INSERT, setting their primary keys"""
+    if not objs:
+        return
+    if connections[router.db_for_write(model)].features.can_return_rows_from_bulk_insert:
+        model.objects.bulk_create(objs)
+        return
+    # This backend (e.g. MySQL) can't return ids from a multi-row INSERT: tag each row
+    # with a fresh key and read the ids back with one SELECT on the indexed key
+    for obj in objs:
+        obj.insert_key = uuid.uuid4()
+    model.objects.bulk_create(objs)
+    ids = dict(model.objects.filter(insert_key__in=[obj.insert_key for obj in objs])
+               .values_list('insert_key', 'pk'))
+    for obj in objs:
+        obj.pk = ids[obj.insert_key]
+
+
+class ChatTurn:
+    """The rows written by one chat turn, flushed together"""
+
+    def __init__(self, session, message_model):
+        self.session = session
+        self.message_model = message_model
+        self._rows = []
+        self._messages = []  # (message, metadata callable or None)
+
+    def add(self, obj):
+        """Queue a row (e.g. an EmailDraft); it is inserted before the turn's messages"""
+        self._rows.append(obj)
+        return obj
+
+    def add_message(self, message_type: str, content: str, metadata: Metadata = None):
+        """
+        Queue a message for the session
+
+        Args:
+            metadata: a dict, or a callable returning one that is evaluated at flush
+                once rows queued with add() have primary keys
+
+        Returns:
+            the unsaved message; its id and timestamp are set by flush()
+        """
+        message = self.message_model(session=self.session, message_type=message_type, content=content)
+        if callable(metadata):
+            self._messages.append((message, metadata))
+        else:
+            message.metadata = metadata or {}
+            self._messages.append((message, None))
+        return message
+
+    def history(self, limit: int = 10) -> List[Dict]:
+        """The session's last `limit` messages, queued ones included, oldest first"""
+        pending = [message for message, _ in self._messages][-limit:]
+        stored = []
+        if len(pending) < limit:
+            stored = list(self.message_model.objects
+                          .filter(session=self.session)
+                          .order_by('-timestamp', '-id')
+                          .values('message_type', 'content')[:limit - len(pending)])
+            stored.reverse()
+        return stored + [{'message_type': m.message_type, 'content': m.content} for m in pending]
+
+    def flush(self) -> Optional[int]:
+        """
+        Write everything queued since the last flush in one transaction
+
+        Returns:
+            number of messages written, or None if nothing was queued
+        """
+        if not self._rows and not self._messages:
+            return None
+        rows, messages = self._rows, self._messages
+        self._rows, self._messages = [], []
+
+        with transaction.atomic():
+            by_model = {}
+            for obj in rows:
+                by_model.setdefault(type(obj), []).append(obj)
+            for model, objs in by_model.items():
+                _insert(model, objs)
+
+            for message, metadata in messages:
+                if metadata is not None:
+                    message.metadata = metadata()
+            written = [message for message, _ in messages]
+            _insert(self.message_model, written)
+            # Also bumps the session's updated_at, in place of a full-row save
+            record_messages(type(self.session), self.session.pk, written)
+        return len(written)
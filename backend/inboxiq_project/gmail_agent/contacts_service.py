@@ -2,6 +2,7 @@
 import re
 from difflib import SequenceMatcher
 from django.db import transaction
+from django.utils import timezone
 
 from .models import ContactCache  # adjust import if models in different path
 
@@ -58,7 +59,8 @@ class GoogleContactsService:
                     contacts.append({
                         'display_name': display_name,
                         'primary_email': primary_email,
-                        'photo_url': photo_url
+                        'photo_url': photo_url,
+                        'resource_name': p.get('resourceName', '')
                     })
                 # Use people().connections().list_next if available
                 try:
@@ -70,6 +72,77 @@ class GoogleContactsService:
 
         return contacts
 
+    def search_contacts_api(self, query, page_size=10):
+        """Targeted People API search (searchContacts) for one name; never lists the whole address book."""
+        service = self._build_people_service()
+        if not service or not query:
+            return []
+
+        try:
+            res = service.people().searchContacts(
+                query=query,
+                readMask='names,emailAddresses,photos',
+                pageSize=page_size
+            ).execute()
+        except Exception as e:
+            print(f"[CONTACTS] searchContacts failed for {query!r}: {e}")
+            return []
+
+        contacts = []
+        for item in res.get('results', []):
+            p = item.get('person', {})
+            names = p.get('names', [])
+            photos = p.get('photos', [])
+            for email in p.get('emailAddresses', []):
+                contacts.append({
+                    'display_name': names[0].get('displayName') if names else '',
+                    'primary_email': email.get('value', ''),
+                    'photo_url': photos[0].get('url') if photos else '',
+                    'resource_name': p.get('resourceName', '')
+                })
+        return contacts
+
+    def cache_contacts(self, user, contacts):
+        """Upsert contacts into ContactCache with one read and bulk writes."""
+        rows = {}
+        for c in contacts:
+            if not c.get('primary_email'):
+                continue
+            contact_id = f"{c.get('resource_name') or ''}:{c['primary_email'].lower()}"[:255]
+            rows[contact_id] = ContactCache(
+                user=user,
+                contact_id=contact_id,
+                name=(c.get('display_name') or '')[:255],
+                email=c['primary_email'],
+                contact_data={'photo_url': c.get('photo_url', ''), 'resource_name': c.get('resource_name', '')},
+            )
+        if not rows:
+            return
+
+        with transaction.atomic():
+            existing = {
+                cached.contact_id: cached
+                for cached in ContactCache.objects.filter(user=user, contact_id__in=list(rows))
+            }
+            to_update = []
+            for contact_id, row in rows.items():
+                cached = existing.get(contact_id)
+                if cached and (cached.name, cached.email, cached.contact_data) != (row.name, row.email, row.contact_data):
+                    cached.name, cached.email, cached.contact_data = row.name, row.email, row.contact_data
+                    cached.updated_at = timezone.now()
+                    to_update.append(cached)
+            ContactCache.objects.bulk_create(
+                [row for contact_id, row in rows.items() if contact_id not in existing], batch_size=500
+            )
+            ContactCache.objects.bulk_update(to_update, ['name', 'email', 'contact_data', 'updated_at'], batch_size=500)
+
+    def _as_contact(self, cached):
+        return {
+            'display_name': cached.name,
+            'primary_email': cached.email,
+            'photo_url': (cached.contact_data or {}).get('photo_url', '')
+        }
+
     def _filter_contacts(self, contacts, search_terms, threshold=0.60):
         """Filter and rank contacts given search terms. Returns sorted list."""
         results = []
@@ -107,7 +180,7 @@ class GoogleContactsService:
             qs = ContactCache.objects.filter(user=user)
             found = []
             for c in qs:
-                cn = {'display_name': c.display_name or '', 'primary_email': c.primary_email or '', 'photo_url': c.photo_url or ''}
+                cn = self._as_contact(c)
                 if any((t.lower() in (cn['display_name'] or '').lower()) or (t.lower() in (cn['primary_email'] or '').lower()) for t in search_terms):
                     found.append(cn)
             return found
@@ -118,14 +191,7 @@ class GoogleContactsService:
     def _maybe_update_cache(self, user, contacts):
         """Optional: update ContactCache entries (best-effort)."""
         try:
-            with transaction.atomic():
-                for c in contacts:
-                    if not c.get('primary_email'):
-                        continue
-                    ContactCache.objects.update_or_create(
-                        user=user, primary_email=c['primary_email'],
-                        defaults={'display_name': c.get('display_name', ''), 'photo_url': c.get('photo_url', '')}
-                    )
+            self.cache_contacts(user, contacts)
         except Exception as e:
             print(f"[CONTACTS] Failed to update cache: {e}")
 
@@ -148,13 +214,9 @@ class GoogleContactsService:
         for term in search_terms:
             if self._is_email(term):
                 try:
-                    cached = ContactCache.objects.filter(user=user, primary_email__iexact=term)
+                    cached = ContactCache.objects.filter(user=user, email__iexact=term)
                     if cached.exists():
-                        res = [{
-                            'display_name': c.display_name,
-                            'primary_email': c.primary_email,
-                            'photo_url': c.photo_url
-                        } for c in cached]
+                        res = [self._as_contact(c) for c in cached]
                         print(f"[CONTACTS] Found {len(res)} matches in ContactCache for email {term}")
                         return res
                 except Exception as e:
@@ -1,26 +1,122 @@
 # gmail_agent/gemini_service.py
-import json
 import re
-from typing import List, Optional, Dict
+import threading
+from functools import partial
+from typing import Any, List, Optional, Dict
+
+from django.conf import settings
+
+from .model_metrics import model_metrics, ModelCallRecord
+from .model_policy import default_policy, ModelCallError, CircuitOpenError, ModelCallOverloaded
+from .response_schema import (
+    EMAIL_DRAFT_SCHEMA, EMAIL_INTENT_SCHEMA, CONTACT_TERMS_SCHEMA,
+    SchemaValidationError, parse_response, to_generation_schema,
+)
 
 class GeminiService:
     """
     GeminiService: wrapper around a model client or a mock fallback.
     - If `model` is provided and `use_mock` is False, the service will ask the model
-      to produce a JSON object with {"subject": "...", "body": "..."} for emails.
+      to produce a JSON object with {"subject": "...", "body": "..."} for emails, constrained
+      by a declared response schema and validated strictly (one repair retry at most).
     - If `use_mock` is True or no model is provided, a local generator will create a
       decent email without echoing the user's raw prompt.
     """
 
-    def __init__(self, model=None, use_mock: bool = True):
+    # Short classification/extraction tasks go to the fast tier, long-form generation to the large one
+    DEFAULT_TASK_TIERS = {
+        'analyze_intent': 'fast',
+        'contact_terms': 'fast',
+        'email_draft': 'large',
+        'chat': 'large',
+    }
+
+    def __init__(self, model=None, use_mock: bool = True, policy=None, models: Optional[Dict] = None):
         """
-        model: object expected to implement .generate_content(prompt: str) -> { text: str }
-               (adjust to your real Gemini client interface)
+        model: object expected to implement
+               .generate_content(prompt: str, generation_config: dict = None) -> { text: str }
+               (adjust to your real Gemini client interface). Used for every tier not in `models`.
         use_mock: force mock mode if True. If False and model is provided, model will be used.
+        policy: ModelCallPolicy (deadline, hedging, circuit breaker); defaults to the shared one.
+        models: optional {tier_name: client} for tiered routing, e.g. {'fast': ..., 'large': ...}.
+        """
+        self.models = dict(models or {})
+        self.model = model or next(iter(self.models.values()), None)
+        self.use_mock = use_mock or (self.model is None)
+        self.policy = policy or default_policy()
+        self.task_tiers = {**self.DEFAULT_TASK_TIERS, **getattr(settings, 'GEMINI_TASK_TIERS', {})}
+        self.tier_config = getattr(settings, 'GEMINI_MODEL_TIERS', {})
+        print(f"[GEMINI] Initialized GeminiService; use_mock={self.use_mock}, model_present={bool(self.model)}, "
+              f"tiers={sorted(self.models)}")
+
+    @classmethod
+    def from_settings(cls) -> 'GeminiService':
+        """
+        Build a service from settings: mock mode when GEMINI_USE_MOCK is set or no API key is
+        configured, otherwise one client per entry in GEMINI_MODEL_TIERS.
+        """
+        if getattr(settings, 'GEMINI_USE_MOCK', True) or not getattr(settings, 'GEMINI_API_KEY', None):
+            return cls(use_mock=True)
+        try:
+            return cls(models=_tier_clients(), use_mock=False)
+        except Exception as e:
+            print(f"[GEMINI] Could not build tiered model clients, using mock: {e}")
+            return cls(use_mock=True)
+
+    def _route(self, call_type: str):
+        """Return (tier_name, client, timeout) for a call type."""
+        tier = self.task_tiers.get(call_type, 'large')
+        client = self.models.get(tier) or self.model
+        timeout = self.tier_config.get(tier, {}).get('timeout')
+        return tier, client, timeout
+
+    def _generate(self, prompt: str, call: ModelCallRecord, schema: Optional[Dict] = None) -> str:
+        """
+        Invoke the model through the call policy and record prompt/response sizes on `call`.
+        With `schema`, the model is asked for JSON constrained to that response schema.
+        Raises ModelCallError on timeout, open circuit or a full pool; callers fall back to local generation.
+        """
+        call.prompt_chars += len(prompt)
+        tier, client, timeout = self._route(call.call_type)
+        call.tier = tier
+        fn = client.generate_content
+        if schema is not None:
+            fn = partial(fn, generation_config={
+                'response_mime_type': 'application/json',
+                'response_schema': to_generation_schema(schema),
+            })
+        try:
+            resp = self.policy.call(fn, prompt, call, timeout=timeout)
+        except (CircuitOpenError, ModelCallOverloaded):
+            # Nothing was sent; the result will come from the local generator
+            call.backend = 'mock'
+            raise
+        text = (resp.text or "").strip()
+        call.response_chars += len(text)
+        return text
+
+    def _generate_structured(self, prompt: str, schema: Dict, call: ModelCallRecord) -> Any:
+        """
+        Ask for schema-constrained JSON and validate it strictly. If the reply is invalid, send
+        one repair request quoting the validation error; a second failure raises
+        SchemaValidationError so the caller can use its local generator.
         """
-        self.model = model
-        self.use_mock = use_mock or (model is None)
-        print(f"[GEMINI] Initialized GeminiService; use_mock={self.use_mock}, model_present={bool(self.model)}")
+        text = self._generate(prompt, call, schema)
+        try:
+            value = parse_response(text, schema)
+            call.parse_ok = True
+            return value
+        except SchemaValidationError as e:
+            call.parse_ok = False
+            print(f"[GEMINI] Structured output rejected ({e}); requesting one repair")
+            repair_prompt = (
+                f"{prompt}\n\nYour previous reply was rejected: {e}.\n"
+                f"Previous reply:\n{text[:2000]}\n\n"
+                "Reply again with only JSON that matches the response schema."
+            )
+            value = parse_response(self._generate(repair_prompt, call, schema), schema)
+            call.fallback = 'repair'
+            return value
 
     # -------------------
     # Intent analysis (unchanged mock-friendly)
@@ -30,22 +126,24 @@ class GeminiService:
             return {'intent': 'chat', 'recipient_info': None, 'email_context': None, 'confidence': 0.0}
 
         if self.use_mock:
-            return self._mock_analyze_intent(message)
+            with model_metrics.track('analyze_intent', backend='mock'):
+                return self._mock_analyze_intent(message)
 
-        try:
-            prompt = f"""
-            Analyze the user's message and detect whether they intend to send an email.
-            If yes, extract the recipient hint (name or email) and return exactly a JSON object like:
-            {{ "intent":"email", "recipient_info":"...", "email_context":"...", "confidence":0.95 }}
-            Otherwise return: {{ "intent":"chat", "recipient_info": null, "email_context": null, "confidence":0.9 }}
-            Message: \"\"\"{message}\"\"\"
-            """
-            resp = self.model.generate_content(prompt)
-            parsed = json.loads((resp.text or "").strip())
-            return parsed
-        except Exception as e:
-            print(f"[GEMINI] analyze_user_intent model error: {e}")
-            return self._mock_analyze_intent(message)
+        with model_metrics.track('analyze_intent') as call:
+            try:
+                prompt = f"""
+                Analyze the user's message and detect whether they intend to send an email.
+                If yes, set intent to "email" and extract the recipient hint (name or email).
+                Otherwise set intent to "chat" with null recipient_info and email_context.
+                Message: \"\"\"{message}\"\"\"
+                """
+                return self._generate_structured(prompt, EMAIL_INTENT_SCHEMA, call)
+            except Exception as e:
+                print(f"[GEMINI] analyze_user_intent model error: {e}")
+                if not isinstance(e, SchemaValidationError):
+                    call.error = f"{type(e).__name__}: {e}"
+                call.fallback = 'mock_intent'
+                return self._mock_analyze_intent(message)
 
     def _mock_analyze_intent(self, message: str) -> Dict:
         message_lower = message.lower()
@@ -127,44 +225,42 @@ class GeminiService:
             return [recipient_info]
 
         if self.use_mock or not self.model:
-            terms = [recipient_info]
-            words = recipient_info.split()
-            if words:
-                terms.append(words[0])
-            if len(words) > 1:
-                terms.append(words[-1])
-            for w in words:
-                if len(w) > 2 and w.lower() not in ['the', 'and', 'or', 'to', 'from', 'for', 'with']:
-                    terms.append(w)
-            seen = set(); dedup = []
-            for t in terms:
-                k = t.strip().lower()
-                if k and k not in seen:
-                    seen.add(k); dedup.append(t.strip())
-            print(f"[GEMINI] Mock contact search terms: {dedup}")
-            return dedup
+            with model_metrics.track('contact_terms', backend='mock'):
+                return self._mock_contact_search_terms(recipient_info)
 
-        try:
-            prompt = f"""
-            From this description: "{recipient_info}"
-            return a JSON array of search terms (names, first name, last name, nicknames, emails).
-            Example: ["Full Name", "FirstName", "LastName", "email@example.com"]
-            """
-            resp = self.model.generate_content(prompt)
-            parsed = json.loads((resp.text or "").strip())
-            if isinstance(parsed, list):
-                return [str(p).strip() for p in parsed if str(p).strip()]
-            return [recipient_info]
-        except Exception as e:
-            print(f"[GEMINI] Error extracting contact search terms: {e}")
-            words = recipient_info.split()
-            terms = [recipient_info] + [w for w in words if len(w) > 2]
-            seen = set(); res = []
-            for t in terms:
-                k = t.strip().lower()
-                if k and k not in seen:
-                    seen.add(k); res.append(t.strip())
-            return res
+        with model_metrics.track('contact_terms') as call:
+            try:
+                prompt = f"""
+                From this description: "{recipient_info}"
+                return the search terms to look this person up in an address book
+                (full name, first name, last name, nicknames, emails).
+                """
+                terms = self._generate_structured(prompt, CONTACT_TERMS_SCHEMA, call)
+                return [t.strip() for t in terms if t.strip()] or [recipient_info]
+            except Exception as e:
+                print(f"[GEMINI] Error extracting contact search terms: {e}")
+                if not isinstance(e, SchemaValidationError):
+                    call.error = f"{type(e).__name__}: {e}"
+                call.fallback = 'mock_terms'
+                return self._mock_contact_search_terms(recipient_info)
+
+    def _mock_contact_search_terms(self, recipient_info: str) -> List[str]:
+        terms = [recipient_info]
+        words = recipient_info.split()
+        if words:
+            terms.append(words[0])
+        if len(words) > 1:
+            terms.append(words[-1])
+        for w in words:
+            if len(w) > 2 and w.lower() not in ['the', 'and', 'or', 'to', 'from', 'for', 'with']:
+                terms.append(w)
+        seen = set(); dedup = []
+        for t in terms:
+            k = t.strip().lower()
+            if k and k not in seen:
+                seen.add(k); dedup.append(t.strip())
+        print(f"[GEMINI] Mock contact search terms: {dedup}")
+        return dedup
 
     # -------------------
     # Email composition: use model when available for dynamic, natural email generation
@@ -184,6 +280,12 @@ class GeminiService:
         Otherwise produce a high-quality local draft (mock) that avoids echoing prompts.
         `tone` may be 'professional'|'casual' etc. `length` may be 'short'|'medium'.
         """
+        backend = 'mock' if (self.use_mock or not self.model) else 'model'
+        with model_metrics.track('email_draft', backend=backend) as call:
+            return self._compose_email(recipient_name, recipient_email, email_context, user_name, tone, length, call)
+
+    def _compose_email(self, recipient_name, recipient_email, email_context, user_name, tone, length,
+                       call: ModelCallRecord) -> Dict:
         # Normalize inputs
         email_context = (email_context or "").strip()
         recipient_name = (recipient_name or "").strip()
@@ -215,12 +317,11 @@ class GeminiService:
             if cleaned and len(cleaned.split()) <= 14:
                 topic = cleaned
 
-        # If we have a model and mock is disabled, ask the model for a JSON email
+        # If we have a model and mock is disabled, ask the model for a schema-constrained JSON email
         if not self.use_mock and self.model:
             try:
-                # Build a clear instruction prompt that requests JSON only
                 model_prompt = f"""
-You are an expert assistant that composes concise, professional emails. Produce a JSON object with exactly two fields: "subject" and "body".
+You are an expert assistant that composes concise, professional emails. Fill in "subject" and "body".
 - subject: one-line subject (no newlines), 30-80 characters.
 - body: full email body including greeting, 1-3 short paragraphs, a clear call-to-action, and a closing/signature.
 Requirements:
@@ -234,59 +335,15 @@ user_name: "{user_name}"
 meeting_time: "{meeting_time or ''}"
 topic: "{topic or ''}"
 cleaned_context: "{cleaned}"
-Example output:
-{{ "subject": "Meeting about X", "body": "Hi Name,\\n\\n...\\n\\nBest,\\nUser" }}
-Produce only valid JSON.
 """
-                resp = self.model.generate_content(model_prompt)
-                text = (resp.text or "").strip()
-
-                # First try strict JSON parse
-                try:
-                    parsed = json.loads(text)
-                    subj = parsed.get('subject', '').strip()
-                    body = parsed.get('body', '').strip()
-                    if subj and body:
-                        return {'subject': subj, 'body': body}
-                except Exception:
-                    # Not strict JSON — try to extract subject/body heuristically
-                    pass
-
-                # Heuristic extraction: look for Subject: and Body separators
-                subj = ""
-                body = ""
-                # common pattern: {"subject": "...", "body": "..."}
-                m_json_like = re.search(r'(\{.*\})', text, re.S)
-                if m_json_like:
-                    try:
-                        parsed2 = json.loads(m_json_like.group(1))
-                        subj = parsed2.get('subject', '').strip()
-                        body = parsed2.get('body', '').strip()
-                        if subj and body:
-                            return {'subject': subj, 'body': body}
-                    except Exception:
-                        pass
-
-                # fallback parse: Subject: ... \n\n body...
-                m_sub = re.search(r'Subject:\s*(.+)', text)
-                if m_sub:
-                    subj = m_sub.group(1).strip()
-                    # rest as body
-                    after = text[m_sub.end():].strip()
-                    body = after
-                else:
-                    # attempt to split first line as subject and rest as body
-                    parts = text.split("\n\n", 1)
-                    if parts:
-                        subj = parts[0].strip()
-                        body = parts[1].strip() if len(parts) > 1 else ""
-
-                if subj and body:
-                    return {'subject': subj, 'body': body}
-                else:
-                    print("[GEMINI] Model returned text but parsing failed, falling back to local generator.")
+                draft = self._generate_structured(model_prompt, EMAIL_DRAFT_SCHEMA, call)
+                return {'subject': draft['subject'].strip(), 'body': draft['body'].strip()}
+            except SchemaValidationError as e:
+                print(f"[GEMINI] Model output failed schema validation after repair ({e}), falling back to local generator.")
             except Exception as e:
                 print(f"[GEMINI] Error using model to generate email content: {e}")
+                call.error = f"{type(e).__name__}: {e}"
+            call.fallback = 'local_generator'
 
         # MOCK / local generator fallback (still high-quality, avoids echo)
         # Build a natural subject
@@ -345,7 +402,12 @@ Produce only valid JSON.
     # -------------------
     def generate_chat_response(self, message: str, chat_history: List[Dict]) -> str:
         if self.use_mock:
-            return self._mock_generate_chat_response(message, chat_history)
+            with model_metrics.track('chat', backend='mock'):
+                return self._mock_generate_chat_response(message, chat_history)
+        with model_metrics.track('chat') as call:
+            return self._model_chat_response(message, chat_history, call)
+
+    def _model_chat_response(self, message: str, chat_history: List[Dict], call: ModelCallRecord) -> str:
         try:
             prompt = f"""You are InboxIQ's Gmail Assistant. Help the user with email-related tasks.
             
@@ -361,10 +423,14 @@ Produce only valid JSON.
             
             Provide a helpful, concise response about Gmail and email management."""
             
-            resp = self.model.generate_content(prompt)
-            return (resp.text or "").strip()
+            return self._generate(prompt, call)
         except Exception as e:
             print(f"[GEMINI] generate_chat_response error: {e}")
+            call.error = f"{type(e).__name__}: {e}"
+            if isinstance(e, ModelCallError):
+                call.fallback = 'mock_chat'
+                return self._mock_generate_chat_response(message, chat_history)
+            call.fallback = 'apology'
             return "Sorry, I couldn't process that due to an internal error."
     
     def _mock_generate_chat_response(self, message: str, chat_history: List[Dict]) -> str:
@@ -451,3 +517,21 @@ For your message "{message}", I can assist with:
 • Email productivity tips
 
 What would you like to do with your emails today?"""
+
+
+_tier_clients_cache = None
+_tier_clients_lock = threading.Lock()
+
+
+def _tier_clients() -> Dict:
+    """Process-wide Gemini clients, one per configured tier (built once, on first use)."""
+    global _tier_clients_cache
+    with _tier_clients_lock:
+        if _tier_clients_cache is None:
+            import google.generativeai as genai
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+            _tier_clients_cache = {
+                tier: genai.GenerativeModel(cfg['model'])
+                for tier, cfg in settings.GEMINI_MODEL_TIERS.items()
+            }
+        return _tier_clients_cache
@@ -0,0 +1,207 @@
+# backend/inboxiq_project/gmail_agent/history.py
+"""
+Keyset-paginated chat history, shared by the Gmail and Calendar agents.
+
+Pages are ordered on (timestamp, id) and read straight off the (session, timestamp, id)
+index, so a page costs the same at message 10 and message 10,000. Cursors are opaque
+strings naming the (timestamp, id) of a message:
+
+    GET .../history/<session_id>/                  newest `limit` messages
+    GET .../history/<session_id>/?before=<cursor>  the page just older than the cursor
+    GET .../history/<session_id>/?after=<cursor>   only messages newer than the cursor
+
+Messages are always returned oldest first. `cursors.before` pages further back,
+`cursors.after` is what the frontend polls with for new messages.
+
+The metadata JSON (drafts, contact matches, event payloads) is left in the database
+unless include_metadata=true; otherwise only its small scalar keys are returned.
+
+Sessions carry denormalized message_count / last_message_preview / last_message_at,
+folded in by record_messages() in the same transaction as the message insert, so the
+session list is one keyset query on (updated_at, id) with no per-session COUNT.
+"""
+import base64
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+# Metadata keys cheap enough to return with every message
+LIGHT_METADATA_KEYS = ('type', 'draft_id', 'event_id')
+
+# Characters of the latest message kept on its session
+PREVIEW_LENGTH = 200
+
+
+class CursorError(ValueError):
+    """A history cursor that could not be decoded"""
+
+
+def encode_cursor(timestamp: datetime, pk: int) -> str:
+    raw = f"{timestamp.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise CursorError(f"Invalid cursor: {cursor}")
+
+
+def page_size(value: Optional[str]) -> int:
+    """The requested page size, clamped to [1, CHAT_HISTORY_MAX_PAGE_SIZE]"""
+    default = getattr(settings, 'CHAT_HISTORY_PAGE_SIZE', 50)
+    maximum = getattr(settings, 'CHAT_HISTORY_MAX_PAGE_SIZE', 200)
+    try:
+        size = int(value) if value else default
+    except ValueError:
+        size = default
+    return max(1, min(size, maximum))
+
+
+def _flag(value: Optional[str]) -> bool:
+    return (value or '').lower() in ('1', 'true', 'yes')
+
+
+def message_page(messages, params, light_metadata_keys: Iterable[str] = LIGHT_METADATA_KEYS) -> Dict:
+    """
+    One page of a session's messages
+
+    Args:
+        messages: queryset of one session's ChatMessage / CalendarMessage rows
+        params: request.GET (limit, before, after, include_metadata)
+        light_metadata_keys: metadata keys returned when the full metadata is not requested
+
+    Returns:
+        {'messages': [...], 'has_more': bool, 'cursors': {'before': str|None, 'after': str|None}}
+        has_more means more messages lie beyond the page in the direction asked for
+        (older without a cursor or with `before`, newer with `after`).
+
+    Raises:
+        CursorError: if `before` or `after` is not a cursor
+    """
+    limit = page_size(params.get('limit'))
+    after, before = params.get('after'), params.get('before')
+    include_metadata = _flag(params.get('include_metadata'))
+
+    if after:
+        timestamp, pk = decode_cursor(after)
+        messages = messages.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk))
+        messages = messages.order_by('timestamp', 'id')
+    else:
+        if before:
+            timestamp, pk = decode_cursor(before)
+            messages = messages.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+        messages = messages.order_by('-timestamp', '-id')
+
+    light_keys = list(light_metadata_keys)
+    if include_metadata:
+        rows = messages.values('id', 'message_type', 'content', 'timestamp', 'metadata')
+    else:
+        # Key lookups pull single values out of the JSON in the database
+        rows = messages.values('id', 'message_type', 'content', 'timestamp',
+                               *[f'metadata__{key}' for key in light_keys])
+    rows = list(rows[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not after:
+        rows.reverse()
+
+    message_list = []
+    for row in rows:
+        if include_metadata:
+            metadata = row['metadata']
+        else:
+            metadata = {key: row[f'metadata__{key}'] for key in light_keys
+                        if row[f'metadata__{key}'] is not None}
+        message_list.append({
+            'id': row['id'],
+            'type': row['message_type'],
+            'content': row['content'],
+            'timestamp': row['timestamp'].isoformat(),
+            'metadata': metadata,
+        })
+
+    first, last = (rows[0], rows[-1]) if rows else (None, None)
+    return {
+        'messages': message_list,
+        'has_more': has_more,
+        'cursors': {
+            'before': encode_cursor(first['timestamp'], first['id']) if first else before or None,
+            'after': encode_cursor(last['timestamp'], last['id']) if last else after or None,
+        },
+    }
+
+
+def preview(content: str) -> str:
+    text = ' '.join((content or '').split())
+    return text if len(text) <= PREVIEW_LENGTH else text[:PREVIEW_LENGTH - 1] + '\u2026'
+
+
+def record_messages(session_model, session_pk, messages) -> int:
+    """
+    Fold newly inserted messages into their session's denormalized columns with one UPDATE
+
+    Call inside the transaction that inserted the messages. The count is incremented in
+    the database, and the last-message columns only move forward, so concurrent writers
+    to the same session cannot lose a message or leave an older preview behind.
+
+    Returns:
+        number of session rows updated (0 or 1)
+    """
+    messages = [m for m in messages if m.timestamp is not None]
+    if not messages:
+        return 0
+    latest = max(messages, key=lambda m: m.timestamp)
+    newer = Q(last_message_at__isnull=True) | Q(last_message_at__lte=latest.timestamp)
+    return session_model.objects.filter(pk=session_pk).update(
+        message_count=F('message_count') + len(messages),
+        last_message_preview=Case(When(newer, then=Value(preview(latest.content))),
+                                  default=F('last_message_preview')),
+        last_message_at=Case(When(newer, then=Value(latest.timestamp)), default=F('last_message_at')),
+        updated_at=timezone.now(),
+    )
+
+
+def session_page(sessions, params) -> Dict:
+    """
+    One page of a user's sessions, most recently active first
+
+    Args:
+        sessions: queryset of the user's ChatSession / CalendarSession rows
+        params: request.GET (limit, before = cursor from the previous page)
+
+    Returns:
+        {'sessions': [...], 'has_more': bool, 'cursor': str|None (pass as `before` for the next page)}
+
+    Raises:
+        CursorError: if `before` is not a cursor
+    """
+    limit = page_size(params.get('limit'))
+    before = params.get('before')
+    if before:
+        updated_at, pk = decode_cursor(before)
+        sessions = sessions.filter(Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=pk))
+    rows = list(sessions.order_by('-updated_at', '-id').values(
+        'id', 'session_id', 'created_at', 'updated_at', 'message_count', 'last_message_preview', 'last_message_at'
+    )[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        'sessions': [{
+            'session_id': row['session_id'],
+            'created_at': row['created_at'].isoformat(),
+            'updated_at': row['updated_at'].isoformat(),
+            'message_count': row['message_count'],
+            'last_message_preview': row['last_message_preview'],
+            'last_message_at': row['last_message_at'].isoformat() if row['last_message_at'] else None,
+        } for row in rows],
+        'has_more': has_more,
+        'cursor': encode_cursor(rows[-1]['updated_at'], rows[-1]['id']) if has_more else None,
+    }
@@ -0,0 +1,179 @@
+# backend/inboxiq_project/gmail_agent/idempotency.py
+"""
+Idempotency-Key support for POST endpoints that call the model or Gmail.
+
+A client that retries a slow request sends the same Idempotency-Key header. The first
+request claims (user, key) by inserting an IdempotencyRecord; the unique constraint makes
+that claim atomic across workers. It runs the view and stores the response. A retry
+that finds the record completed gets the stored response back (with an
+Idempotent-Replayed header) without running the view again. A retry that arrives while
+the first request is still running waits briefly for it; the work happens exactly once.
+
+- Reusing a key for a different request body or endpoint is a 422.
+- 5xx responses are not stored: the claim is released so a retry runs again.
+- A claim older than IDEMPOTENCY_LOCK_SECONDS is treated as abandoned (its worker died)
+  and may be taken over; completed records expire after IDEMPOTENCY_TTL_HOURS and are
+  deleted by purge_expired() (manage.py purge_idempotency_keys).
+- A retry waits at most IDEMPOTENCY_WAIT_SECONDS for the original, then gets a 409 with
+  Retry-After instead of holding a worker for the whole of a slow request.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyRecord
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Delay between checks while another request holds the key
+POLL_SECONDS = 0.1
+# Upper bound on IDEMPOTENCY_WAIT_SECONDS: a waiting retry ties up a worker
+MAX_WAIT_SECONDS = 5
+# Expired records deleted per statement by purge_expired()
+PURGE_BATCH_SIZE = 1000
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _cors(response):
+    response['Access-Control-Allow-Origin'] = '*'
+    response['Access-Control-Allow-Credentials'] = 'true'
+    return response
+
+
+def _error(message: str, code: str, status: int):
+    return _cors(JsonResponse({'error': message, 'code': code}, status=status))
+
+
+def _claim(user, key: str, endpoint: str, request_hash: str):
+    """(record, claimed): the new in-progress record if this request now owns the key, else the existing one"""
+    try:
+        with transaction.atomic():
+            return IdempotencyRecord.objects.create(
+                user=user, key=key, endpoint=endpoint, request_hash=request_hash
+            ), True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyRecord.objects.filter(user=user, key=key).first()
+    if record is None:
+        # Released between our INSERT and SELECT
+        return None, False
+
+    now = timezone.now()
+    if record.status == 'completed':
+        expired = record.created_at < now - timedelta(hours=_setting('IDEMPOTENCY_TTL_HOURS', 24))
+    else:
+        expired = record.created_at < now - timedelta(seconds=_setting('IDEMPOTENCY_LOCK_SECONDS', 120))
+    if expired:
+        # Take it over; the filter on created_at lets only one request win
+        taken = IdempotencyRecord.objects.filter(pk=record.pk, created_at=record.created_at).update(
+            endpoint=endpoint, request_hash=request_hash, status='in_progress',
+            response_status=None, response_body='', content_type='', created_at=now, completed_at=None,
+        )
+        if taken:
+            record.refresh_from_db()
+            return record, True
+        record.refresh_from_db()
+    return record, False
+
+
+def purge_expired(batch_size: int = PURGE_BATCH_SIZE) -> int:
+    """
+    Delete records older than IDEMPOTENCY_TTL_HOURS, `batch_size` per statement
+
+    Claims that old are long past IDEMPOTENCY_LOCK_SECONDS too, so abandoned ones go as well.
+
+    Returns:
+        number of records deleted
+    """
+    cutoff = timezone.now() - timedelta(hours=_setting('IDEMPOTENCY_TTL_HOURS', 24))
+    deleted = 0
+    while True:
+        batch = list(IdempotencyRecord.objects.filter(created_at__lt=cutoff)
+                     .order_by('created_at').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += IdempotencyRecord.objects.filter(pk__in=batch).delete()[0]
+
+
+def _replay(record: IdempotencyRecord):
+    response = HttpResponse(record.response_body, status=record.response_status,
+                            content_type=record.content_type or 'application/json')
+    response['Idempotent-Replayed'] = 'true'
+    return _cors(response)
+
+
+def _store(record: IdempotencyRecord, response) -> None:
+    if response.streaming or response.status_code >= 500:
+        record.delete()
+        return
+    IdempotencyRecord.objects.filter(pk=record.pk).update(
+        status='completed',
+        response_status=response.status_code,
+        response_body=response.content.decode(response.charset or 'utf-8'),
+        content_type=response.get('Content-Type', ''),
+        completed_at=timezone.now(),
+    )
+
+
+def idempotent(endpoint: str):
+    """
+    Decorator for POST views: requests carrying an Idempotency-Key are run at most once
+    per (user, key), and retries get the first response back.
+
+    Args:
+        endpoint: name stored with the key, so it can't be replayed against another view
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER, '').strip()
+            user = getattr(request, 'user', None)
+            if request.method != 'POST' or not key or user is None or not user.is_authenticated:
+                return view(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return _error(f'{HEADER} must be at most {MAX_KEY_LENGTH} characters', 'INVALID_IDEMPOTENCY_KEY', 400)
+
+            request_hash = hashlib.sha256(request.body).hexdigest()
+            deadline = time.monotonic() + min(_setting('IDEMPOTENCY_WAIT_SECONDS', 3), MAX_WAIT_SECONDS)
+            while True:
+                record, claimed = _claim(user, key, endpoint, request_hash)
+                if claimed:
+                    break
+                if record is not None:
+                    if record.endpoint != endpoint or record.request_hash != request_hash:
+                        return _error(f'{HEADER} was already used for a different request',
+                                      'IDEMPOTENCY_KEY_REUSED', 422)
+                    if record.status == 'completed':
+                        print(f"[IDEMPOTENCY] Replaying {endpoint} response for key {key}")
+                        return _replay(record)
+                if time.monotonic() >= deadline:
+                    response = _error('A request with this Idempotency-Key is still being processed',
+                                      'IDEMPOTENCY_IN_PROGRESS', 409)
+                    response['Retry-After'] = '1'
+                    return response
+                time.sleep(POLL_SECONDS)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                record.delete()
+                raise
+            try:
+                _store(record, response)
+            except Exception as e:
+                print(f"[IDEMPOTENCY] Failed to store {endpoint} response for key {key}: {e}")
+            return response
+
+        return wrapper
+
+    return decorator
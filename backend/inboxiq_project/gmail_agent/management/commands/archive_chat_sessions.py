@@ -0,0 +1,36 @@
+# gmail_agent/management/commands/archive_chat_sessions.py
+from django.core.management.base import BaseCommand
+
+from gmail_agent.archive import ARCHIVE_TARGETS, archive_inactive
+
+
+class Command(BaseCommand):
+    help = ("Move the messages of chat sessions inactive for N days into compressed archive rows, "
+            "a batch of sessions per transaction.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--agent', choices=[*ARCHIVE_TARGETS, 'all'], default='all',
+                            help='Which chat to archive (default: all)')
+        parser.add_argument('--days', type=int, help='Inactivity threshold (default: CHAT_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Sessions per transaction')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+        parser.add_argument('--limit', type=int, help='Archive at most this many sessions per agent')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the sessions that would be archived')
+
+    def handle(self, *args, **options):
+        agents = list(ARCHIVE_TARGETS) if options['agent'] == 'all' else [options['agent']]
+        for agent in agents:
+            stats = archive_inactive(
+                agent,
+                days=options['days'],
+                batch_size=options['batch_size'],
+                pause_seconds=options['pause'],
+                dry_run=options['dry_run'],
+                limit=options['limit'],
+            )
+            if options['dry_run']:
+                self.stdout.write(f"{agent}: {stats['sessions']} sessions would be archived")
+                continue
+            self.stdout.write(f"{agent}: {stats['sessions']} sessions, {stats['messages']} messages "
+                              f"archived in {stats['batches']} batches ({stats['bytes']} bytes compressed)")
+        self.stdout.write(self.style.SUCCESS("Chat archival finished"))
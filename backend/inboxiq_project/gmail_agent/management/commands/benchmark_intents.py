@@ -0,0 +1,41 @@
+# gmail_agent/management/commands/benchmark_intents.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gmail_agent.benchmarks.runner import DEFAULT_CORPUS, HOLDOUT_CORPUS, TASKS, run_benchmark, write_result
+
+
+class Command(BaseCommand):
+    help = "Run the offline intent/extraction benchmark over a labelled corpus and write a JSON result file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS), help='Path to a corpus JSON file')
+        parser.add_argument('--holdout', default=str(HOLDOUT_CORPUS),
+                            help="Path to the held-out corpus, scored as '<task>_holdout' ('' to skip)")
+        parser.add_argument('--output', default='benchmark_results.json', help='Where to write the result JSON')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed calls per corpus item')
+        parser.add_argument('--task', action='append', choices=sorted(TASKS), dest='tasks',
+                            help='Only run this task (may be repeated)')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+
+        try:
+            result = run_benchmark(options['corpus'], repeat=options['repeat'], tasks=options['tasks'],
+                                   holdout_path=options['holdout'] or None)
+        except FileNotFoundError as e:
+            raise CommandError(f"Corpus not found: {e}")
+
+        write_result(result, options['output'])
+
+        for task, report in result['tasks'].items():
+            latency = report.get('latency', {})
+            summary = {k: v for k, v in report.items() if k in ('accuracy', 'term_precision', 'term_recall',
+                                                              'recipient_exact_match', 'start_exact_match',
+                                                              'duration_accuracy', 'recurrence_accuracy',
+                                                              'defer_accuracy', 'low_confidence_rate')}
+            self.stdout.write(f"{task}: items={report['items']} {json.dumps(summary)} "
+                              f"p50={latency.get('p50_us')}us p99={latency.get('p99_us')}us")
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,15 @@
+# gmail_agent/management/commands/purge_idempotency_keys.py
+from django.core.management.base import BaseCommand
+
+from gmail_agent.idempotency import PURGE_BATCH_SIZE, purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete stored Idempotency-Key responses older than IDEMPOTENCY_TTL_HOURS."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='Records deleted per statement')
+
+    def handle(self, *args, **options):
+        deleted = purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} idempotency records"))
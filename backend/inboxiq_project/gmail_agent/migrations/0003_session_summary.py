@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:22
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+
+
+def backfill_session_summary(apps, schema_editor):
+    # One UPDATE over all sessions from correlated subqueries on the (session, timestamp, id) index
+    ChatSession = apps.get_model('gmail_agent', 'ChatSession')
+    ChatMessage = apps.get_model('gmail_agent', 'ChatMessage')
+    messages = ChatMessage.objects.filter(session=OuterRef('pk'))
+    latest = messages.order_by('-timestamp', '-id')
+    counts = messages.order_by().values('session').annotate(n=Count('id')).values('n')
+    ChatSession.objects.update(
+        message_count=Coalesce(Subquery(counts, output_field=IntegerField()), Value(0)),
+        last_message_preview=Coalesce(Substr(Subquery(latest.values('content')[:1]), 1, 200), Value('')),
+        last_message_at=Subquery(latest.values('timestamp')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gmail_agent', '0002_chat_history_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='chatsession',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='chatsession',
+            index=models.Index(fields=['user', 'is_active', '-updated_at', '-id'], name='chat_session_list_idx'),
+        ),
+        migrations.RunPython(backfill_session_summary, migrations.RunPython.noop),
+    ]
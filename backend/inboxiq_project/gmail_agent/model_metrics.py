@@ -0,0 +1,188 @@
+# gmail_agent/model_metrics.py
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger('inboxiq.model_calls')
+
+
+class ModelCallRecord:
+    """
+    One model invocation (or its local mock equivalent).
+    Fields are filled in by GeminiService while the call is in flight.
+    """
+
+    def __init__(self, call_type: str, backend: str = 'model'):
+        self.call_type = call_type
+        self.backend = backend          # 'model' | 'mock' | 'local' (answered without a model, e.g. a template)
+        self.latency_ms = 0.0
+        self.backend_latency_ms: Optional[float] = None  # the winning backend request alone
+        self.prompt_chars = 0
+        self.response_chars = 0
+        self.parse_ok: Optional[bool] = None  # None when no parsing was attempted
+        self.fallback: Optional[str] = None   # name of the fallback path that produced the result
+        # 'hit' | 'miss' for lookups in a cache that can answer instead of the model (event
+        # templates); 'bypass' for calls that have no such cache in front of them
+        self.cache = 'bypass'
+        self.hedged = False             # a duplicate request was fired after the hedge delay
+        self.tier: Optional[str] = None  # model tier the call was routed to ('fast' | 'large' | ...)
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> Dict:
+        return {
+            'call_type': self.call_type,
+            'backend': self.backend,
+            'tier': self.tier,
+            'latency_ms': round(self.latency_ms, 2),
+            'backend_latency_ms': round(self.backend_latency_ms, 2) if self.backend_latency_ms is not None else None,
+            'prompt_chars': self.prompt_chars,
+            'response_chars': self.response_chars,
+            'parse_ok': self.parse_ok,
+            'fallback': self.fallback,
+            'cache': self.cache,
+            'hedged': self.hedged,
+            'error': self.error,
+        }
+
+
+def _percentile(sorted_values, pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return round(sorted_values[idx], 2)
+
+
+class ModelMetrics:
+    """
+    Process-wide, thread-safe aggregation of model call records.
+    Keeps a bounded window of latency samples per (call type, backend) plus running counters.
+    """
+
+    def __init__(self, window: int = 500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._reset_state()
+
+    def _reset_state(self):
+        self._latencies = defaultdict(lambda: deque(maxlen=self.window))
+        self._counts = defaultdict(Counter)
+        self._fallbacks = defaultdict(Counter)
+        self._cache = defaultdict(Counter)
+        self._tier_latencies = defaultdict(lambda: deque(maxlen=self.window))
+        # Raw backend request times per call type, without retries and post-processing
+        self._backend_latencies = defaultdict(lambda: deque(maxlen=self.window))
+
+    @contextmanager
+    def track(self, call_type: str, backend: str = 'model'):
+        """Time the enclosed block and record it, even if it raises."""
+        record = ModelCallRecord(call_type, backend)
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record.error = record.error or f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record.latency_ms = (time.perf_counter() - started) * 1000.0
+            self.record(record)
+
+    def record(self, record: ModelCallRecord):
+        with self._lock:
+            key = record.call_type
+            self._latencies[(key, record.backend)].append(record.latency_ms)
+            counts = self._counts[key]
+            counts['calls'] += 1
+            counts[f"backend_{record.backend}"] += 1
+            counts['prompt_chars'] += record.prompt_chars
+            counts['response_chars'] += record.response_chars
+            if record.parse_ok is True:
+                counts['parse_ok'] += 1
+            elif record.parse_ok is False:
+                counts['parse_failed'] += 1
+            if record.error:
+                counts['errors'] += 1
+            if record.hedged:
+                counts['hedged'] += 1
+            if record.fallback:
+                self._fallbacks[key][record.fallback] += 1
+            self._cache[key][record.cache] += 1
+            if record.tier and record.backend == 'model':
+                self._tier_latencies[record.tier].append(record.latency_ms)
+
+        logger.info(json.dumps({'event': 'model_call', **record.as_dict()}))
+
+    def record_backend_latency(self, call_type: str, latency_ms: float):
+        """One successful backend request, timed by the call policy (hedged duplicates included)."""
+        with self._lock:
+            self._backend_latencies[call_type].append(latency_ms)
+
+    def backend_latency_percentile(self, call_type: str, pct: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._backend_latencies.get(call_type, ()))
+        if len(samples) < min_samples:
+            return None
+        return _percentile(samples, pct)
+
+    def latency_percentile(self, call_type: str, pct: float, backend: str = 'model',
+                           min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._latencies.get((call_type, backend), ()))
+        if len(samples) < min_samples:
+            return None
+        return _percentile(samples, pct)
+
+    @staticmethod
+    def _latency_summary(samples) -> Dict:
+        return {
+            'p50': _percentile(samples, 50),
+            'p95': _percentile(samples, 95),
+            'p99': _percentile(samples, 99),
+            'max': round(samples[-1], 2) if samples else None,
+            'samples': len(samples),
+        }
+
+    def snapshot(self) -> Dict:
+        """Return aggregated metrics per call type, suitable for JSON output."""
+        with self._lock:
+            result = {}
+            for call_type, counts in self._counts.items():
+                calls = counts['calls'] or 1
+                parsed = counts['parse_ok'] + counts['parse_failed']
+                result[call_type] = {
+                    'calls': counts['calls'],
+                    'model_calls': counts['backend_model'],
+                    'mock_calls': counts['backend_mock'],
+                    'local_calls': counts['backend_local'],
+                    'errors': counts['errors'],
+                    'hedged': counts['hedged'],
+                    'latency_ms': {
+                        backend: self._latency_summary(sorted(self._latencies[(call_type, backend)]))
+                        for backend in ('model', 'mock', 'local')
+                        if (call_type, backend) in self._latencies
+                    },
+                    'backend_latency_ms': self._latency_summary(sorted(self._backend_latencies[call_type])),
+                    'avg_prompt_chars': round(counts['prompt_chars'] / calls, 1),
+                    'avg_response_chars': round(counts['response_chars'] / calls, 1),
+                    'parse_failures': counts['parse_failed'],
+                    'parse_failure_rate': round(counts['parse_failed'] / parsed, 4) if parsed else None,
+                    'fallbacks': dict(self._fallbacks[call_type]),
+                    'cache': dict(self._cache[call_type]),
+                }
+            return result
+
+    def tier_snapshot(self) -> Dict:
+        """Latency per model tier (model-backed calls only)."""
+        with self._lock:
+            return {tier: self._latency_summary(sorted(samples)) for tier, samples in self._tier_latencies.items()}
+
+    def reset(self):
+        with self._lock:
+            self._reset_state()
+
+
+# Shared instance used by GeminiService and the metrics endpoint
+model_metrics = ModelMetrics()
@@ -0,0 +1,257 @@
+# gmail_agent/model_policy.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Optional
+
+from django.conf import settings
+
+from .model_metrics import model_metrics, ModelMetrics, ModelCallRecord
+
+
+class ModelCallError(Exception):
+    """Raised when the policy layer refuses or abandons a model call."""
+
+
+class ModelCallTimeout(ModelCallError):
+    """The call did not complete within its deadline."""
+
+
+class CircuitOpenError(ModelCallError):
+    """The circuit breaker is open; the backend is considered unhealthy."""
+
+
+class ModelCallOverloaded(ModelCallError):
+    """Every in-flight slot is taken; the call was refused instead of queued."""
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker.
+    - closed: calls pass; `failure_threshold` consecutive failures open the circuit.
+    - open: calls are rejected until `reset_timeout` seconds have passed.
+    - half_open: a single probe call is let through; success closes, failure re-opens.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class ModelCallPolicy:
+    """
+    Wraps a blocking model call with:
+    - a hard per-call deadline (`timeout` seconds),
+    - optional hedging: once the call has run longer than the observed p95 latency of the
+      backend requests for its call type, a duplicate request is fired and whichever
+      finishes first wins,
+    - a circuit breaker that rejects calls while the backend is failing; while it is half-open
+      the single probe is never hedged.
+
+    Backend requests run on a bounded thread pool, and at most `max_in_flight` of them
+    (hedges included) may be queued or running at once: a call that finds every slot taken
+    fails fast with ModelCallOverloaded, and a hedge that finds none is skipped. At the
+    deadline, requests that have not started are cancelled; ones already running finish in
+    the background, holding their slot, and are ignored.
+    """
+
+    def __init__(self,
+                 timeout: float = 8.0,
+                 hedge: bool = True,
+                 hedge_percentile: float = 95.0,
+                 hedge_min_samples: int = 20,
+                 hedge_min_delay: float = 0.05,
+                 breaker: Optional[CircuitBreaker] = None,
+                 executor: Optional[ThreadPoolExecutor] = None,
+                 metrics: ModelMetrics = model_metrics,
+                 max_in_flight: Optional[int] = None):
+        self.timeout = timeout
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.executor = executor or _shared_executor()
+        self.metrics = metrics
+        self._slots = threading.BoundedSemaphore(
+            max_in_flight or getattr(settings, 'GEMINI_MAX_CONCURRENT_CALLS', 16))
+
+    def hedge_delay(self, call_type: str, timeout: Optional[float] = None) -> Optional[float]:
+        """Seconds to wait before firing a hedge, or None if hedging is off / not enough samples."""
+        if not self.hedge:
+            return None
+        # Raw request times: the tracked call latency also covers schema repair and parsing
+        p = self.metrics.backend_latency_percentile(call_type, self.hedge_percentile,
+                                                    min_samples=self.hedge_min_samples)
+        if p is None:
+            return None
+        delay = max(self.hedge_min_delay, p / 1000.0)
+        limit = self.timeout if timeout is None else timeout
+        return delay if delay < limit else None
+
+    def call(self, fn: Callable, prompt: str, call: ModelCallRecord, timeout: Optional[float] = None):
+        """Run fn(prompt) under the policy. Raises ModelCallError subclasses or the call's own error."""
+        # Take the slot before asking the breaker, so a refused call never claims the half-open probe
+        if not self._slots.acquire(blocking=False):
+            raise ModelCallOverloaded("all model call slots are in use")
+        if not self.breaker.allow():
+            self._slots.release()
+            raise CircuitOpenError("model backend circuit is open")
+
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        pending = {self._submit(fn, prompt, call.call_type)}
+        last_error = None
+
+        # A half-open breaker lets one probe through; a hedge would be a second request
+        hedge_after = None
+        if self.breaker.state != CircuitBreaker.HALF_OPEN:
+            hedge_after = self.hedge_delay(call.call_type, timeout)
+        if hedge_after is not None:
+            done, pending = wait(pending, timeout=hedge_after, return_when=FIRST_COMPLETED)
+            result = self._first_result(done)
+            if result is not _NO_RESULT:
+                self.breaker.record_success()
+                return self._finish(call, result)
+            last_error = self._first_error(done)
+            # Either still running past p95 or failed fast: fire the duplicate if a slot is free
+            if self._slots.acquire(blocking=False):
+                call.hedged = True
+                pending.add(self._submit(fn, prompt, call.call_type))
+
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                result = self._first_result(done)
+                if result is not _NO_RESULT:
+                    self.breaker.record_success()
+                    return self._finish(call, result)
+                last_error = self._first_error(done) or last_error
+        finally:
+            # Requests still queued behind other calls never start; running ones can't be stopped
+            for f in pending:
+                f.cancel()
+
+        self.breaker.record_failure()
+        if pending:
+            raise ModelCallTimeout(f"model call exceeded {timeout:.1f}s deadline")
+        raise last_error
+
+    def _submit(self, fn: Callable, prompt: str, call_type: str):
+        """Queue one backend request on a slot already taken; the slot is freed when it finishes or is cancelled"""
+        try:
+            future = self.executor.submit(self._timed, fn, prompt, call_type)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _timed(self, fn: Callable, prompt: str, call_type: str):
+        """Run one backend request and record its duration (also for a hedge that loses)"""
+        started = time.perf_counter()
+        result = fn(prompt)
+        latency_ms = (time.perf_counter() - started) * 1000.0
+        self.metrics.record_backend_latency(call_type, latency_ms)
+        return result, latency_ms
+
+    @staticmethod
+    def _finish(call: ModelCallRecord, timed_result):
+        result, call.backend_latency_ms = timed_result
+        return result
+
+    @staticmethod
+    def _first_result(done):
+        for f in done:
+            if f.exception() is None:
+                return f.result()
+        return _NO_RESULT
+
+    @staticmethod
+    def _first_error(done):
+        for f in done:
+            if f.exception() is not None:
+                return f.exception()
+        return None
+
+
+_NO_RESULT = object()
+
+_executor = None
+_executor_lock = threading.Lock()
+_default_policy = None
+
+
+def _shared_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'GEMINI_MAX_CONCURRENT_CALLS', 16),
+                thread_name_prefix='model-call',
+            )
+        return _executor
+
+
+def default_policy() -> ModelCallPolicy:
+    """Process-wide policy built from settings; its circuit breaker is shared by all services."""
+    global _default_policy
+    if _default_policy is None:
+        _default_policy = ModelCallPolicy(
+            timeout=getattr(settings, 'GEMINI_CALL_TIMEOUT_SECONDS', 8.0),
+            hedge=getattr(settings, 'GEMINI_HEDGE_ENABLED', True),
+            hedge_percentile=getattr(settings, 'GEMINI_HEDGE_PERCENTILE', 95.0),
+            hedge_min_samples=getattr(settings, 'GEMINI_HEDGE_MIN_SAMPLES', 20),
+            breaker=CircuitBreaker(
+                failure_threshold=getattr(settings, 'GEMINI_CIRCUIT_FAILURE_THRESHOLD', 5),
+                reset_timeout=getattr(settings, 'GEMINI_CIRCUIT_RESET_SECONDS', 30.0),
+            ),
+        )
+    return _default_policy
@@ -1,9 +1,11 @@
 # backend/inboxiq_project/gmail_agent/models.py
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 import json
 
+from .history import record_messages
+
 
 class ChatSession(models.Model):
     """Model to store chat sessions for each user"""
@@ -13,8 +15,19 @@ class ChatSession(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    # Denormalized from ChatMessage, kept current by ChatMessage.save() / history.record_messages()
+    message_count = models.PositiveIntegerField(default=0)
+    last_message_preview = models.CharField(max_length=200, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    # Messages moved to ArchivedChatSession; restored when the session is opened
+    is_archived = models.BooleanField(default=False)
+
     class Meta:
         ordering = ['-updated_at']
+        indexes = [
+            # Keyset pagination of a user's session list
+            models.Index(fields=['user', 'is_active', '-updated_at', '-id'], name='chat_session_list_idx'),
+        ]
 
     def __str__(self):
         return f"Chat Session {self.session_id} - {self.user.email}"
@@ -33,14 +46,38 @@ class ChatMessage(models.Model):
     content = models.TextField()
     metadata = models.JSONField(default=dict, blank=True)  # Store additional data like email drafts, contacts, etc.
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Set by ChatTurn on backends that can't return ids from a multi-row INSERT, to read them back
+    insert_key = models.UUIDField(null=True, blank=True, editable=False, db_index=True)
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Keyset pagination of a session's history
+            models.Index(fields=['session', 'timestamp', 'id'], name='chat_msg_session_ts_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            record_messages(ChatSession, self.session_id, [self])
 
     def __str__(self):
         return f"{self.message_type}: {self.content[:50]}..."
 
 
+class ArchivedChatSession(models.Model):
+    """An inactive session's messages, stored as zlib-compressed JSON (see gmail_agent.archive)"""
+    session = models.OneToOneField(ChatSession, on_delete=models.CASCADE, related_name='archive')
+    message_count = models.PositiveIntegerField(default=0)
+    payload = models.BinaryField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive of {self.session_id} ({self.message_count} messages)"
+
+
 class EmailDraft(models.Model):
     """Model to store email drafts before sending"""
     STATUS_CHOICES = [
@@ -72,6 +109,8 @@ class EmailDraft(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     sent_at = models.DateTimeField(null=True, blank=True)
+    # Set by ChatTurn on backends that can't return ids from a multi-row INSERT, to read them back
+    insert_key = models.UUIDField(null=True, blank=True, editable=False, db_index=True)
 
     class Meta:
         ordering = ['-created_at']
@@ -110,4 +149,33 @@ class ContactCache(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.name} - {self.email}"
\ No newline at end of file
+        return f"{self.name} - {self.email}"
+
+class IdempotencyRecord(models.Model):
+    """Outcome of a request sent with an Idempotency-Key, replayed when the request is retried"""
+    STATUS_CHOICES = [
+        ('in_progress', 'In Progress'),
+        ('completed', 'Completed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=100)
+    request_hash = models.CharField(max_length=64)  # sha256 of the request body
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['user', 'key']
+        indexes = [
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.key} - {self.status}"
@@ -0,0 +1,145 @@
+# gmail_agent/response_schema.py
+"""
+Declared response schemas for structured model output, plus a single strict validator.
+
+Schemas use a small JSON-Schema subset (type, properties, required, additionalProperties,
+items, enum, minLength/maxLength, pattern, minimum/maximum, minItems/maxItems) so the same
+declaration can be sent to the model as its response schema and used to validate the reply.
+"""
+import json
+import re
+from typing import Any, Dict
+
+EMAIL_DRAFT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'subject': {'type': 'string', 'minLength': 1, 'maxLength': 255, 'pattern': r'[^\r\n]*\S[^\r\n]*'},
+        'body': {'type': 'string', 'minLength': 1, 'pattern': r'(?s).*\S.*'},
+    },
+    'required': ['subject', 'body'],
+    'additionalProperties': False,
+}
+
+EMAIL_INTENT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'intent': {'type': 'string', 'enum': ['email', 'chat']},
+        'recipient_info': {'type': ['string', 'null']},
+        'email_context': {'type': ['string', 'null']},
+        'confidence': {'type': 'number', 'minimum': 0, 'maximum': 1},
+    },
+    'required': ['intent', 'recipient_info', 'email_context', 'confidence'],
+    'additionalProperties': False,
+}
+
+CONTACT_TERMS_SCHEMA = {
+    'type': 'array',
+    'items': {'type': 'string', 'minLength': 1, 'maxLength': 255},
+    'minItems': 1,
+    'maxItems': 10,
+}
+
+
+class SchemaValidationError(ValueError):
+    """Model output was not valid JSON or did not match the declared schema."""
+
+
+_JSON_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'boolean': bool,
+    'null': type(None),
+}
+
+
+def _type_matches(value: Any, type_name: str) -> bool:
+    if type_name == 'number':
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if type_name == 'integer':
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, _JSON_TYPES[type_name])
+
+
+def validate(value: Any, schema: Dict, path: str = '$') -> Any:
+    """Validate `value` against `schema`; raise SchemaValidationError naming the first failing path."""
+    types = schema.get('type')
+    if types is not None:
+        types = types if isinstance(types, list) else [types]
+        if not any(_type_matches(value, t) for t in types):
+            raise SchemaValidationError(f"{path}: expected {' or '.join(types)}, got {type(value).__name__}")
+
+    if 'enum' in schema and value not in schema['enum']:
+        raise SchemaValidationError(f"{path}: {value!r} is not one of {schema['enum']}")
+
+    if isinstance(value, str):
+        if len(value) < schema.get('minLength', 0):
+            raise SchemaValidationError(f"{path}: shorter than {schema['minLength']} characters")
+        if 'maxLength' in schema and len(value) > schema['maxLength']:
+            raise SchemaValidationError(f"{path}: longer than {schema['maxLength']} characters")
+        if 'pattern' in schema and not re.fullmatch(schema['pattern'], value):
+            raise SchemaValidationError(f"{path}: does not match required format")
+
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        if 'minimum' in schema and value < schema['minimum']:
+            raise SchemaValidationError(f"{path}: below minimum {schema['minimum']}")
+        if 'maximum' in schema and value > schema['maximum']:
+            raise SchemaValidationError(f"{path}: above maximum {schema['maximum']}")
+
+    elif isinstance(value, list):
+        if len(value) < schema.get('minItems', 0):
+            raise SchemaValidationError(f"{path}: fewer than {schema['minItems']} items")
+        if 'maxItems' in schema and len(value) > schema['maxItems']:
+            raise SchemaValidationError(f"{path}: more than {schema['maxItems']} items")
+        if 'items' in schema:
+            for i, item in enumerate(value):
+                validate(item, schema['items'], f"{path}[{i}]")
+
+    elif isinstance(value, dict):
+        properties = schema.get('properties', {})
+        for key in schema.get('required', []):
+            if key not in value:
+                raise SchemaValidationError(f"{path}: missing required field '{key}'")
+        if schema.get('additionalProperties') is False:
+            extra = sorted(set(value) - set(properties))
+            if extra:
+                raise SchemaValidationError(f"{path}: unexpected field(s) {extra}")
+        for key, sub_schema in properties.items():
+            if key in value:
+                validate(value[key], sub_schema, f"{path}.{key}")
+
+    return value
+
+
+def parse_response(text: str, schema: Dict) -> Any:
+    """Strictly parse model text as JSON and validate it. No heuristic extraction."""
+    try:
+        value = json.loads(text)
+    except (TypeError, ValueError) as e:
+        raise SchemaValidationError(f"invalid JSON: {e}")
+    return validate(value, schema)
+
+
+# Keys the model API's response schema understands; the rest are enforced only by validate()
+_GENERATION_KEYS = {'type', 'properties', 'required', 'items', 'enum', 'description'}
+
+
+def to_generation_schema(schema: Dict) -> Dict:
+    """
+    Convert a declared schema into the OpenAPI-style subset accepted as a model response schema:
+    union-with-null types become `nullable`, validation-only keywords are dropped.
+    """
+    out = {}
+    for key, value in schema.items():
+        if key == 'type' and isinstance(value, list):
+            non_null = [t for t in value if t != 'null']
+            out['type'] = non_null[0] if non_null else 'string'
+            if 'null' in value:
+                out['nullable'] = True
+        elif key == 'properties':
+            out['properties'] = {k: to_generation_schema(v) for k, v in value.items()}
+        elif key == 'items':
+            out['items'] = to_generation_schema(value)
+        elif key in _GENERATION_KEYS:
+            out[key] = value
+    return out
@@ -1,3 +1,257 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+
+from gmail_agent.archive import archive_inactive, ensure_rehydrated
+from gmail_agent.chat_turn import ChatTurn
+from gmail_agent.history import message_page
+from gmail_agent.idempotency import idempotent
+from gmail_agent.model_metrics import ModelCallRecord, ModelMetrics
+from gmail_agent.model_policy import (
+    CircuitBreaker, CircuitOpenError, ModelCallOverloaded, ModelCallPolicy, ModelCallTimeout,
+)
+from gmail_agent.models import ArchivedChatSession, ChatMessage, ChatSession, EmailDraft, IdempotencyRecord
+
+User = get_user_model()
+
+
+class ChatTurnTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('turn-user')
+        self.session = ChatSession.objects.create(user=self.user, session_id='turn-session')
+
+    def write_turn(self):
+        turn = ChatTurn(self.session, ChatMessage)
+        user_message = turn.add_message('user', 'Email Sam about Friday')
+        draft = turn.add(EmailDraft(user=self.user, recipient_email='sam@example.com', subject='Friday', body='Hi'))
+        reply = turn.add_message('assistant', 'Here is a draft', lambda: {'draft_id': draft.id})
+        self.assertEqual(turn.flush(), 2)
+        return user_message, draft, reply
+
+    def assert_written(self, user_message, draft, reply):
+        self.assertEqual(ChatMessage.objects.get(pk=user_message.pk).content, 'Email Sam about Friday')
+        self.assertEqual(ChatMessage.objects.get(pk=reply.pk).metadata, {'draft_id': draft.pk})
+        self.assertEqual(EmailDraft.objects.get(pk=draft.pk).subject, 'Friday')
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.message_count, 2)
+
+    def test_flush_writes_the_turn(self):
+        self.assert_written(*self.write_turn())
+
+    def test_backend_without_returned_ids_still_bulk_inserts(self):
+        # As on MySQL: bulk_create leaves the primary keys unset
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+                               new_callable=mock.PropertyMock, return_value=False), \
+                mock.patch.object(ChatMessage, 'save_base') as save_base:
+            rows = self.write_turn()
+        save_base.assert_not_called()
+        self.assertTrue(all(row.insert_key for row in rows))
+        self.assert_written(*rows)
+
+
+class ModelMetricsTests(SimpleTestCase):
+    def test_cache_outcome_is_logged_and_counted(self):
+        metrics = ModelMetrics()
+        with self.assertLogs('inboxiq.model_calls') as logs:
+            with metrics.track('chat'):
+                pass
+            for outcome in ('hit', 'miss', 'hit'):
+                with metrics.track('calendar_template', backend='local') as call:
+                    call.cache = outcome
+
+        self.assertEqual(json.loads(logs.records[0].getMessage())['cache'], 'bypass')
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['chat']['cache'], {'bypass': 1})
+        self.assertEqual(snapshot['calendar_template']['cache'], {'hit': 2, 'miss': 1})
+        self.assertEqual(snapshot['calendar_template']['local_calls'], 3)
+        self.assertEqual(snapshot['calendar_template']['latency_ms']['local']['samples'], 3)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_state_transitions(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # one probe at a time
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+
+class ModelCallPolicyTests(SimpleTestCase):
+    def setUp(self):
+        self.metrics = ModelMetrics()
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.release = threading.Event()
+        self.addCleanup(self.executor.shutdown, wait=False)
+        self.addCleanup(self.release.set)
+
+    def policy(self, **kwargs):
+        options = {'timeout': 1.0, 'hedge_min_samples': 1, 'hedge_min_delay': 0.01,
+                   'executor': self.executor, 'metrics': self.metrics}
+        return ModelCallPolicy(**{**options, **kwargs})
+
+    def slow(self, prompt):
+        self.release.wait(2)
+        return 'late'
+
+    def test_half_open_probe_is_not_hedged(self):
+        self.metrics.record_backend_latency('chat', 10)
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        policy = self.policy(breaker=breaker, timeout=0.2)
+        fn = mock.Mock(side_effect=self.slow)
+
+        call = ModelCallRecord('chat')
+        with self.assertRaises(ModelCallTimeout):
+            policy.call(fn, 'hi', call)
+        self.assertFalse(call.hedged)
+        self.assertEqual(fn.call_count, 1)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)  # reset_timeout=0: reopened and due again
+
+    def test_full_pool_fails_fast(self):
+        policy = self.policy(hedge=False, max_in_flight=1)
+        worker = threading.Thread(target=lambda: policy.call(self.slow, 'hi', ModelCallRecord('chat')))
+        worker.start()
+        time.sleep(0.05)
+
+        started = time.monotonic()
+        with self.assertRaises(ModelCallOverloaded):
+            policy.call(self.slow, 'hi', ModelCallRecord('chat'))
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(policy.breaker.state, CircuitBreaker.CLOSED)
+
+        self.release.set()
+        worker.join()
+        self.assertEqual(policy.call(lambda prompt: 'ok', 'hi', ModelCallRecord('chat')), 'ok')
+
+    def test_deadline_cancels_requests_that_never_started(self):
+        blocker = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(blocker.shutdown, wait=False)
+        policy = self.policy(hedge=False, timeout=0.05, executor=blocker, max_in_flight=2)
+        blocker.submit(self.release.wait, 2)  # occupies the only worker
+        fn = mock.Mock()
+
+        with self.assertRaises(ModelCallTimeout):
+            policy.call(fn, 'hi', ModelCallRecord('chat'))
+        self.release.set()
+        blocker.submit(lambda: None).result(timeout=2)
+        fn.assert_not_called()
+        # The cancelled request gave its slot back
+        self.assertEqual(policy.call(lambda prompt: 'ok', 'hi', ModelCallRecord('chat')), 'ok')
+
+    def test_open_circuit_rejects(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            self.policy(breaker=breaker).call(mock.Mock(), 'hi', ModelCallRecord('chat'))
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('idem-user')
+        self.calls = 0
+        self.status = 200
+
+        @idempotent('send')
+        def send(request):
+            self.calls += 1
+            return JsonResponse({'call': self.calls}, status=self.status)
+        self.send = send
+
+    def post(self, body, key='key-1', view=None):
+        request = RequestFactory().post('/send/', json.dumps(body), content_type='application/json',
+                                        HTTP_IDEMPOTENCY_KEY=key)
+        request.user = self.user
+        return (view or self.send)(request)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.post({'message': 'hi'})
+        retry = self.post({'message': 'hi'})
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(json.loads(retry.content), {'call': 1})
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+
+    def test_key_reused_for_another_request_is_422(self):
+        self.post({'message': 'hi'})
+        response = self.post({'message': 'something else'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(json.loads(response.content)['code'], 'IDEMPOTENCY_KEY_REUSED')
+
+        @idempotent('other_endpoint')
+        def other(request):
+            return JsonResponse({})
+        self.assertEqual(self.post({'message': 'hi'}, view=other).status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_server_error_is_not_stored(self):
+        self.status = 503
+        self.post({'message': 'hi'})
+        self.assertFalse(IdempotencyRecord.objects.exists())
+        self.status = 200
+        self.assertEqual(json.loads(self.post({'message': 'hi'}).content), {'call': 2})
+
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('archive-user')
+        self.session = ChatSession.objects.create(user=user, session_id='archive-session')
+        # Distinct, old timestamps so the page order is fixed and the session is past the cutoff
+        start = timezone.now() - timedelta(days=200)
+        for i in range(5):
+            message = ChatMessage.objects.create(session=self.session, message_type='user', content=f'm{i}')
+            ChatMessage.objects.filter(pk=message.pk).update(timestamp=start + timedelta(minutes=i))
+        ChatSession.objects.filter(pk=self.session.pk).update(updated_at=start)
+
+    def messages(self):
+        return ChatMessage.objects.filter(session=self.session)
+
+    def test_rehydrate_keeps_ids_timestamps_and_cursors(self):
+        before = list(self.messages().order_by('id').values_list('id', 'timestamp'))
+        latest = message_page(self.messages(), {'limit': '2'})
+        older = message_page(self.messages(), {'limit': '2', 'before': latest['cursors']['before']})
+
+        stats = archive_inactive('gmail', days=90)
+        self.assertEqual((stats['sessions'], stats['messages']), (1, 5))
+        self.assertFalse(self.messages().exists())
+        self.assertTrue(ArchivedChatSession.objects.filter(session=self.session).exists())
+
+        session = ChatSession.objects.get(pk=self.session.pk)
+        self.assertTrue(session.is_archived)
+        ensure_rehydrated(session, 'gmail')
+
+        self.assertFalse(ChatSession.objects.get(pk=self.session.pk).is_archived)
+        self.assertFalse(ArchivedChatSession.objects.exists())
+        self.assertEqual(list(self.messages().order_by('id').values_list('id', 'timestamp')), before)
+        self.assertEqual(message_page(self.messages(), {'limit': '2', 'before': latest['cursors']['before']}),
+                         older)
+        self.assertEqual(message_page(self.messages(), {'limit': '2'}), latest)
+
+    def test_session_with_a_pinned_message_is_not_archived(self):
+        EmailDraft.objects.create(user=self.session.user, chat_message=self.messages().first(),
+                                  recipient_email='a@example.com', subject='s', body='b')
+        self.assertEqual(archive_inactive('gmail', days=90)['sessions'], 0)
+        self.assertEqual(self.messages().count(), 5)
@@ -11,4 +11,7 @@ urlpatterns = [
     
     # Email endpoints
     path('email/confirm/', views.confirm_email, name='confirm_email'),
+
+    # Observability
+    path('model/metrics/', views.get_model_metrics, name='get_model_metrics'),
 ]
\ No newline at end of file
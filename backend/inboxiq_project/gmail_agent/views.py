@@ -14,6 +14,12 @@ from .models import ChatSession, ChatMessage, EmailDraft, ContactCache
 from .gemini_service import GeminiService
 from .contacts_service import GoogleContactsService
 from .gmail_service import GmailService
+from .archive import ensure_rehydrated
+from .chat_turn import ChatTurn
+from .history import CursorError, message_page, session_page
+from .idempotency import idempotent
+from .model_metrics import model_metrics
+from .model_policy import default_policy
 
 EMAIL_RE = re.compile(r"[^@]+@[^@]+\.[^@]+")
 
@@ -80,13 +86,14 @@ def start_chat_session(request):
 
 @csrf_exempt
 @require_http_methods(["POST", "OPTIONS"])
+@idempotent('chat_send')
 def send_message(request):
     """Send a message in a chat session"""
     if request.method == 'OPTIONS':
         response = JsonResponse({})
         response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
         response['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie, Idempotency-Key'
         response['Access-Control-Allow-Credentials'] = 'true'
         return response
 
@@ -104,21 +111,21 @@ def send_message(request):
             return JsonResponse({'error': 'Session ID and message are required'}, status=400)
 
         chat_session = get_object_or_404(ChatSession, session_id=session_id, user=request.user)
+        ensure_rehydrated(chat_session, 'gmail')
 
-        user_message = ChatMessage.objects.create(
-            session=chat_session,
-            message_type='user',
-            content=message_content
-        )
+        # Rows for this turn are queued and written together by turn.flush()
+        turn = ChatTurn(chat_session, ChatMessage)
+        turn.add_message('user', message_content)
 
         # Initialize Gemini (mock by default)
         try:
             print(f"[SEND_MESSAGE] Initializing Gemini service...")
-            gemini_service = GeminiService(use_mock=True)
+            gemini_service = GeminiService.from_settings()
             print(f"[SEND_MESSAGE] Gemini service initialized successfully")
         except Exception as e:
             print(f"[SEND_MESSAGE] Error initializing Gemini service: {e}")
             traceback.print_exc()
+            turn.flush()
             return JsonResponse({
                 'message': {
                     'id': None,
@@ -136,6 +143,7 @@ def send_message(request):
         except Exception as e:
             print(f"[SEND_MESSAGE] Error analyzing intent: {e}")
             traceback.print_exc()
+            turn.flush()
             return JsonResponse({
                 'message': {
                     'id': None,
@@ -146,11 +154,12 @@ def send_message(request):
             })
 
         if intent_analysis.get('intent') == 'email' and intent_analysis.get('confidence', 0) > 0.65:
-            response_data = handle_email_intent(request.user, chat_session, intent_analysis, gemini_service)
+            response_data = handle_email_intent(request.user, turn, intent_analysis, gemini_service)
         else:
-            response_data = handle_chat_intent(chat_session, message_content, gemini_service)
+            response_data = handle_chat_intent(turn, message_content, gemini_service)
 
-        chat_session.save()
+        # Whatever a handler didn't write (e.g. the user message when it failed)
+        turn.flush()
 
         response = JsonResponse(response_data)
         _cors_response(response)
@@ -162,19 +171,15 @@ def send_message(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
-def handle_chat_intent(chat_session, message_content, gemini_service):
+def handle_chat_intent(turn, message_content, gemini_service):
     """Handle normal chat conversation"""
     try:
-        recent_messages = ChatMessage.objects.filter(session=chat_session).order_by('-timestamp')[:10]
-        chat_history = [{'message_type': msg.message_type, 'content': msg.content} for msg in reversed(recent_messages)]
+        chat_history = turn.history(10)
 
         response_content = gemini_service.generate_chat_response(message_content, chat_history)
 
-        assistant_message = ChatMessage.objects.create(
-            session=chat_session,
-            message_type='assistant',
-            content=response_content
-        )
+        assistant_message = turn.add_message('assistant', response_content)
+        turn.flush()
 
         return {
             'message': {
@@ -198,7 +203,7 @@ def handle_chat_intent(chat_session, message_content, gemini_service):
         }
 
 
-def handle_email_intent(user, chat_session, intent_analysis, gemini_service):
+def handle_email_intent(user, turn, intent_analysis, gemini_service):
     """Handle email composition intent"""
     try:
         recipient_info = intent_analysis.get('recipient_info')
@@ -225,7 +230,7 @@ def handle_email_intent(user, chat_session, intent_analysis, gemini_service):
                 email_context=email_context,
                 user_name=user.first_name or user.username
             )
-            email_draft = EmailDraft.objects.create(
+            email_draft = turn.add(EmailDraft(
                 user=user,
                 recipient_email=recipient_email,
                 recipient_name=recipient_name,
@@ -234,16 +239,16 @@ def handle_email_intent(user, chat_session, intent_analysis, gemini_service):
                 status='pending_confirmation',
                 contact_search_query=recipient_info,
                 contact_candidates=[]
-            )
+            ))
             response_content = f"I'll send to **{recipient_email}**. Is that correct?\n\n"
             response_content += f"**Email Subject:** {email_draft.subject}\n\n"
             response_content += f"**Email Preview:**\n{email_draft.body[:200]}...\n\nReply 'yes' to send, 'edit' to modify, or 'cancel'."
-            assistant_message = ChatMessage.objects.create(
-                session=chat_session,
-                message_type='assistant',
-                content=response_content,
-                metadata={'type': 'email_confirmation', 'draft_id': email_draft.id, 'contact': {'name': recipient_name, 'email': recipient_email}}
+            assistant_message = turn.add_message(
+                'assistant',
+                response_content,
+                lambda: {'type': 'email_confirmation', 'draft_id': email_draft.id, 'contact': {'name': recipient_name, 'email': recipient_email}}
             )
+            turn.flush()
             return {
                 'message': {
                     'id': assistant_message.id,
@@ -288,11 +293,8 @@ def handle_email_intent(user, chat_session, intent_analysis, gemini_service):
 
         if not contact_matches:
             response_content = f"I couldn't find any contacts matching '{recipient_info}'. Could you provide more specific information or the email address directly?"
-            assistant_message = ChatMessage.objects.create(
-                session=chat_session,
-                message_type='assistant',
-                content=response_content
-            )
+            assistant_message = turn.add_message('assistant', response_content)
+            turn.flush()
             return {
                 'message': {
                     'id': assistant_message.id,
@@ -314,7 +316,7 @@ def handle_email_intent(user, chat_session, intent_analysis, gemini_service):
             user_name=user.first_name or user.username
         )
 
-        email_draft = EmailDraft.objects.create(
+        email_draft = turn.add(EmailDraft(
             user=user,
             recipient_email=recipient_email,
             recipient_name=recipient_name,
@@ -323,7 +325,7 @@ def handle_email_intent(user, chat_session, intent_analysis, gemini_service):
             status='pending_confirmation',
             contact_search_query=recipient_info,
             contact_candidates=contact_matches
-        )
+        ))
 
         response_content = f"I found a contact for '{recipient_info}'. Is this the right person?\n\n"
         response_content += f"**{recipient_name}** ({recipient_email})\n\n"
@@ -331,17 +333,17 @@ def handle_email_intent(user, chat_session, intent_analysis, gemini_service):
         response_content += f"**Email Preview:**\n{email_draft.body[:200]}...\n\n"
         response_content += "Reply with 'yes' to send this email, 'no' to see other contacts, or 'edit' to modify the email content."
 
-        assistant_message = ChatMessage.objects.create(
-            session=chat_session,
-            message_type='assistant',
-            content=response_content,
-            metadata={
+        assistant_message = turn.add_message(
+            'assistant',
+            response_content,
+            lambda: {
                 'type': 'email_confirmation',
                 'draft_id': email_draft.id,
                 'contact_matches': contact_matches,
                 'email_content': email_content
             }
         )
+        turn.flush()
 
         return {
             'message': {
@@ -381,6 +383,7 @@ from .gmail_service import GmailService, GmailServiceError
 
 @csrf_exempt
 @require_http_methods(["POST", "OPTIONS"])
+@idempotent('email_confirm')
 def confirm_email(request):
     """
     Confirm and send an email draft with comprehensive error handling.
@@ -395,7 +398,7 @@ def confirm_email(request):
         response = JsonResponse({})
         response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
         response['Access-Control-Allow-Methods'] = 'POST, OPTIONS'
-        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, Cookie, Idempotency-Key'
         response['Access-Control-Allow-Credentials'] = 'true'
         return response
 
@@ -741,7 +744,11 @@ def _handle_cancel_action(email_draft, draft_id):
 @require_http_methods(["GET", "OPTIONS"])
 @login_required
 def get_chat_history(request, session_id):
-    """Get chat history for a session"""
+    """
+    Get one page of chat history for a session
+
+    Query params: limit, before / after (cursors from a previous page), include_metadata=true
+    """
     if request.method == 'OPTIONS':
         response = JsonResponse({})
         response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
@@ -752,25 +759,17 @@ def get_chat_history(request, session_id):
 
     try:
         chat_session = get_object_or_404(ChatSession, session_id=session_id, user=request.user)
+        ensure_rehydrated(chat_session, 'gmail')
 
-        messages = ChatMessage.objects.filter(session=chat_session).order_by('timestamp')
-
-        message_list = [
-            {
-                'id': msg.id,
-                'type': msg.message_type,
-                'content': msg.content,
-                'timestamp': msg.timestamp.isoformat(),
-                'metadata': msg.metadata
-            }
-            for msg in messages
-        ]
+        page = message_page(ChatMessage.objects.filter(session=chat_session), request.GET)
 
         return JsonResponse({
             'session_id': session_id,
-            'messages': message_list
+            **page
         })
 
+    except CursorError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -779,7 +778,11 @@ def get_chat_history(request, session_id):
 @require_http_methods(["GET", "OPTIONS"])
 @login_required
 def get_user_sessions(request):
-    """Get all chat sessions for the current user"""
+    """
+    Get one page of the current user's chat sessions, most recently active first
+
+    Query params: limit, before (cursor from the previous page)
+    """
     if request.method == 'OPTIONS':
         response = JsonResponse({})
         response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
@@ -790,18 +793,34 @@ def get_user_sessions(request):
 
     try:
         sessions = ChatSession.objects.filter(user=request.user, is_active=True)
+        return JsonResponse(session_page(sessions, request.GET))
 
-        session_list = [
-            {
-                'session_id': session.session_id,
-                'created_at': session.created_at.isoformat(),
-                'updated_at': session.updated_at.isoformat(),
-                'message_count': session.messages.count()
-            }
-            for session in sessions
-        ]
-
-        return JsonResponse({'sessions': session_list})
+    except CursorError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "OPTIONS"])
+def get_model_metrics(request):
+    """Aggregated model-call metrics (latency, prompt sizes, parse failures, fallbacks) for staff users"""
+    if request.method == 'OPTIONS':
+        response = JsonResponse({})
+        response['Access-Control-Allow-Origin'] = request.META.get('HTTP_ORIGIN', '*')
+        response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
+        response['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        response['Access-Control-Allow-Credentials'] = 'true'
+        return response
+
+    if not request.user.is_authenticated:
+        return _cors_response(JsonResponse({'error': 'Not authenticated'}, status=401))
+    if not request.user.is_staff:
+        return _cors_response(JsonResponse({'error': 'Staff access required'}, status=403))
+
+    return _cors_response(JsonResponse({
+        'calls': model_metrics.snapshot(),
+        'tiers': model_metrics.tier_snapshot(),
+        'circuit': default_policy().breaker.state,
+    }))